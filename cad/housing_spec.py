@@ -0,0 +1,168 @@
+"""Specification of the motor housing, and where its motors and holes go.
+
+No geometry is built here, so that tools checking the positions (e.g., against the
+PCB, in `host_tools`) don't have to load the CAD libraries.
+"""
+
+import copy
+import json
+from dataclasses import dataclass
+from itertools import product
+
+from loguru import logger
+
+
+def evenly_space_with_center(*, count: int, spacing: float) -> list[float]:
+    """Get `count` positions, `spacing` apart, centered on 0 (like `build123d_ease`)."""
+    return [(i - (count - 1) / 2) * spacing for i in range(count)]
+
+
+@dataclass(kw_only=True)
+class HousingSpec:
+    """Specification for braille cell in general."""
+
+    motor_pitch_x: float = 3
+    motor_pitch_y: float = 2.64  # Solved below to hold motor tightly.
+    dot_pitch_x: float = 2.5
+    dot_pitch_y: float = 2.5
+    cell_pitch_x: float = 6
+    cell_pitch_y: float = 10
+
+    dot_count_x: int = 2
+    dot_count_y: int = 3
+
+    motor_body_od: float = 4.5
+    motor_body_length: float = 8.0 + 1.0  # Extra 1mm for fit (esp for bottom).
+
+    # Main gap for top motor. 8mm seems workable (with 6mm bolts).
+    # 10mm good for paper/wires as couplers.
+    # 7mm probably good for 5mm springs with 6mm bolts.
+    gap_above_top_motor: float = 7.0
+
+    cell_count_x: int = 4
+    cell_count_y: int = 1
+
+    total_y: float = 15
+
+    # Distance from outer dots to mounting holes. PCB property.
+    x_dist_dots_to_mounting_holes: float = 5.0
+
+    mounting_hole_spacing_y: float = 3
+    mounting_hole_id: float = 1.8  # Thread-forming screws from bottom.
+    mounting_hole_peg_od: float = 2
+    mounting_hole_peg_length: float = 1.5
+    meat_above_peg: float = 3
+
+    border_x: float = 5
+
+    top_plate_thickness: float = 2
+    top_plate_tap_hole_diameter: float = 1.25  # For M1.6, drill 1.25mm hole.
+
+    top_plate_dot_hole_thread_diameter: float = 1.6
+    top_plate_dot_hole_thread_pitch: float = 0.35
+
+    remove_thin_walls: bool = True
+
+    slice_thickness: float = 7  # Just under the motor_length.
+
+    @property
+    def dist_between_motor_walls(self) -> float:
+        """Distance between motor walls in a layer."""
+        return self.motor_pitch_x * 2 - self.motor_body_od
+
+    @property
+    def mounting_hole_spacing_x(self) -> float:
+        """Spacing between the mounting holes, in X axis."""
+        return (
+            self.x_dist_dots_to_mounting_holes * 2
+            + self.cell_pitch_x * (self.cell_count_x - 1)
+            + self.dot_pitch_x
+        )
+
+    @property
+    def total_x(self) -> float:
+        """Total width of the braille housing."""
+        return self.mounting_hole_spacing_x + self.mounting_hole_id + self.border_x * 2
+
+    @property
+    def total_z(self) -> float:
+        """Total thickness of the housing."""
+        return self.motor_body_length + self.gap_above_top_motor
+
+    def __post_init__(self) -> None:
+        """Post initialization checks."""
+        hypot_len = (self.motor_pitch_x**2 + self.motor_pitch_y**2) ** 0.5
+
+        data = {
+            "hypot_len": round(hypot_len, 2),  # Forced to match `motor_od`.
+            "total_x": self.total_x,
+            "total_y": self.total_y,
+            "total_z": self.total_z,
+            "dist_between_motor_walls": self.dist_between_motor_walls,
+            "threads_in_top_plate": round(
+                self.top_plate_thickness / self.top_plate_dot_hole_thread_pitch, 1
+            ),
+        }
+
+        logger.info(json.dumps(data, indent=2))
+
+    def deep_copy(self) -> "HousingSpec":
+        """Copy the current spec."""
+        return copy.deepcopy(self)
+
+
+def motor_coordinates(
+    spec: HousingSpec, *, other_layer: bool = False
+) -> list[tuple[float, float]]:
+    """Get the (X, Y) of the motor centers, in a checkerboard over each cell.
+
+    Args:
+        spec: The specification for the housing.
+        other_layer: Get the other half of the checkerboard instead (the motors of the
+            other PCB layer, whose shafts pass through this one).
+
+    """
+    motor_coords: list[tuple[float, float]] = []
+    for dot_num, (cell_x, cell_y, offset_x, offset_y) in enumerate(
+        product(
+            evenly_space_with_center(
+                count=spec.cell_count_x,
+                spacing=spec.cell_pitch_x,
+            ),
+            evenly_space_with_center(
+                count=spec.cell_count_y,
+                spacing=spec.cell_pitch_y,
+            ),
+            evenly_space_with_center(count=2, spacing=1),
+            evenly_space_with_center(count=3, spacing=1),
+        ),
+    ):
+        is_motor_spot: bool = (dot_num % 2) == 0
+
+        # Skip places where there's not a motor (checkerboard).
+        if is_motor_spot == other_layer:
+            continue
+
+        motor_coords.append(
+            (
+                cell_x + offset_x * spec.motor_pitch_x,
+                cell_y + offset_y * spec.motor_pitch_y,
+            )
+        )
+    return motor_coords
+
+
+def mounting_hole_coordinates(spec: HousingSpec) -> list[tuple[float, float]]:
+    """Get the (X, Y) of the mounting holes (2 columns of 3)."""
+    return list(
+        product(
+            evenly_space_with_center(
+                count=2,
+                spacing=spec.mounting_hole_spacing_x,
+            ),
+            evenly_space_with_center(
+                count=3,
+                spacing=spec.mounting_hole_spacing_y,
+            ),
+        )
+    )
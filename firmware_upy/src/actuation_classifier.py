@@ -0,0 +1,256 @@
+"""Incremental classifier for the current signature of a single dot actuation.
+
+A healthy actuation looks like: inrush spike (motor stalled while spinning up), drop
+to a running plateau, then a rise back towards stall current (the "knee") when the
+bolt reaches its end stop. Features are tracked per sample, in integer raw INA219
+units (no floats, no allocation), with constant work per sample:
+* Rise time: when the current first exceeds the open-circuit threshold.
+* Peak: maximum current.
+* Plateau: running average of the current after the inrush.
+* Stall knee: when the current rises well above the plateau and stays there.
+
+Pure Python, so the same code can be used on the host to replay recorded traces.
+"""
+
+import json
+
+# Labels.
+LABEL_PENDING = 0  # Not decided yet.
+LABEL_OK = 1  # Moved, then reached the end stop (knee).
+LABEL_OPEN = 2  # No current: open winding, or broken connection/driver.
+LABEL_SHORT = 3  # Current above the short threshold.
+LABEL_STUCK = 4  # Stalled from the start, but the dot was expected to move.
+LABEL_AT_END_STOP = 5  # Stalled from the start, as the dot was already there.
+LABEL_NO_TRAVEL = 6  # Stalled from the start, previous dot position unknown.
+LABEL_INCOMPLETE = 7  # Running when the drive ended (no knee). Drive too short.
+LABEL_NAMES = (
+    "pending",
+    "ok",
+    "open",
+    "short",
+    "stuck",
+    "at_end_stop",
+    "no_travel",
+    "incomplete",
+)
+FAULT_LABELS = (LABEL_OPEN, LABEL_SHORT, LABEL_STUCK)
+
+# Tunable thresholds: `ActuationClassifier` arguments, `set_params()` and `load()`.
+PARAM_NAMES = (
+    "open_mA",
+    "short_mA",
+    "short_min_us",
+    "run_ratio_x16",
+    "knee_ratio_x16",
+    "knee_min_us",
+    "stuck_min_us",
+)
+
+# Values for `expect_travel` in `start()`.
+TRAVEL_UNKNOWN = -1
+TRAVEL_NO = 0
+TRAVEL_YES = 1
+
+# Phases.
+_PHASE_IDLE = 0  # Waiting for current.
+_PHASE_INRUSH = 1  # Spinning up (or stalled).
+_PHASE_RUNNING = 2  # On the plateau, watching for the knee.
+_PHASE_DONE = 3
+
+
+class ActuationClassifier:
+    """Labels one actuation at a time, from raw shunt readings as they arrive.
+
+    Call `start()` before the drive, `add_sample()` for each reading, and `finish()`
+    at the end of the drive. `label` is set as soon as it's decided (it can be used to
+    stop a drive early), otherwise by `finish()`.
+
+    Thresholds are in mA and us. Ratios are fixed-point, in 1/16ths.
+    """
+
+    def __init__(
+        self,
+        shunt_milliohms: int = 300,
+        shunt_lsb_uv: int = 10,
+        *,
+        open_mA: int = 20,
+        short_mA: int = 500,
+        short_min_us: int = 500,
+        run_ratio_x16: int = 12,
+        knee_ratio_x16: int = 24,
+        knee_min_us: int = 1_000,
+        stuck_min_us: int = 30_000,
+    ) -> None:
+        self.shunt_milliohms = shunt_milliohms
+        self.shunt_lsb_uv = shunt_lsb_uv
+        self.set_params(
+            open_mA=open_mA,
+            short_mA=short_mA,
+            short_min_us=short_min_us,
+            run_ratio_x16=run_ratio_x16,
+            knee_ratio_x16=knee_ratio_x16,
+            knee_min_us=knee_min_us,
+            stuck_min_us=stuck_min_us,
+        )
+
+        self.start(TRAVEL_UNKNOWN)
+        self.active = False
+
+    def set_params(
+        self,
+        *,
+        open_mA: int,
+        short_mA: int,
+        short_min_us: int,
+        run_ratio_x16: int,
+        knee_ratio_x16: int,
+        knee_min_us: int,
+        stuck_min_us: int,
+    ) -> None:
+        """Set the thresholds (see `PARAM_NAMES`)."""
+        self.open_mA = open_mA
+        self.short_mA = short_mA
+        self.open_raw = self.mA_to_raw(open_mA)
+        self.short_raw = self.mA_to_raw(short_mA)
+        self.short_min_us = short_min_us
+        self.run_ratio_x16 = run_ratio_x16
+        self.knee_ratio_x16 = knee_ratio_x16
+        self.knee_min_us = knee_min_us
+        self.stuck_min_us = stuck_min_us
+
+    def params(self) -> dict:
+        """The thresholds, by name (allocates)."""
+        return {name: getattr(self, name) for name in PARAM_NAMES}
+
+    def load(self, path: str) -> bool:
+        """Load thresholds from a JSON file made by `host_tools/detector_bench.py`.
+
+        Returns False if it's missing or invalid. Missing thresholds keep their value.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            params = self.params()
+            for name, value in data["params"].items():
+                if name in params:
+                    params[name] = int(value)
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        self.set_params(**params)
+        return True
+
+    def mA_to_raw(self, mA: int) -> int:
+        return mA * self.shunt_milliohms // self.shunt_lsb_uv
+
+    def raw_to_mA(self, raw: int) -> float:
+        return raw * self.shunt_lsb_uv / self.shunt_milliohms
+
+    def start(self, expect_travel: int = TRAVEL_UNKNOWN) -> None:
+        """Reset for a new actuation."""
+        self.active = True
+        self.expect_travel = expect_travel
+        self.label = LABEL_PENDING
+        self._phase = _PHASE_IDLE
+
+        self.samples = 0
+        self.peak_raw = 0
+        self.rise_us = -1
+        self.plateau_x8 = 0  # Fixed-point, 3 fractional bits.
+        self.knee_us = -1
+        self.plateau_seen = False  # Whether the motor got past the inrush (spinning).
+        self._knee_start_us = -1
+        self._short_start_us = -1
+
+    @property
+    def plateau_raw(self) -> int:
+        return self.plateau_x8 >> 3
+
+    def _stalled_label(self) -> int:
+        if self.expect_travel == TRAVEL_YES:
+            return LABEL_STUCK
+        if self.expect_travel == TRAVEL_NO:
+            return LABEL_AT_END_STOP
+        return LABEL_NO_TRAVEL
+
+    def add_sample(self, raw: int, elapsed_us: int) -> int:
+        """Add a reading taken `elapsed_us` after the drive started. Returns `label`."""
+        self.samples += 1
+        if raw > self.peak_raw:
+            self.peak_raw = raw
+
+        if self._phase == _PHASE_DONE:
+            return self.label
+
+        # Short: far above any stall current, for long enough to not be a glitch.
+        if raw >= self.short_raw:
+            if self._short_start_us < 0:
+                self._short_start_us = elapsed_us
+            elif elapsed_us - self._short_start_us >= self.short_min_us:
+                self.label = LABEL_SHORT
+                self._phase = _PHASE_DONE
+                return self.label
+        else:
+            self._short_start_us = -1
+
+        if self._phase == _PHASE_IDLE:
+            if raw >= self.open_raw:
+                self._phase = _PHASE_INRUSH
+                self.rise_us = elapsed_us
+
+        elif self._phase == _PHASE_INRUSH:
+            if raw * 16 <= self.peak_raw * self.run_ratio_x16:
+                # Dropped well below the inrush peak: the motor is spinning.
+                self._phase = _PHASE_RUNNING
+                self.plateau_seen = True
+                self.plateau_x8 = raw << 3
+            elif elapsed_us - self.rise_us >= self.stuck_min_us:
+                self.label = self._stalled_label()
+                self._phase = _PHASE_DONE
+
+        else:  # _PHASE_RUNNING
+            knee_raw = (self.plateau_x8 >> 3) * self.knee_ratio_x16 >> 4
+            if raw >= knee_raw and raw >= self.open_raw:
+                if self._knee_start_us < 0:
+                    self._knee_start_us = elapsed_us
+                elif elapsed_us - self._knee_start_us >= self.knee_min_us:
+                    self.label = LABEL_OK
+                    self.knee_us = self._knee_start_us
+                    self._phase = _PHASE_DONE
+            else:
+                self._knee_start_us = -1
+                self.plateau_x8 += raw - (self.plateau_x8 >> 3)
+
+        return self.label
+
+    def finish(self, elapsed_us: int) -> int:
+        """End the actuation after `elapsed_us` of driving. Returns the final label."""
+        self.active = False
+        if self.label != LABEL_PENDING:
+            return self.label
+
+        if self._phase == _PHASE_IDLE:
+            self.label = LABEL_OPEN
+        elif (
+            self._phase == _PHASE_INRUSH
+            and elapsed_us - self.rise_us >= self.stuck_min_us
+        ):
+            self.label = self._stalled_label()
+        elif self._phase == _PHASE_RUNNING and self._knee_start_us >= 0:
+            # Knee started right at the end of the drive.
+            self.label = LABEL_OK
+            self.knee_us = self._knee_start_us
+        else:
+            self.label = LABEL_INCOMPLETE
+        self._phase = _PHASE_DONE
+        return self.label
+
+    def summary(self) -> dict:
+        """Features and label of the last actuation, in mA and us (allocates)."""
+        return {
+            "label": LABEL_NAMES[self.label],
+            "peak_mA": round(self.raw_to_mA(self.peak_raw), 1),
+            "plateau_mA": round(self.raw_to_mA(self.plateau_raw), 1),
+            "rise_us": self.rise_us,
+            "knee_us": self.knee_us,
+            "samples": self.samples,
+        }
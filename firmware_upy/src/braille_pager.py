@@ -0,0 +1,229 @@
+"""Lay out text into braille pages, choosing page breaks that minimize dot flips.
+
+Cells are 6-bit ints: bit (n - 1) is braille dot n. A frame is one page of cells,
+packed into an int: cell `i` occupies bits `6 * i` to `6 * i + 5`. Frame bit `b` is
+the firmware's `dot_num` `b` (cell = dot_num // 6, braille dot = dot_num % 6 + 1).
+
+Pages hold whole words (separated by one blank cell), and words longer than a page are
+split across pages. Where the words sit within the page (alignment) is free. Page
+breaks and alignments are chosen by dynamic programming over a lookahead window of
+words, minimizing the dots that flip between consecutive pages, plus a fixed cost per
+page (so that it doesn't just show one short word per page).
+
+Pure Python, so it also runs on the host for evaluating layouts of whole books.
+"""
+
+# Fixed cost of showing an extra page, in dot flips.
+PAGE_COST_DOTS = 8
+
+# Number of words to plan ahead when choosing the next page.
+LOOKAHEAD_WORDS = 16
+
+
+def _cell(*dots: int) -> int:
+    value = 0
+    for dot in dots:
+        value |= 1 << (dot - 1)
+    return value
+
+
+# Grade 1 (uncontracted) English braille.
+LETTER_CELLS = {
+    "a": _cell(1),
+    "b": _cell(1, 2),
+    "c": _cell(1, 4),
+    "d": _cell(1, 4, 5),
+    "e": _cell(1, 5),
+    "f": _cell(1, 2, 4),
+    "g": _cell(1, 2, 4, 5),
+    "h": _cell(1, 2, 5),
+    "i": _cell(2, 4),
+    "j": _cell(2, 4, 5),
+    "k": _cell(1, 3),
+    "l": _cell(1, 2, 3),
+    "m": _cell(1, 3, 4),
+    "n": _cell(1, 3, 4, 5),
+    "o": _cell(1, 3, 5),
+    "p": _cell(1, 2, 3, 4),
+    "q": _cell(1, 2, 3, 4, 5),
+    "r": _cell(1, 2, 3, 5),
+    "s": _cell(2, 3, 4),
+    "t": _cell(2, 3, 4, 5),
+    "u": _cell(1, 3, 6),
+    "v": _cell(1, 2, 3, 6),
+    "w": _cell(2, 4, 5, 6),
+    "x": _cell(1, 3, 4, 6),
+    "y": _cell(1, 3, 4, 5, 6),
+    "z": _cell(1, 3, 5, 6),
+}
+PUNCTUATION_CELLS = {
+    ",": _cell(2),
+    ";": _cell(2, 3),
+    ":": _cell(2, 5),
+    ".": _cell(2, 5, 6),
+    "!": _cell(2, 3, 5),
+    "?": _cell(2, 3, 6),
+    "'": _cell(3),
+    "-": _cell(3, 6),
+    "(": _cell(2, 3, 5, 6),
+    ")": _cell(2, 3, 5, 6),
+}
+DIGIT_LETTERS = "jabcdefghi"  # Digits 0-9 are written as letters a-j.
+CAPITAL_SIGN = _cell(6)
+NUMBER_SIGN = _cell(3, 4, 5, 6)
+LETTER_SIGN = _cell(5, 6)  # Marks a-j as letters right after a number.
+UNKNOWN_CELL = _cell(1, 2, 3, 4, 5, 6)
+
+
+def word_to_cells(word: str) -> list[int]:
+    """Translate one word (no whitespace) to grade 1 braille cells."""
+    cells: list[int] = []
+    in_number = False
+    for char in word:
+        if "0" <= char <= "9":
+            if not in_number:
+                cells.append(NUMBER_SIGN)
+                in_number = True
+            cells.append(LETTER_CELLS[DIGIT_LETTERS[ord(char) - ord("0")]])
+            continue
+
+        lower = char.lower()
+        if lower in LETTER_CELLS:
+            if in_number and lower in DIGIT_LETTERS:
+                cells.append(LETTER_SIGN)
+            in_number = False
+            if char != lower:
+                cells.append(CAPITAL_SIGN)
+            cells.append(LETTER_CELLS[lower])
+        else:
+            if char not in (".", ","):  # Decimal points/separators keep the number.
+                in_number = False
+            cells.append(PUNCTUATION_CELLS.get(char, UNKNOWN_CELL))
+    return cells
+
+
+def text_to_words(text: str, cell_count: int) -> list[list[int]]:
+    """Translate text to a list of words (cell lists), each at most `cell_count`."""
+    words: list[list[int]] = []
+    for word in text.split():
+        cells = word_to_cells(word)
+        for start in range(0, len(cells), cell_count):
+            words.append(cells[start : start + cell_count])
+    return words
+
+
+def popcount(value: int) -> int:
+    count = 0
+    while value:
+        value &= value - 1
+        count += 1
+    return count
+
+
+class Pager:
+    """Lays out a document into frames one page ahead of the reader.
+
+    `prefetch()` plans the next page while the current one is being read, so that
+    turning the page only needs to actuate an already computed frame.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        cell_count: int = 4,
+        *,
+        page_cost: int = PAGE_COST_DOTS,
+        lookahead_words: int = LOOKAHEAD_WORDS,
+    ) -> None:
+        self.cell_count = cell_count
+        self.page_cost = page_cost
+        self.lookahead_words = lookahead_words
+        self.words = text_to_words(text, cell_count)
+
+        self.frames: list[int] = []  # Pages laid out so far.
+        self.next_word = 0  # First word not yet placed on a page.
+
+    def _page_candidates(self, start: int, stop: int) -> list[tuple[int, int]]:
+        """All (end_word, frame) pages that start at word `start`, within `stop`."""
+        candidates: list[tuple[int, int]] = []
+        length = -1  # No separator before the first word.
+        end = start
+        while end < stop:
+            length += 1 + len(self.words[end])
+            if length > self.cell_count:
+                break
+            end += 1
+
+            # Pack the words, then try every alignment of them within the page.
+            packed = 0
+            position = 0
+            for word in self.words[start:end]:
+                for cell in word:
+                    packed |= cell << (6 * position)
+                    position += 1
+                position += 1  # Blank separator cell.
+            for offset in range(self.cell_count - length + 1):
+                candidates.append((end, packed << (6 * offset)))
+        return candidates
+
+    def _plan_next_page(self, prev_frame: int) -> tuple[int, int]:
+        """Choose the next page, with DP over the lookahead window of words."""
+        start = self.next_word
+        stop = min(start + self.lookahead_words, len(self.words))
+
+        # best[(end_word, frame)] = (cost, first page of the path to it).
+        best: dict[tuple[int, int], tuple[int, tuple[int, int]]] = {}
+        frontier: dict[int, list[tuple[int, int]]] = {start: [(prev_frame, 0)]}
+        first_pages: dict[tuple[int, int], tuple[int, int]] = {}
+
+        for word_idx in range(start, stop):
+            for frame, cost in frontier.pop(word_idx, ()):
+                for end, next_frame in self._page_candidates(word_idx, stop):
+                    new_cost = cost + popcount(frame ^ next_frame) + self.page_cost
+                    key = (end, next_frame)
+                    if key in best and best[key][0] <= new_cost:
+                        continue
+                    if word_idx == start:
+                        first_page = key
+                    else:
+                        first_page = first_pages[(word_idx, frame)]
+                    best[key] = (new_cost, first_page)
+                    first_pages[key] = first_page
+                    frontier.setdefault(end, []).append((next_frame, new_cost))
+
+            # Drop the dominated entries, so each (end, frame) is expanded once.
+            for end, entries in frontier.items():
+                frontier[end] = [
+                    (frame, cost)
+                    for frame, cost in entries
+                    if best[(end, frame)][0] == cost
+                ]
+
+        _cost, first_page = min(
+            (cost, first_page)
+            for (end, _frame), (cost, first_page) in best.items()
+            if end == stop
+        )
+        return first_page
+
+    def prefetch(self, page_index: int) -> bool:
+        """Make sure frames up to `page_index` are laid out. False if past the end."""
+        while len(self.frames) <= page_index:
+            if self.next_word >= len(self.words):
+                return False
+            prev_frame = self.frames[-1] if self.frames else 0
+            end, frame = self._plan_next_page(prev_frame)
+            self.frames.append(frame)
+            self.next_word = end
+        return True
+
+    def layout_all(self) -> tuple[list[int], int]:
+        """Lay out the whole document. Returns (frames, total dot flips)."""
+        while self.prefetch(len(self.frames)):
+            pass
+        flips = 0
+        prev_frame = 0
+        for frame in self.frames:
+            flips += popcount(prev_frame ^ frame)
+            prev_frame = frame
+        return self.frames, flips
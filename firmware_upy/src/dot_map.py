@@ -0,0 +1,43 @@
+"""Shift register output of each dot and direction, and back.
+
+Generated by `host_tools/dot_map_generator.py` from the schematic (Type 5 Rev 3):
+Braille-PCB-Type-5-Vertical-Motors.kicad_sch
+Do not edit: regenerate it after changing the schematic or the number of boards.
+"""
+
+BOARD_COUNT = 2
+DOTS_PER_BOARD = 12
+OUTPUTS_PER_BOARD = 24
+DOT_COUNT = 24
+OUTPUT_COUNT = 48
+NO_SLOT = 255
+
+# fmt: off
+# Output that drives each slot: `SLOT_OUTPUTS[dot * 2 + direction]` (0: up, 1: down).
+SLOT_OUTPUTS = bytes((
+    0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,
+    16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31,
+    32, 33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47,
+))
+
+# Slot driven by each output (`NO_SLOT` if none).
+OUTPUT_SLOTS = bytes((
+    0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15,
+    16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31,
+    32, 33, 34, 35, 36, 37, 38, 39, 40, 41, 42, 43, 44, 45, 46, 47,
+))
+# fmt: on
+
+# Wiring of each board:
+#   Dot 0: J201, up: 0 (U601 QA, U201 IN_A), down: 1 (U601 QB, U201 IN_B).
+#   Dot 1: J202, up: 2 (U601 QC, U202 IN_A), down: 3 (U601 QD, U202 IN_B).
+#   Dot 2: J203, up: 4 (U601 QE, U203 IN_A), down: 5 (U601 QF, U203 IN_B).
+#   Dot 3: J301, up: 6 (U601 QG, U301 IN_A), down: 7 (U601 QH, U301 IN_B).
+#   Dot 4: J302, up: 8 (U602 QA, U302 IN_A), down: 9 (U602 QB, U302 IN_B).
+#   Dot 5: J303, up: 10 (U602 QC, U303 IN_A), down: 11 (U602 QD, U303 IN_B).
+#   Dot 6: J401, up: 12 (U602 QE, U401 IN_A), down: 13 (U602 QF, U401 IN_B).
+#   Dot 7: J402, up: 14 (U602 QG, U402 IN_A), down: 15 (U602 QH, U402 IN_B).
+#   Dot 8: J403, up: 16 (U603 QA, U403 IN_A), down: 17 (U603 QB, U403 IN_B).
+#   Dot 9: J501, up: 18 (U603 QC, U501 IN_A), down: 19 (U603 QD, U501 IN_B).
+#   Dot 10: J502, up: 20 (U603 QE, U502 IN_A), down: 21 (U603 QF, U502 IN_B).
+#   Dot 11: J503, up: 22 (U603 QG, U503 IN_A), down: 23 (U603 QH, U503 IN_B).
@@ -0,0 +1,126 @@
+"""Adaptive per-dot, per-direction drive times, learned from actuation history.
+
+Each dot/direction pair ("slot", the same index as its shift register output) keeps a
+short rolling history of completion times: the time until the stall knee, as measured
+by the actuation classifier. The commanded drive time converges towards the worst
+recent completion time plus a safety margin. It jumps up immediately when more time
+is needed, and steps down gradually. Slots whose average completion time drifts away
+from their baseline (the average of the first full history) are flagged.
+
+All state lives in preallocated arrays, and can be saved to/loaded from flash.
+"""
+
+from array import array
+
+HISTORY_LEN = 8
+
+DEFAULT_DRIVE_MS = 200
+MIN_DRIVE_MS = 5
+MAX_DRIVE_MS = 1_000
+MARGIN_PCT = 20
+MARGIN_MS = 5
+INCOMPLETE_STEP_PCT = 25  # Increase after a drive ended before the knee.
+DRIFT_PCT = 25
+
+_FILE_MAGIC = b"DTN1"
+
+
+class DriveTuner:
+    """Rolling completion-time history and commanded drive time per slot."""
+
+    def __init__(self, slot_count: int) -> None:
+        self.slot_count = slot_count
+        self.history_ms = array("H", [0] * (slot_count * HISTORY_LEN))
+        self.history_count = array("H", [0] * slot_count)
+        self.history_next = array("H", [0] * slot_count)
+        self.commanded_ms = array("H", [DEFAULT_DRIVE_MS] * slot_count)
+        self.baseline_ms = array("H", [0] * slot_count)  # 0 until history is full.
+        self.drifting = bytearray(slot_count)
+
+    def drive_ms(self, slot: int) -> int:
+        """The drive time to command for `slot`."""
+        return self.commanded_ms[slot]
+
+    def _history_stats(self, slot: int) -> tuple[int, int]:
+        """(max, mean) of the recorded completion times of `slot`."""
+        count = min(self.history_count[slot], HISTORY_LEN)
+        start = slot * HISTORY_LEN
+        worst = 0
+        total = 0
+        for i in range(start, start + count):
+            value = self.history_ms[i]
+            total += value
+            if value > worst:
+                worst = value
+        return worst, total // count
+
+    def record_completion(self, slot: int, completion_ms: int) -> None:
+        """Add a measured completion time (time to the stall knee) for `slot`."""
+        completion_ms = min(completion_ms, MAX_DRIVE_MS)
+        self.history_ms[slot * HISTORY_LEN + self.history_next[slot]] = completion_ms
+        self.history_next[slot] = (self.history_next[slot] + 1) % HISTORY_LEN
+        if self.history_count[slot] < HISTORY_LEN:
+            self.history_count[slot] += 1
+
+        worst, mean = self._history_stats(slot)
+        target = worst * (100 + MARGIN_PCT) // 100 + MARGIN_MS
+        target = max(MIN_DRIVE_MS, min(MAX_DRIVE_MS, target))
+        commanded = self.commanded_ms[slot]
+        if target >= commanded:
+            commanded = target
+        else:
+            commanded -= (commanded - target + 1) // 2
+        self.commanded_ms[slot] = commanded
+
+        if self.history_count[slot] >= HISTORY_LEN:
+            if self.baseline_ms[slot] == 0:
+                self.baseline_ms[slot] = max(mean, 1)
+            baseline = self.baseline_ms[slot]
+            self.drifting[slot] = abs(mean - baseline) * 100 > baseline * DRIFT_PCT
+
+    def record_incomplete(self, slot: int) -> None:
+        """The drive ended before the knee: the commanded time was too short."""
+        commanded = self.commanded_ms[slot]
+        self.commanded_ms[slot] = min(
+            MAX_DRIVE_MS, commanded + max(commanded * INCOMPLETE_STEP_PCT // 100, 1)
+        )
+
+    def reset_baseline(self, slot: int) -> None:
+        """Accept the current behaviour of `slot` as its new normal."""
+        self.baseline_ms[slot] = 0
+        self.drifting[slot] = 0
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(_FILE_MAGIC)
+            f.write(self.slot_count.to_bytes(2, "little"))
+            for arr in (
+                self.history_ms,
+                self.history_count,
+                self.history_next,
+                self.commanded_ms,
+                self.baseline_ms,
+                self.drifting,
+            ):
+                f.write(arr)
+
+    def load(self, path: str) -> bool:
+        """Load saved state. Returns False if it's missing or for a different size."""
+        try:
+            with open(path, "rb") as f:
+                if f.read(4) != _FILE_MAGIC:
+                    return False
+                if int.from_bytes(f.read(2), "little") != self.slot_count:
+                    return False
+                for arr in (
+                    self.history_ms,
+                    self.history_count,
+                    self.history_next,
+                    self.commanded_ms,
+                    self.baseline_ms,
+                    self.drifting,
+                ):
+                    f.readinto(memoryview(arr))
+        except OSError:
+            return False
+        return True
@@ -0,0 +1,393 @@
+"""Interleaved endurance testing: cycle many dots, each resting while others move.
+
+`cycle_dot()` rests a dot for `pause_ms` after every move, so the motors are idle most
+of the time. Here, the next move goes to whichever dot may move now, so one dot's rest
+is spent driving the others. A dot may move when:
+* Duty cycle: it has rested for long enough since its last drive, so that its
+  on-time stays below `max_duty_pct`.
+* Thermal limit: its heat estimate is below `thermal_limit_mAs`. Heat is the charge
+  (mA * s) of its drives, decaying exponentially with time constant `thermal_tau_ms`,
+  a first-order model of the winding temperature.
+* Current budget: with `max_concurrent` > 1, several dots are driven at once, while
+  their expected peak currents sum to at most `board_budget_mA` per board. A dot's
+  expected peak is its mean + 3 standard deviations, once measured.
+
+Current signatures are only classified for single-dot drives. With `max_concurrent`
+> 1, each dot is still driven alone every `solo_every` cycles, to keep its stats up to
+date. Dots that fault `MAX_CONSECUTIVE_FAULTS` times in a row are retired, recording
+the cycle they failed at.
+
+Statistics are kept online (Welford's algorithm) per slot (dot * 2 + direction, like
+the shift register outputs): peak current, plateau current and completion time.
+The whole run can be saved to and resumed from flash.
+
+Pure Python, with times passed in by the caller, so it can also run on the host.
+"""
+
+import math
+import os
+import struct
+from array import array
+
+from actuation_classifier import FAULT_LABELS, LABEL_NAMES, LABEL_OK
+
+DIRECTIONS = ("up", "down")  # Index = the direction's shift register offset.
+
+DEFAULT_MAX_DUTY_PCT = 20
+DEFAULT_THERMAL_TAU_MS = 30_000
+DEFAULT_THERMAL_LIMIT_MAS = 1_200  # 20% duty at 200 mA, over one time constant.
+DEFAULT_BOARD_BUDGET_MA = 600
+DEFAULT_SOLO_EVERY = 10
+DEFAULT_PEAK_MA = 400  # Expected peak of a dot that has not been measured yet.
+MAX_CONSECUTIVE_FAULTS = 3
+
+_FILE_MAGIC = b"BDE1"
+_FILE_VERSION = 1
+# Magic, version, dot count, cycles, max duty %, thermal tau (ms),
+# thermal limit (mA s), board budget (mA), max concurrent, solo every,
+# dots per board, run time (ms).
+_HEADER_FORMAT = "<4sHHiHiiHHHHq"
+
+
+class RunningStats:
+    """Count, mean and variance per slot, updated one value at a time (Welford)."""
+
+    def __init__(self, slot_count: int) -> None:
+        self.count = array("i", [0] * slot_count)
+        self.mean = array("f", [0] * slot_count)
+        self.m2 = array("f", [0] * slot_count)  # Sum of squared deviations.
+
+    def add(self, slot: int, value: float) -> None:
+        count = self.count[slot] + 1
+        delta = value - self.mean[slot]
+        mean = self.mean[slot] + delta / count
+        self.count[slot] = count
+        self.mean[slot] = mean
+        self.m2[slot] += delta * (value - mean)
+
+    def std(self, slot: int) -> float:
+        """Sample standard deviation. 0 with fewer than 2 values."""
+        count = self.count[slot]
+        if count < 2:
+            return 0.0
+        return math.sqrt(max(self.m2[slot], 0) / (count - 1))
+
+    def arrays(self) -> tuple:
+        return (self.count, self.mean, self.m2)
+
+
+class EnduranceRun:
+    """Schedules the moves of an endurance run, and accumulates its results.
+
+    Call `advance()` with the time elapsed, then `next_frame()` to get the dots to
+    drive (or how long to wait), drive them, and report each with `record_solo()` or
+    `record_shared()`. Directions alternate, starting with down; a cycle is a down
+    move and an up move.
+    """
+
+    def __init__(
+        self,
+        dots: list[int],
+        cycles: int,
+        *,
+        dot_count: int,
+        dots_per_board: int,
+        max_duty_pct: int = DEFAULT_MAX_DUTY_PCT,
+        thermal_tau_ms: int = DEFAULT_THERMAL_TAU_MS,
+        thermal_limit_mAs: int = DEFAULT_THERMAL_LIMIT_MAS,
+        board_budget_mA: int = DEFAULT_BOARD_BUDGET_MA,
+        max_concurrent: int = 1,
+        solo_every: int = DEFAULT_SOLO_EVERY,
+    ) -> None:
+        self.dot_count = dot_count
+        self.cycles = cycles
+        self.dots_per_board = dots_per_board
+        self.max_duty_pct = max(1, min(100, max_duty_pct))
+        self.thermal_tau_ms = max(1, thermal_tau_ms)
+        self.thermal_limit_mAs = thermal_limit_mAs
+        self.board_budget_mA = board_budget_mA
+        self.max_concurrent = max(1, max_concurrent)
+        self.solo_every = max(1, solo_every)
+        self.now_ms = 0  # Run time, excluding time stopped between resumes.
+
+        self.active = bytearray(dot_count)
+        for dot in dots:
+            self.active[dot] = 1
+        self.moves = array("i", [0] * dot_count)
+        self.ready_ms = [0] * dot_count  # Run time when the rest ends.
+        self.heat_mAs = array("f", [0] * dot_count)
+        self.heat_time_ms = [0] * dot_count  # When `heat_mAs` was last decayed.
+        self.consecutive_faults = bytearray(dot_count)
+        self.fault_counts = array("i", [0] * dot_count)
+        self.failed_at_cycle = array("i", [-1] * dot_count)
+
+        slot_count = dot_count * 2
+        self.peak_mA = RunningStats(slot_count)
+        self.plateau_mA = RunningStats(slot_count)
+        self.completion_ms = RunningStats(slot_count)
+        self.label_counts = array("i", [0] * (slot_count * len(LABEL_NAMES)))
+
+    def advance(self, elapsed_ms: int) -> None:
+        """Move the run clock forward by `elapsed_ms`."""
+        self.now_ms += max(0, elapsed_ms)
+
+    def direction(self, dot: int) -> str:
+        """Direction of the next move of `dot`."""
+        return DIRECTIONS[1 - self.moves[dot] % 2]
+
+    def slot(self, dot: int) -> int:
+        """Slot of the next move of `dot`."""
+        return dot * 2 + 1 - self.moves[dot] % 2
+
+    def _remaining(self, dot: int) -> bool:
+        return (
+            self.active[dot]
+            and self.failed_at_cycle[dot] < 0
+            and self.moves[dot] < self.cycles * 2
+        )
+
+    def done(self) -> bool:
+        """Whether every dot has finished its cycles (or failed)."""
+        for dot in range(self.dot_count):
+            if self._remaining(dot):
+                return False
+        return True
+
+    def heat(self, dot: int) -> float:
+        """Heat estimate of `dot` now, in mA * s."""
+        elapsed_ms = self.now_ms - self.heat_time_ms[dot]
+        if elapsed_ms > 0:
+            self.heat_mAs[dot] *= math.exp(-elapsed_ms / self.thermal_tau_ms)
+            self.heat_time_ms[dot] = self.now_ms
+        return self.heat_mAs[dot]
+
+    def expected_peak_mA(self, dot: int) -> float:
+        slot = self.slot(dot)
+        if self.peak_mA.count[slot] < 2:
+            return DEFAULT_PEAK_MA
+        return self.peak_mA.mean[slot] + 3 * self.peak_mA.std(slot)
+
+    def _needs_solo(self, dot: int) -> bool:
+        if self.max_concurrent == 1:
+            return True
+        slot = self.slot(dot)
+        return (
+            self.peak_mA.count[slot] < 2 or self.moves[dot] // 2 % self.solo_every == 0
+        )
+
+    def next_frame(self, frame: list[int]) -> int:
+        """Fill `frame` with the dots to drive now. Otherwise, ms to wait (> 0)."""
+        frame.clear()
+        candidates = []
+        wait_ms = 1_000
+        for dot in range(self.dot_count):
+            if not self._remaining(dot):
+                continue
+            rest_ms = self.ready_ms[dot] - self.now_ms
+            if rest_ms > 0:
+                wait_ms = min(wait_ms, rest_ms)
+                continue
+            excess_mAs = self.heat(dot) - self.thermal_limit_mAs
+            if excess_mAs > 0:
+                # Time for the heat to decay to the limit.
+                limit = max(self.thermal_limit_mAs, 1)
+                cool_ms = self.thermal_tau_ms * math.log(1 + excess_mAs / limit)
+                wait_ms = min(wait_ms, int(cool_ms) + 1)
+                continue
+            candidates.append((self.moves[dot], self.ready_ms[dot], dot))
+        if not candidates:
+            return max(wait_ms, 1)
+
+        # The dots furthest behind first, then the longest rested.
+        candidates.sort()
+        first = candidates[0][2]
+        frame.append(first)
+        if self._needs_solo(first):
+            return 0
+        board_mA = {first // self.dots_per_board: self.expected_peak_mA(first)}
+        for _, _, dot in candidates[1:]:
+            if len(frame) >= self.max_concurrent:
+                break
+            if self._needs_solo(dot):
+                continue
+            board = dot // self.dots_per_board
+            total_mA = board_mA.get(board, 0) + self.expected_peak_mA(dot)
+            if total_mA > self.board_budget_mA:
+                continue
+            board_mA[board] = total_mA
+            frame.append(dot)
+        return 0
+
+    def _finish_move(self, dot: int, drive_ms: int, mean_mA: float) -> None:
+        self.heat(dot)  # Decay up to now, before adding.
+        self.heat_mAs[dot] += mean_mA * drive_ms / 1000
+        rest_ms = drive_ms * (100 - self.max_duty_pct) // self.max_duty_pct
+        self.ready_ms[dot] = self.now_ms + rest_ms
+        self.moves[dot] += 1
+
+    def record_solo(
+        self,
+        dot: int,
+        drive_ms: int,
+        label: int,
+        peak_mA: float,
+        plateau_mA: float,
+        completion_ms: int,
+    ) -> None:
+        """Record a single-dot drive of `dot` and its classified current signature.
+
+        `completion_ms` is the time to the stall knee (< 0 if none).
+        """
+        slot = self.slot(dot)
+        self.label_counts[slot * len(LABEL_NAMES) + label] += 1
+        self.peak_mA.add(slot, peak_mA)
+        if label == LABEL_OK:
+            self.plateau_mA.add(slot, plateau_mA)
+            if completion_ms >= 0:
+                self.completion_ms.add(slot, completion_ms)
+
+        if label in FAULT_LABELS:
+            self.fault_counts[dot] += 1
+            self.consecutive_faults[dot] = min(self.consecutive_faults[dot] + 1, 255)
+            if self.consecutive_faults[dot] >= MAX_CONSECUTIVE_FAULTS:
+                self.failed_at_cycle[dot] = self.moves[dot] // 2
+        else:
+            self.consecutive_faults[dot] = 0
+        # Without a plateau (e.g., stalled from the start), it drew about its peak.
+        self._finish_move(dot, drive_ms, plateau_mA if label == LABEL_OK else peak_mA)
+
+    def record_shared(self, dot: int, drive_ms: int) -> None:
+        """Record a drive of `dot` together with other dots (not classified)."""
+        self._finish_move(dot, drive_ms, self.expected_peak_mA(dot))
+
+    def completed_cycles(self) -> int:
+        total = 0
+        for dot in range(self.dot_count):
+            if self.active[dot]:
+                total += self.moves[dot] // 2
+        return total
+
+    def target_cycles(self) -> int:
+        return self.cycles * sum(self.active)
+
+    def dot_summary(self, dot: int) -> dict:
+        """Cycles, faults and per-direction stats of `dot` (allocates)."""
+        summary = {
+            "dot": dot,
+            "cycles": self.moves[dot] // 2,
+            "faults": self.fault_counts[dot],
+            "failed_at_cycle": self.failed_at_cycle[dot],
+        }
+        for direction_index in range(2):
+            slot = dot * 2 + direction_index
+            labels = {}
+            for label in range(len(LABEL_NAMES)):
+                count = self.label_counts[slot * len(LABEL_NAMES) + label]
+                if count:
+                    labels[LABEL_NAMES[label]] = count
+            summary[DIRECTIONS[direction_index]] = {
+                "labels": labels,
+                "peak_mA": _stats_summary(self.peak_mA, slot),
+                "plateau_mA": _stats_summary(self.plateau_mA, slot),
+                "completion_ms": _stats_summary(self.completion_ms, slot),
+            }
+        return summary
+
+    def _per_dot_arrays(self) -> tuple:
+        return (
+            self.active,
+            self.moves,
+            self.heat_mAs,
+            self.consecutive_faults,
+            self.fault_counts,
+            self.failed_at_cycle,
+            *self.peak_mA.arrays(),
+            *self.plateau_mA.arrays(),
+            *self.completion_ms.arrays(),
+            self.label_counts,
+        )
+
+    def save(self, path: str) -> None:
+        """Checkpoint the run to `path` (written to a temporary file, then renamed)."""
+        for dot in range(self.dot_count):
+            self.heat(dot)  # Saved decayed to now.
+        rest_ms = array("i", [max(0, ready - self.now_ms) for ready in self.ready_ms])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(
+                struct.pack(
+                    _HEADER_FORMAT,
+                    _FILE_MAGIC,
+                    _FILE_VERSION,
+                    self.dot_count,
+                    self.cycles,
+                    self.max_duty_pct,
+                    self.thermal_tau_ms,
+                    self.thermal_limit_mAs,
+                    self.board_budget_mA,
+                    self.max_concurrent,
+                    self.solo_every,
+                    self.dots_per_board,
+                    self.now_ms,
+                )
+            )
+            f.write(rest_ms)
+            for arr in self._per_dot_arrays():
+                f.write(arr)
+        os.rename(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "EnduranceRun | None":
+        """Resume a run saved by `save()`. None if missing or not a checkpoint."""
+        try:
+            with open(path, "rb") as f:
+                header = f.read(struct.calcsize(_HEADER_FORMAT))
+                if len(header) != struct.calcsize(_HEADER_FORMAT):
+                    return None
+                (
+                    magic,
+                    version,
+                    dot_count,
+                    cycles,
+                    max_duty_pct,
+                    thermal_tau_ms,
+                    thermal_limit_mAs,
+                    board_budget_mA,
+                    max_concurrent,
+                    solo_every,
+                    dots_per_board,
+                    now_ms,
+                ) = struct.unpack(_HEADER_FORMAT, header)
+                if magic != _FILE_MAGIC or version != _FILE_VERSION:
+                    return None
+                run = cls(
+                    [],
+                    cycles,
+                    dot_count=dot_count,
+                    dots_per_board=dots_per_board,
+                    max_duty_pct=max_duty_pct,
+                    thermal_tau_ms=thermal_tau_ms,
+                    thermal_limit_mAs=thermal_limit_mAs,
+                    board_budget_mA=board_budget_mA,
+                    max_concurrent=max_concurrent,
+                    solo_every=solo_every,
+                )
+                rest_ms = array("i", [0] * dot_count)
+                f.readinto(memoryview(rest_ms))
+                for arr in run._per_dot_arrays():
+                    f.readinto(memoryview(arr))
+        except OSError:
+            return None
+        run.now_ms = now_ms
+        for dot in range(dot_count):
+            run.ready_ms[dot] = now_ms + rest_ms[dot]
+            run.heat_time_ms[dot] = now_ms
+        return run
+
+
+def _stats_summary(stats: RunningStats, slot: int) -> dict:
+    return {
+        "n": stats.count[slot],
+        "mean": round(stats.mean[slot], 1),
+        "std": round(stats.std(slot), 1),
+    }
@@ -30,6 +30,7 @@ CircuitPython/MicroPython driver for the INA219 current sensor.
 Source: https://raw.githubusercontent.com/robert-hh/INA219/refs/heads/master/ina219.py
 """
 
+from array import array
 from machine import I2C
 from micropython import const
 # from adafruit_bus_device.i2c_device import I2CDevice
@@ -37,6 +38,15 @@ from micropython import const
 __version__ = "0.0.0-auto.0"
 __repo__ = "https://github.com/robert-hh/INA219.git"
 
+# Reads between config readbacks, to detect a chip reset (see `check_reset()`).
+_RESET_CHECK_INTERVAL = const(256)
+
+# Shunt voltage register LSB, in uV.
+_SHUNT_LSB_UV = const(10)
+# Products in the fixed-point conversions are kept below this, so that they stay
+# small ints (no long-int allocation on MicroPython).
+_SMALL_INT_LIMIT = const(0x40000000)
+
 # Bits
 # pylint: disable=bad-whitespace
 _READ = const(0x01)
@@ -119,10 +129,40 @@ class INA219:
         # Multiplier in W used to determine power from raw reading
         self._power_lsb = 0
 
+        # Register cache: what was last written to the chip. None = unknown.
+        self._config_value = None
+        self._written_cal_value = None
+        self.reset_check_interval = _RESET_CHECK_INTERVAL
+        self._reads_since_check = 0
+        self.reset_count = 0
+
+        # Fixed-point shunt raw -> uA factor: uA = (raw * mul) >> shift.
+        # The presets below assume a 0.1 ohm shunt.
+        self.shunt_milliohms = 100
+        self._shunt_uA_mul = 0
+        self._shunt_uA_shift = 0
+        self._set_shunt_scale(100)
+        # Current register LSB in whole uA (0 = not a whole number of uA).
+        self._current_lsb_uA = 0
+
         # Set chip to known config values to start
         self._cal_value = 4096
         self.set_calibration_32V_2A()
 
+    def _set_shunt_scale(self, shunt_milliohms):
+        # uA = raw * 10uV / R = raw * 10_000 / R_mOhm. Use the largest shift for
+        # which a full-scale raw reading times the factor is still a small int.
+        shift = 16
+        while True:
+            scaled_uv = _SHUNT_LSB_UV * 1000 << shift
+            mul = (scaled_uv + shunt_milliohms // 2) // shunt_milliohms
+            if shift == 0 or 0x7FFF * mul < _SMALL_INT_LIMIT:
+                break
+            shift -= 1
+        self.shunt_milliohms = shunt_milliohms
+        self._shunt_uA_mul = mul
+        self._shunt_uA_shift = shift
+
     def _write_register(self, reg, value):
         self.buf[0] = (value >> 8) & 0xFF
         self.buf[1] = value & 0xFF
@@ -133,17 +173,82 @@ class INA219:
         value = (self.buf[0] << 8) | (self.buf[1])
         return value
 
+    def _apply_config(self, config, force=False):
+        """Write the calibration and config registers, skipping unchanged ones."""
+        if force or self._written_cal_value != self._cal_value:
+            self._write_register(_REG_CALIBRATION, self._cal_value)
+            self._written_cal_value = self._cal_value
+        if force or self._config_value != config:
+            self._write_register(_REG_CONFIG, config)
+            self._config_value = config
+
+    def check_reset(self):
+        """Read back the config register, and re-apply the settings if the chip has
+        reset (e.g., a brown-out from a sharp load), which clears the calibration.
+        Returns True if a reset was detected."""
+        self._reads_since_check = 0
+        if self._config_value is None:
+            return False
+        if self._read_register(_REG_CONFIG) == self._config_value:
+            return False
+        self.reset_count += 1
+        self._apply_config(self._config_value, force=True)
+        return True
+
+    def _read_measurement(self, reg):
+        # One register read per sample. Every `reset_check_interval` reads, the
+        # config is also read back, instead of re-writing the calibration each time.
+        self._reads_since_check += 1
+        if self._reads_since_check >= self.reset_check_interval:
+            self.check_reset()
+        return self._read_register(reg)
+
     @property
     def shunt_voltage(self):
         """The shunt voltage (between V+ and V-) in Volts (so +-.327V)"""
-        value = _to_signed(self._read_register(_REG_SHUNTVOLTAGE))
+        value = _to_signed(self._read_measurement(_REG_SHUNTVOLTAGE))
         # The least signficant bit is 10uV which is 0.00001 volts
         return value * 0.00001
 
+    @property
+    def shunt_raw(self):
+        """The raw, signed shunt voltage register value. 1 LSB = 10uV.
+
+        Returns a small int, so unlike `shunt_voltage` it does not allocate."""
+        return _to_signed(self._read_measurement(_REG_SHUNTVOLTAGE))
+
+    def shunt_raw_to_uA(self, raw):
+        """Convert a raw shunt reading to uA through the configured shunt.
+
+        Integer math with a precomputed factor. Does not allocate for single
+        readings; sums of many readings may become long ints (convert those at
+        export time only)."""
+        return (raw * self._shunt_uA_mul) >> self._shunt_uA_shift
+
+    @property
+    def current_uA_int(self):
+        """The current through the shunt in uA, as an int (does not allocate).
+
+        Computed from the shunt voltage and the shunt resistance given to
+        `set_calibration_for_shunt()`, so it doesn't depend on the calibration
+        register (which is cleared if the chip resets)."""
+        return (self.shunt_raw * self._shunt_uA_mul) >> self._shunt_uA_shift
+
+    @property
+    def bus_mV_int(self):
+        """The bus voltage (between V- and GND) in mV, as an int (does not allocate)."""
+        return _to_signed(self._read_measurement(_REG_BUSVOLTAGE) >> 3) * 4
+
+    @property
+    def current_register_uA_int(self):
+        """The current register in uA, as an int. Requires a calibration with a
+        whole-uA current LSB (`set_calibration_for_shunt()`)."""
+        return _to_signed(self._read_measurement(_REG_CURRENT)) * self._current_lsb_uA
+
     @property
     def bus_voltage(self):
         """The bus voltage (between V- and GND) in Volts"""
-        raw_voltage = self._read_register(_REG_BUSVOLTAGE)
+        raw_voltage = self._read_measurement(_REG_BUSVOLTAGE)
 
         # Shift to the right 3 to drop CNVR and OVF and multiply by LSB
         # Each least signficant bit is 4mV
@@ -155,12 +260,9 @@ class INA219:
         """The current through the shunt resistor in milliamps."""
         # Sometimes a sharp load will reset the INA219, which will
         # reset the cal register, meaning CURRENT and POWER will
-        # not be available ... athis by always setting a cal
-        # value even if it's an unfortunate extra step
-        self._write_register(_REG_CALIBRATION, self._cal_value)
-
-        # Now we can safely read the CURRENT register!
-        raw_current = _to_signed(self._read_register(_REG_CURRENT))
+        # not be available. That is caught by the periodic config
+        # readback in `_read_measurement()` (see `check_reset()`).
+        raw_current = _to_signed(self._read_measurement(_REG_CURRENT))
         return raw_current * self._current_lsb
 
     def set_calibration_32V_2A(self):  # pylint: disable=invalid-name
@@ -197,6 +299,7 @@ class INA219:
         #    (Preferrably a roundish number close to MinLSB)
         # CurrentLSB = 0.0001 (100uA per bit)
         self._current_lsb = .1  # Current LSB = 100uA per bit
+        self._current_lsb_uA = 100
 
         # 5. Compute the calibration register
         # Cal = trunc (0.04096 / (Current_LSB * RSHUNT))
@@ -235,16 +338,14 @@ class INA219:
         # MaximumPower = 3.2 * 32V
         # MaximumPower = 102.4W
 
-        # Set Calibration register to 'Cal' calculated above
-        self._write_register(_REG_CALIBRATION, self._cal_value)
-
         # Set Config register to take into account the settings above
         config = (_CONFIG_BVOLTAGERANGE_32V |
                   _CONFIG_GAIN_8_320MV |
                   _CONFIG_BADCRES_12BIT |
                   _CONFIG_SADCRES_12BIT_1S_532US |
                   _CONFIG_MODE_SANDBVOLT_CONTINUOUS)
-        self._write_register(_REG_CONFIG, config)
+        # Set Calibration register to 'Cal' calculated above, and the config
+        self._apply_config(config)
 
     def set_calibration_32V_1A(self):  # pylint: disable=invalid-name
         """Configures to INA219 to be able to measure up to 32V and 1A of
@@ -280,6 +381,7 @@ class INA219:
         #    (Preferrably a roundish number close to MinLSB)
         # CurrentLSB = 0.0000400 (40uA per bit)
         self._current_lsb = 0.04  # In milliamps
+        self._current_lsb_uA = 40
 
         # 5. Compute the calibration register
         # Cal = trunc (0.04096 / (Current_LSB * RSHUNT))
@@ -321,16 +423,14 @@ class INA219:
         # MaximumPower = 1.31068 * 32V
         # MaximumPower = 41.94176W
 
-        # Set Calibration register to 'Cal' calculated above
-        self._write_register(_REG_CALIBRATION, self._cal_value)
-
         # Set Config register to take into account the settings above
         config = (_CONFIG_BVOLTAGERANGE_32V |
                   _CONFIG_GAIN_8_320MV |
                   _CONFIG_BADCRES_12BIT |
                   _CONFIG_SADCRES_12BIT_1S_532US |
                   _CONFIG_MODE_SANDBVOLT_CONTINUOUS)
-        self._write_register(_REG_CONFIG, config)
+        # Set Calibration register to 'Cal' calculated above, and the config
+        self._apply_config(config)
 
     def set_calibration_16V_400mA(self):  # pylint: disable=invalid-name
         """Configures to INA219 to be able to measure up to 16V and 400mA of
@@ -362,6 +462,7 @@ class INA219:
         #    (Preferrably a roundish number close to MinLSB)
         # CurrentLSB = 0.00005 (50uA per bit)
         self._current_lsb = 0.05  # in milliamps
+        self._current_lsb_uA = 50
 
         # 5. Compute the calibration register
         # Cal = trunc (0.04096 / (Current_LSB * RSHUNT))
@@ -406,13 +507,94 @@ class INA219:
         # MaximumPower = 0.4 * 16V
         # MaximumPower = 6.4W
 
-        # Set Calibration register to 'Cal' calculated above
-        self._write_register(_REG_CALIBRATION, self._cal_value)
-
         # Set Config register to take into account the settings above
         config = (_CONFIG_BVOLTAGERANGE_16V |
                   _CONFIG_GAIN_1_40MV |
                   _CONFIG_BADCRES_12BIT |
                   _CONFIG_SADCRES_12BIT_1S_532US |
                   _CONFIG_MODE_SANDBVOLT_CONTINUOUS)
-        self._write_register(_REG_CONFIG, config)
\ No newline at end of file
+        # Set Calibration register to 'Cal' calculated above, and the config
+        self._apply_config(config)
+
+    def set_calibration_for_shunt(self, shunt_milliohms, max_current_mA,
+                                  bus_32V=True):  # pylint: disable=invalid-name
+        """Configures the INA219 for the shunt resistor actually fitted, up to
+        `max_current_mA`, instead of assuming a 0.1 ohm shunt like the presets above.
+
+        Same steps as in `set_calibration_32V_2A()`, in integer math:
+        * Gain: the smallest PGA range that fits max_current * RSHUNT.
+        * Current LSB: the smallest whole number of uA that covers max_current in
+          15 bits (and keeps Cal within 16 bits), so `current_register_uA_int` is a
+          single multiply.
+        * Cal = trunc(0.04096 / (Current_LSB * RSHUNT)).
+        Also sets the fixed-point factor used by `current_uA_int`."""
+        max_shunt_uV = max_current_mA * shunt_milliohms  # mA * mOhm = uV.
+        if max_shunt_uV <= 40_000:
+            gain = _CONFIG_GAIN_1_40MV
+        elif max_shunt_uV <= 80_000:
+            gain = _CONFIG_GAIN_2_80MV
+        elif max_shunt_uV <= 160_000:
+            gain = _CONFIG_GAIN_4_160MV
+        else:
+            gain = _CONFIG_GAIN_8_320MV
+
+        # 0.04096 / (LSB_uA * 1e-6 * R_mOhm * 1e-3) = 40_960_000 / (LSB_uA * R_mOhm)
+        lsb_uA = max(
+            -(-max_current_mA * 1000 // 0x7FFF),
+            -(-40_960_000 // (0xFFFE * shunt_milliohms)),
+            1,
+        )
+        self._current_lsb_uA = lsb_uA
+        self._current_lsb = lsb_uA / 1000  # In milliamps
+        self._power_lsb = 20 * lsb_uA / 1_000_000  # In watts
+        self._cal_value = (40_960_000 // (lsb_uA * shunt_milliohms)) & 0xFFFE
+        self._set_shunt_scale(shunt_milliohms)
+
+        bus_range = _CONFIG_BVOLTAGERANGE_32V if bus_32V else _CONFIG_BVOLTAGERANGE_16V
+        config = (bus_range |
+                  gain |
+                  _CONFIG_BADCRES_12BIT |
+                  _CONFIG_SADCRES_12BIT_1S_532US |
+                  _CONFIG_MODE_SANDBVOLT_CONTINUOUS)
+        self._apply_config(config)
+
+
+class INA219Bank:
+    """Several INA219s on one I2C bus, one per board, read round-robin.
+
+    Board `n` is the sensor at the `n`-th lowest address. The latest raw shunt reading
+    of each board is kept in `latest_raw`, so current can be attributed per board.
+    Reads do not allocate.
+    """
+    def __init__(self, sensors):
+        self.sensors = sensors
+        self.latest_raw = array("i", [0] * len(sensors))
+        self.read_count = array("i", [0] * len(sensors))
+        self._next_board = 0
+
+    def read(self, board):
+        """Read the shunt of `board` now. Returns its raw value (1 LSB = 10uV)."""
+        raw = self.sensors[board].shunt_raw
+        self.latest_raw[board] = raw
+        self.read_count[board] += 1
+        return raw
+
+    def read_next(self):
+        """Read the next board in turn. Returns the latest raw total of all boards.
+
+        One I2C transaction per call, so the total is at most one round old."""
+        board = self._next_board
+        self.read(board)
+        self._next_board = board + 1 if board + 1 < len(self.sensors) else 0
+
+        total = 0
+        for i in range(len(self.latest_raw)):
+            total += self.latest_raw[i]
+        return total
+
+    def read_all(self):
+        """Read every board once (one batch). Returns the raw total."""
+        total = 0
+        for board in range(len(self.sensors)):
+            total += self.read(board)
+        return total
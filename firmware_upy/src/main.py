@@ -2,11 +2,44 @@
 
 from typing import Literal
 
-from machine import I2C, Pin
+from array import array
+from machine import I2C, Pin, Timer
+import gc
+import micropython
+import struct
 import time
 import json
 
-from ina219 import INA219
+from actuation_classifier import (
+    FAULT_LABELS,
+    LABEL_AT_END_STOP,
+    LABEL_INCOMPLETE,
+    LABEL_NAMES,
+    LABEL_OK,
+    LABEL_PENDING,
+    TRAVEL_NO,
+    TRAVEL_UNKNOWN,
+    TRAVEL_YES,
+    ActuationClassifier,
+)
+from braille_pager import Pager
+from dot_map import (
+    BOARD_COUNT,
+    DOT_COUNT,
+    DOTS_PER_BOARD,
+    OUTPUT_COUNT,
+    OUTPUTS_PER_BOARD,
+    SLOT_OUTPUTS,
+)
+from drive_tuning import DriveTuner
+from endurance import EnduranceRun
+from ina219 import INA219, INA219Bank
+from profiler import profiler
+from supply_guard import SupplyGuard
+from trace_log import ARG_ALL_BOARDS, TraceLog
+
+# Allow exceptions raised in hard IRQ handlers (e.g., the safety cutoff) to be reported.
+micropython.alloc_emergency_exception_buf(100)
 
 # Pin definitions for shift register control.
 PIN_SHIFT_SER_IN = Pin(2, Pin.OUT)  # GP2: Serial data input
@@ -23,6 +56,64 @@ DOT_ADDITION_CONSTANTS = {
     "down": DOT_ADDITION_CONSTANT_DOWN,
 }
 
+# Extra time past the requested drive time before the safety cutoff timer forcibly
+# disables the motor outputs.
+SAFETY_CUTOFF_MARGIN_MS = 20
+
+# Output budget for current logging over the serial link. Summary windows are
+# stretched as needed to stay within this rate.
+LOG_OUTPUT_BUDGET_BYTES_PER_S = 2_000
+
+# Profiler scopes and counters for the hot path. See `profile_dump()`.
+PROF_SET_SHIFT_REGISTERS = profiler.scope("set_shift_registers")
+PROF_FAST_CLEAR = profiler.scope("fast_clear_shift_register")
+PROF_INA_SAMPLE = profiler.scope("ina_sample")
+PROF_LOG_EMIT = profiler.scope("log_emit")
+PROF_COUNT_ACTUATIONS = profiler.counter("actuations")
+PROF_COUNT_LOG_BYTES = profiler.counter("log_bytes")
+
+# Limits of the preallocated current log buffers (per drive).
+LOG_MAX_WINDOWS_PER_DRIVE = 64
+LOG_MAX_SAMPLES_PER_WINDOW = 30_000  # Keeps raw sums within MicroPython small ints.
+
+# Collect garbage between drives when free memory drops below this, so that the GC
+# (disabled during drives) never needs to run mid-drive.
+GC_MIN_FREE_BYTES = 32_000
+
+# Binary actuation schedule format. Must match `host_tools/schedule_compiler.py`.
+SCHEDULE_MAGIC = b"BDS1"
+SCHEDULE_VERSION = 1
+SCHEDULE_HEADER_FORMAT = "<4sHHI"  # Magic, version, state bytes, event count.
+SCHEDULE_HEADER_BYTES = 12
+SCHEDULE_TIME_BYTES = 4
+
+# Stop a single-dot drive as soon as the classifier decides it is stalled or shorted.
+STOP_DRIVE_ON_STALL = True
+
+# Last known position of each dot (tracked from classified actuations).
+DOT_POSITION_UNKNOWN = 0
+DOT_POSITION_UP = 1
+DOT_POSITION_DOWN = 2
+
+# Learned per-dot drive times are saved here (see `save_drive_tuning()`).
+DRIVE_TUNING_PATH = "drive_tuning.bin"
+
+# Tuned classifier thresholds, loaded at init (see `host_tools/detector_bench.py`).
+CLASSIFIER_PARAMS_PATH = "classifier_params.json"
+
+# Learned supply limits (motors at once, start stagger) are saved here on each change.
+SUPPLY_GUARD_PATH = "supply_guard.bin"
+# Read the bus voltage every this many current samples during a multi-motor drive.
+SUPPLY_BUS_SAMPLE_EVERY = 8
+# Longest time to spend starting the motors of a drive. The first ones are driven for
+# this much longer. Motors not started by then are left for the next batch.
+SUPPLY_START_PHASE_MAX_US = 30_000
+
+# Endurance runs are checkpointed here, to be resumed (see `endurance_resume()`).
+ENDURANCE_CHECKPOINT_PATH = "endurance.bin"
+ENDURANCE_CHECKPOINT_INTERVAL_MS = 60_000
+ENDURANCE_PROGRESS_INTERVAL_MS = 10_000
+
 # Pin definitions for general purpose LEDs and buttons.
 PIN_SW1 = Pin(28, Pin.IN, Pin.PULL_UP)
 PIN_SW2 = Pin(27, Pin.IN, Pin.PULL_UP)
@@ -30,23 +121,135 @@ PIN_GP_LED_0 = Pin(7, Pin.OUT)
 PIN_GP_LED_1 = Pin(8, Pin.OUT)
 
 # Pin/Peripheral Init: INA219 Current Sensor.
-INA_SHUNT_OMHS = 0.300
+INA_SHUNT_MILLIOHMS = 300  # 0.300 ohm, as an int for allocation-free math.
+INA_SHUNT_LSB_UV = 10  # INA219 shunt voltage register LSB.
+INA_MAX_CURRENT_MA = 1_000  # Just under the 320 mV range limit (1067 mA).
 ina_i2c = I2C(1, scl=Pin(15), sda=Pin(14), freq=100_000)
-ina: INA219  # Constructed/initialized in `init_ina()`
+ina: INA219  # Board 0 sensor. Constructed/initialized in `init_ina()`
+ina_bank: INA219Bank  # All sensors, one per board. Also from `init_ina()`.
+INA219_ADDRESS_MIN = 0x40
+INA219_ADDRESS_MAX = 0x4F
+
+# Preallocated output state, reused for every frame request (no per-call lists).
+register_state = bytearray(OUTPUT_COUNT)  # Indexed by output.
+
+# Per-dot health, from the current signature of each single-dot actuation.
+classifier = ActuationClassifier(INA_SHUNT_MILLIOHMS, INA_SHUNT_LSB_UV)
+dot_positions = bytearray(DOT_COUNT)
+dot_labels = bytearray(DOT_COUNT)
+dot_fault_counts = array("i", [0] * DOT_COUNT)
+
+# Per-dot, per-direction drive times, indexed by slot (dot * 2 + direction).
+drive_tuner = DriveTuner(DOT_COUNT * 2)
+
+# How many motors may be driven at once, learned from bus voltage sag (one per dot).
+supply_guard = SupplyGuard(DOT_COUNT)
+# Outputs not driven yet, in `actuate_guarded()`.
+pending_state = bytearray(OUTPUT_COUNT)
+
+# Actuation sessions recorded to flash, for replay on the host. Off until enabled.
+trace_log = TraceLog()
+
+
+class SafetyCutoff:
+    """Hardware-timer watchdog that disables the motor outputs at a deadline.
+
+    Armed each time the outputs are driven. If the foreground code has not cleared the
+    shift registers by the deadline (e.g., exception, slow print, GC pause), the hard
+    IRQ pulls N_OE high, which disables all outputs immediately. The outputs stay
+    disabled until `fast_clear_shift_register()` clears the data and re-enables them.
+    """
+
+    def __init__(self) -> None:
+        self.timer = Timer()
+        self.armed = False
+        self.tripped = False
+        self.overrun_count = 0
+
+        # Bind once, so that arming and the IRQ itself do not allocate.
+        self._on_deadline_callback = self._on_deadline
+
+    def arm(self, drive_ms: int) -> None:
+        """Start the countdown for a drive of `drive_ms` (plus the margin)."""
+        self.armed = True
+        self.timer.init(
+            mode=Timer.ONE_SHOT,
+            period=drive_ms + SAFETY_CUTOFF_MARGIN_MS,
+            callback=self._on_deadline_callback,
+            hard=True,
+        )
+
+    def disarm(self) -> None:
+        """Stop the countdown. Called when the foreground clears the outputs."""
+        self.armed = False
+        self.timer.deinit()
+
+    def _on_deadline(self, _timer: Timer) -> None:
+        # Hard IRQ context: no allocation allowed here.
+        if not self.armed:
+            return
+        PIN_SHIFT_N_OE.high()  # Active low, so this disables all outputs.
+        self.armed = False
+        self.tripped = True
+        self.overrun_count += 1
+
+
+safety_cutoff = SafetyCutoff()
 
 
 def init_ina() -> None:
-    """Initialize INA219 current sensor. Perform I2C scan."""
+    """Initialize the INA219 current sensors (one per board). Perform I2C scan.
+
+    Board `n` is the sensor at the `n`-th lowest address.
+    """
     print("Scanning I2C bus for INA219.")
     i2c_addr_list: list[int] = ina_i2c.scan()
     print(f"Found {len(i2c_addr_list)} devices: {i2c_addr_list}")
 
-    if i2c_addr_list != [0x40]:
-        raise ValueError("INA219 not found at expected address.")
+    ina_addr_list = sorted(
+        addr
+        for addr in i2c_addr_list
+        if INA219_ADDRESS_MIN <= addr <= INA219_ADDRESS_MAX
+    )
+    if not ina_addr_list:
+        raise ValueError("No INA219 found on the I2C bus.")
+
+    sensors = []
+    for board, addr in enumerate(ina_addr_list):
+        sensor = INA219(ina_i2c, addr=addr)
+        sensor.set_calibration_for_shunt(INA_SHUNT_MILLIOHMS, INA_MAX_CURRENT_MA)
+        sensors.append(sensor)
+        print(f"Board {board}: INA219 at {hex(addr)}.")
+    if len(sensors) != BOARD_COUNT:
+        print(
+            f"WARNING: {len(sensors)} INA219 found for {BOARD_COUNT} boards. Dots of "
+            "boards without their own sensor are measured on the total of all boards."
+        )
+
+    global ina, ina_bank
+    ina = sensors[0]
+    ina_bank = INA219Bank(sensors)
 
-    global ina
-    ina = INA219(ina_i2c, addr=0x40)
-    ina.set_calibration_32V_2A()
+
+def board_for_dot(dot_num: int) -> int:
+    """Index of the board (and its INA219) that drives `dot_num`.
+
+    -1 (the total of all boards, read round-robin) if that board has no INA219.
+    """
+    board = dot_num // DOTS_PER_BOARD
+    return board if board < len(ina_bank.sensors) else -1
+
+
+def ina_boards() -> None:
+    """Read and print the current of each board."""
+    ina_bank.read_all()
+    for board in range(len(ina_bank.sensors)):
+        sensor = ina_bank.sensors[board]
+        sensor.check_reset()
+        print(
+            f"Board {board}: {shunt_raw_to_mA(ina_bank.latest_raw[board]):.1f} mA "
+            f"({ina_bank.read_count[board]} reads, {sensor.reset_count} resets)"
+        )
 
 
 def init_shift_register() -> None:
@@ -62,7 +265,7 @@ def init_shift_register() -> None:
     fast_clear_shift_register()
 
     # Clear all outputs explicity (as a precaution).
-    set_shift_registers([False] * 48)
+    set_shift_registers(bytes(OUTPUT_COUNT))
 
 
 def init() -> None:
@@ -75,6 +278,19 @@ def init() -> None:
     PIN_GP_LED_0.low()
     PIN_GP_LED_1.low()
     init_ina()
+
+    if drive_tuner.load(DRIVE_TUNING_PATH):
+        print(f"Loaded drive tuning from {DRIVE_TUNING_PATH}.")
+    if classifier.load(CLASSIFIER_PARAMS_PATH):
+        print(f"Loaded classifier parameters from {CLASSIFIER_PARAMS_PATH}.")
+    brownouts = supply_guard.brownouts
+    if supply_guard.load(SUPPLY_GUARD_PATH):
+        print(f"Loaded supply limits from {SUPPLY_GUARD_PATH}.")
+        if supply_guard.brownouts > brownouts:
+            print(
+                "WARNING: Rebooted while trying more motors at once. Counted as a "
+                f"brown-out: {supply_guard.max_motors} motors at most from now on."
+            )
     print("Init complete.")
 
 
@@ -83,43 +299,74 @@ def reset() -> None:
     init()
 
 
-def set_shift_registers(data: list[bool]) -> None:
+def set_shift_registers(
+    data: bytearray | list[bool], drive_ms: int | None = None
+) -> None:
     """
-    Set the state of all shift registers based on input data.
+    Set the state of all shift registers based on input data. Does not allocate.
 
     Args:
-        data: list of 48 boolean values representing desired output states
-             (6 registers x 8 bits per register)
+        data: `OUTPUT_COUNT` boolean/0-1 values representing desired output states
+             (8 bits per register, see `dot_map.py`)
+        drive_ms: if set, arm the safety cutoff to disable the outputs if they are
+             not cleared within `drive_ms` (plus `SAFETY_CUTOFF_MARGIN_MS`).
     """
-    start_time_us = time.ticks_us()
-    if len(data) != 48:
-        raise ValueError("Data must contain exactly 48 boolean values")
+    if len(data) != OUTPUT_COUNT:
+        raise ValueError(f"Data must contain exactly {OUTPUT_COUNT} boolean values")
+    profiler.start(PROF_SET_SHIFT_REGISTERS)
 
     # Precompute GPIO operations
     srck_set = PIN_SHIFT_SRCK.value
     ser_set = PIN_SHIFT_SER_IN.value
     rclk_set = PIN_SHIFT_RCLK.value
 
-    # Shift out all 48 bits, MSB first
-    for bit in reversed(data):
-        ser_set(bit)
+    # Shift out all bits, MSB first
+    for i in range(OUTPUT_COUNT - 1, -1, -1):
+        ser_set(data[i])
         srck_set(1)
         srck_set(0)
 
+    # Arm right before the latch, so the deadline covers the whole drive.
+    if drive_ms is not None:
+        safety_cutoff.arm(drive_ms)
+        profiler.count(PROF_COUNT_ACTUATIONS)
+
     # Latch the data to outputs
     rclk_set(1)
     rclk_set(0)
 
-    end_time_us = time.ticks_us()
-    duration_us = time.ticks_diff(end_time_us, start_time_us)
-    print(f"Shift register set in {duration_us:,} us = {duration_us / 1000:.1f} ms.")
+    profiler.stop(PROF_SET_SHIFT_REGISTERS)
+
+
+def set_shift_registers_packed(data: bytes, offset: int) -> None:
+    """Set all shift registers from `OUTPUT_COUNT // 8` bytes at `data[offset]`.
+
+    Output `n` is bit `n % 8` of byte `n // 8`. Does not allocate, and does not arm
+    the safety cutoff.
+    """
+    srck_set = PIN_SHIFT_SRCK.value
+    ser_set = PIN_SHIFT_SER_IN.value
+    rclk_set = PIN_SHIFT_RCLK.value
+
+    # Shift out all bits, MSB first
+    for i in range(OUTPUT_COUNT - 1, -1, -1):
+        ser_set((data[offset + (i >> 3)] >> (i & 7)) & 1)
+        srck_set(1)
+        srck_set(0)
+
+    # Latch the data to outputs
+    rclk_set(1)
+    rclk_set(0)
 
 
 def fast_clear_shift_register() -> None:
-    """Clear all shift registers.
+    """Clear all shift registers, and re-enable outputs after a safety cutoff.
 
     Duration: 700us.
     """
+    profiler.start(PROF_FAST_CLEAR)
+    safety_cutoff.disarm()
+
     # This first block here should do it, but the Chinese knockoffs don't like it:
     # # Immediately clear all shift register storage bits
     # PIN_SHIFT_N_SRCLR.low()  # Assert active-low clear
@@ -139,11 +386,11 @@ def fast_clear_shift_register() -> None:
     # Ensure data line is LOW before shifting
     ser_set(0)
 
-    # Do 24 bits twice, so that when using only a single board,
+    # Do one board's bits at a time, so that when using only a single board,
     # its outputs are cleared first.
-    for _ in range(2):
+    for _ in range(BOARD_COUNT):
         # Shift out LOW bits (fastest possible method)
-        for _ in range(24):
+        for _ in range(OUTPUTS_PER_BOARD):
             srck_set(1)
             srck_set(0)
 
@@ -151,6 +398,340 @@ def fast_clear_shift_register() -> None:
         rclk_set(1)
         rclk_set(0)
 
+    profiler.stop(PROF_FAST_CLEAR)
+
+    if safety_cutoff.tripped:
+        # Outputs were disabled by the safety cutoff. Safe to re-enable now.
+        safety_cutoff.tripped = False
+        PIN_SHIFT_N_OE.low()
+        print(
+            "WARNING: Safety cutoff disabled the outputs before they were cleared "
+            f"({safety_cutoff.overrun_count} overruns total)."
+        )
+
+
+def safety_cutoff_stats() -> None:
+    """Print how many times the safety cutoff has tripped since boot."""
+    print(f"Safety cutoff overruns: {safety_cutoff.overrun_count}")
+    print(f"Safety cutoff margin: {SAFETY_CUTOFF_MARGIN_MS} ms")
+
+
+def profile_enable(enabled: bool = True) -> None:
+    """Turn hot-path profiling on or off."""
+    profiler.enabled = enabled
+    print(f"Profiling {'enabled' if enabled else 'disabled'}.")
+
+
+def profile_dump() -> None:
+    profiler.dump()
+
+
+def trace_start() -> None:
+    """Record actuations (outputs, raw current samples, labels) to flash."""
+    trace_log.enable()
+    trace_log.status()
+
+
+def trace_stop() -> None:
+    trace_log.disable()
+    trace_log.status()
+
+
+def trace_status() -> None:
+    trace_log.status()
+
+
+def profile_reset() -> None:
+    profiler.reset()
+    print("Profiler stats reset.")
+
+
+def shunt_raw_to_mA(raw: int) -> float:
+    """Convert a raw INA219 shunt reading (or a sum of them) to mA, at export time.
+
+    Integer uA conversion in the driver, then one float division (allocates).
+    """
+    return ina.shunt_raw_to_uA(raw) / 1000
+
+
+def fill_single_dot(dot_num: int, direction: Literal["up", "down"]) -> bytearray:
+    """Set `register_state` to drive only `dot_num` in `direction`. Returns it."""
+    for i in range(OUTPUT_COUNT):
+        register_state[i] = 0
+    register_state[SLOT_OUTPUTS[dot_num * 2 + DOT_ADDITION_CONSTANTS[direction]]] = 1
+    return register_state
+
+
+def begin_drive() -> None:
+    """Prepare for a drive: collect garbage now if needed, then disable the GC.
+
+    With the GC disabled, it cannot pause the drive. Call `end_drive()` after.
+    """
+    if gc.mem_free() < GC_MIN_FREE_BYTES:
+        gc.collect()
+    gc.disable()
+    global_store.drive_alloc_start = gc.mem_alloc()
+
+
+def end_drive() -> None:
+    """Clear the outputs, then re-enable the GC. Pair with `begin_drive()`."""
+    alloc_bytes = gc.mem_alloc() - global_store.drive_alloc_start
+    fast_clear_shift_register()
+    gc.enable()
+
+    if global_store.alloc_check:
+        assert alloc_bytes == 0, f"Allocated {alloc_bytes} bytes during drive."
+
+
+def alloc_check(enabled: bool = True) -> None:
+    """Test mode: raise if anything allocates between the frame request and clear."""
+    global_store.alloc_check = enabled
+    print(f"Drive allocation check {'enabled' if enabled else 'disabled'}.")
+
+
+def actuate(
+    state: bytearray | list[bool],
+    drive_ms: int,
+    log_period_ms: int = 250,
+    board: int = -1,
+) -> None:
+    """Drive the outputs in `state` for `drive_ms`, logging current, then clear.
+
+    Nothing between the latch and the clear allocates. Log summaries are recorded into
+    preallocated buffers during the drive, and printed after the clear.
+
+    Current is measured on `board` only, or on all boards round-robin (total) if -1.
+    """
+    current_logger.board = board
+    begin_drive()
+    try:
+        trace_log.drive(ARG_ALL_BOARDS if board < 0 else board, drive_ms)
+        trace_log.outputs(state)
+        set_shift_registers(state, drive_ms=drive_ms)
+        current_logger.log_for(drive_ms, max(log_period_ms, 1))
+    finally:
+        end_drive()
+    trace_log.end(current_logger.drive_us)
+    current_logger.flush()
+    trace_log.commit()
+
+
+def actuate_guarded(
+    state: bytearray | list[bool],
+    drive_ms: int,
+    log_period_ms: int = 250,
+    board: int = -1,
+) -> int:
+    """Drive the outputs in `state` like `actuate()`, within the supply's limits.
+
+    Outputs are driven in batches of at most `supply_guard.max_motors`. Within a batch,
+    motors are started `supply_guard.stagger_us` apart, and each start waits while the
+    bus voltage is sagging. The bus voltage is also watched for the rest of the drive,
+    and the limits are learned from it. Returns the number of batches.
+    """
+    for i in range(OUTPUT_COUNT):
+        pending_state[i] = state[i]
+    sensor = ina_bank.sensors[board if board >= 0 else 0]
+    batches = 0
+    while True:
+        for i in range(OUTPUT_COUNT):
+            if pending_state[i]:
+                break
+        else:
+            return batches
+        supply_guard.idle(sensor.bus_mV_int)
+        actuate_batch(drive_ms, log_period_ms, board)
+        batches += 1
+        if supply_guard.end():
+            supply_guard.save(SUPPLY_GUARD_PATH)
+            print(f"Supply limits: {json.dumps(supply_guard.status())}")
+
+
+def actuate_batch(drive_ms: int, log_period_ms: int, board: int) -> None:
+    """Start up to `supply_guard.max_motors` of the `pending_state` outputs, staggered.
+
+    Then drive them for `drive_ms`, and clear them from `pending_state`.
+    """
+    sensor = ina_bank.sensors[board if board >= 0 else 0]
+    current_logger.board = board
+    current_logger.supply_board = board if board >= 0 else 0
+    supply_guard.begin()
+    begin_drive()
+    try:
+        for i in range(OUTPUT_COUNT):
+            register_state[i] = 0
+        trace_log.drive(ARG_ALL_BOARDS if board < 0 else board, drive_ms)
+        start_us = time.ticks_us()
+        for i in range(OUTPUT_COUNT):
+            if not pending_state[i]:
+                continue
+            if supply_guard.motors >= supply_guard.max_motors:
+                break
+            if supply_guard.motors:
+                # Stagger the starts, and wait for the bus to recover from the last.
+                wait_start_us = time.ticks_us()
+                while (
+                    supply_guard.sample(sensor.bus_mV_int)
+                    or time.ticks_diff(time.ticks_us(), wait_start_us)
+                    < supply_guard.stagger_us
+                ) and (
+                    time.ticks_diff(time.ticks_us(), start_us)
+                    < SUPPLY_START_PHASE_MAX_US
+                ):
+                    pass
+                if (
+                    time.ticks_diff(time.ticks_us(), start_us)
+                    >= SUPPLY_START_PHASE_MAX_US
+                ):
+                    break  # The rest go in the next batch.
+            register_state[i] = 1
+            pending_state[i] = 0
+            # Re-armed at each start: the deadline follows the last one.
+            set_shift_registers(register_state, drive_ms=drive_ms)
+            supply_guard.started()
+        trace_log.outputs(register_state)
+        current_logger.log_for(drive_ms, max(log_period_ms, 1))
+    finally:
+        end_drive()
+        current_logger.supply_board = -1
+    trace_log.end(current_logger.drive_us)
+    current_logger.flush()
+    trace_log.commit()
+
+
+def expected_travel(dot_num: int, direction: Literal["up", "down"]) -> int:
+    """Whether `dot_num` should move when driven `direction`, from its last position."""
+    position = dot_positions[dot_num]
+    if position == DOT_POSITION_UNKNOWN:
+        return TRAVEL_UNKNOWN
+    target = DOT_POSITION_UP if direction == "up" else DOT_POSITION_DOWN
+    return TRAVEL_NO if position == target else TRAVEL_YES
+
+
+def record_dot_label(dot_num: int, direction: Literal["up", "down"]) -> int:
+    """Store the classifier's result for `dot_num`, and warn on faults."""
+    label = classifier.label
+    dot_labels[dot_num] = label
+
+    if label == LABEL_OK or label == LABEL_AT_END_STOP:
+        dot_positions[dot_num] = (
+            DOT_POSITION_UP if direction == "up" else DOT_POSITION_DOWN
+        )
+    else:
+        dot_positions[dot_num] = DOT_POSITION_UNKNOWN
+
+    if label in FAULT_LABELS:
+        dot_fault_counts[dot_num] += 1
+        print(f"WARNING: Dot #{dot_num} '{direction}': {LABEL_NAMES[label]}.")
+    return label
+
+
+def actuate_dot(
+    dot_num: int,
+    direction: Literal["up", "down"],
+    drive_ms: int,
+    log_period_ms: int = 250,
+) -> int:
+    """Drive a single dot, and classify its current signature. Returns the label."""
+    fill_single_dot(dot_num, direction)
+    expect_travel = expected_travel(dot_num, direction)
+    classifier.start(expect_travel)
+    current_logger.dot = dot_num
+    current_logger.direction = direction
+    try:
+        actuate(register_state, drive_ms, log_period_ms, board_for_dot(dot_num))
+    finally:
+        classifier.active = False
+        current_logger.dot = -1
+    classifier.finish(current_logger.drive_us)
+    trace_log.label(
+        dot_num,
+        DOT_ADDITION_CONSTANTS[direction],
+        classifier.label,
+        expect_travel,
+        classifier.knee_us,
+    )
+    trace_log.commit()
+
+    summary = classifier.summary()
+    summary["dot"] = dot_num
+    summary["direction"] = direction
+    print(json.dumps(summary))
+    label = record_dot_label(dot_num, direction)
+    update_drive_tuning(dot_num, direction, drive_ms)
+    return label
+
+
+def update_drive_tuning(
+    dot_num: int, direction: Literal["up", "down"], drive_ms: int
+) -> None:
+    """Learn from the last classified actuation of `dot_num`."""
+    slot = dot_num * 2 + DOT_ADDITION_CONSTANTS[direction]
+    if classifier.label == LABEL_OK:
+        drive_tuner.record_completion(slot, (classifier.knee_us + 999) // 1000)
+    elif (
+        classifier.label == LABEL_INCOMPLETE
+        and classifier.plateau_seen
+        and drive_ms >= drive_tuner.drive_ms(slot)
+    ):
+        # Only a sign of a too-short drive if the motor was running (not a short
+        # stall at an end stop, still in the inrush), and was driven the learned time.
+        drive_tuner.record_incomplete(slot)
+
+    if drive_tuner.drifting[slot]:
+        print(
+            f"WARNING: Dot #{dot_num} '{direction}' completion time drifted from "
+            f"{drive_tuner.baseline_ms[slot]} ms."
+        )
+
+
+def drive_tuning() -> None:
+    """Print the learned drive time of each dot, per direction."""
+    for dot_num in range(DOT_COUNT):
+        parts = []
+        for direction in ("down", "up"):
+            slot = dot_num * 2 + DOT_ADDITION_CONSTANTS[direction]
+            drift = " DRIFTING" if drive_tuner.drifting[slot] else ""
+            parts.append(
+                f"{direction}={drive_tuner.drive_ms(slot)} ms "
+                f"(baseline {drive_tuner.baseline_ms[slot]} ms{drift})"
+            )
+        print(f"Dot {dot_num}: {', '.join(parts)}")
+
+
+def save_drive_tuning() -> None:
+    drive_tuner.save(DRIVE_TUNING_PATH)
+    print(f"Saved drive tuning to {DRIVE_TUNING_PATH}.")
+
+
+def reset_drive_baseline(dot_num: int) -> None:
+    """Accept the current completion times of `dot_num` as normal (clears drift)."""
+    for direction in ("down", "up"):
+        drive_tuner.reset_baseline(dot_num * 2 + DOT_ADDITION_CONSTANTS[direction])
+
+
+def dot_health() -> None:
+    """Print the last classification and fault count of each dot."""
+    for dot_num in range(DOT_COUNT):
+        print(
+            f"Dot {dot_num}: last={LABEL_NAMES[dot_labels[dot_num]]}, "
+            f"faults={dot_fault_counts[dot_num]}"
+        )
+
+
+def supply_status() -> None:
+    """Print the supply limits learned from bus voltage sag."""
+    supply_guard.idle(ina.bus_mV_int)
+    print(json.dumps(supply_guard.status()))
+
+
+def supply_reset(sag_limit_mV: int = 400) -> None:
+    """Forget the learned supply limits (e.g., after connecting another supply)."""
+    supply_guard.sag_limit_mV = sag_limit_mV
+    supply_guard.reset()
+    supply_guard.save(SUPPLY_GUARD_PATH)
+    supply_status()
+
 
 def set_all_to_each_state(
     duration_each_state_ms: int = 500, pause_duration_ms: int = 100
@@ -158,32 +739,33 @@ def set_all_to_each_state(
     for state in ("down", "up"):
         print(f"Setting all outputs to {state}.")
 
-        outputs = [(i % 2 == DOT_ADDITION_CONSTANTS[state]) for i in range(48)]
-        set_shift_registers(outputs)
-        sleep_ms_and_log_ina_json(duration_each_state_ms)
+        for slot in range(DOT_COUNT * 2):
+            register_state[SLOT_OUTPUTS[slot]] = (
+                slot % 2 == DOT_ADDITION_CONSTANTS[state]
+            )
+        actuate_guarded(register_state, duration_each_state_ms)
 
         # Pause for a sec with outputs off.
-        fast_clear_shift_register()
-
         if state == "down":
             time.sleep_ms(pause_duration_ms)
 
 
 def set_dot(
-    dot_num: int, direction: Literal["up", "down"], duration_ms: int = 0
+    dot_num: int, direction: Literal["up", "down"], duration_ms: int | None = None
 ) -> None:
-    register_state = [False] * 48
-    register_state[dot_num * 2 + DOT_ADDITION_CONSTANTS[direction]] = True
-
-    set_shift_registers(register_state)
-
-    sleep_ms_and_log_ina_json(duration_ms, log_period_ms=int(round(duration_ms / 15)))
-
-    fast_clear_shift_register()
+    """Move one dot. Without `duration_ms`, its learned drive time is used."""
+    if duration_ms is None:
+        duration_ms = drive_tuner.drive_ms(
+            dot_num * 2 + DOT_ADDITION_CONSTANTS[direction]
+        )
+    actuate_dot(dot_num, direction, duration_ms, log_period_ms=duration_ms // 15)
 
 
 def cycle_dot(
-    dot_num: int, duration_ms: int = 0, count: int = 10, pause_ms: int = 1000
+    dot_num: int,
+    duration_ms: int | None = None,
+    count: int = 10,
+    pause_ms: int = 1000,
 ) -> None:
     for i in range(count):
         set_dot(dot_num, "down", duration_ms)
@@ -192,6 +774,136 @@ def cycle_dot(
         time.sleep_ms(pause_ms)
 
 
+def endurance(
+    cycles: int = 10_000,
+    dots: list[int] | None = None,
+    max_concurrent: int = 1,
+    board_budget_mA: int = 600,
+    max_duty_pct: int = 20,
+) -> None:
+    """Cycle many dots at once, interleaved: each dot rests while others move.
+
+    See `endurance.py` for the duty-cycle, thermal and current-budget limits. The run
+    is checkpointed to flash; continue it with `endurance_resume()`.
+    """
+    run = EnduranceRun(
+        list(range(DOT_COUNT)) if dots is None else dots,
+        cycles,
+        dot_count=DOT_COUNT,
+        dots_per_board=DOTS_PER_BOARD,
+        max_duty_pct=max_duty_pct,
+        board_budget_mA=board_budget_mA,
+        max_concurrent=max_concurrent,
+    )
+    global_store.endurance_run = run
+    run_endurance(run)
+
+
+def endurance_resume() -> None:
+    """Continue the endurance run saved in flash (e.g., after a reboot)."""
+    run = global_store.endurance_run or EnduranceRun.load(ENDURANCE_CHECKPOINT_PATH)
+    if run is None:
+        print(f"No endurance run to resume in {ENDURANCE_CHECKPOINT_PATH}.")
+        return
+    global_store.endurance_run = run
+    run_endurance(run)
+
+
+def endurance_status() -> None:
+    """Print the per-dot results of the current (or saved) endurance run."""
+    run = global_store.endurance_run or EnduranceRun.load(ENDURANCE_CHECKPOINT_PATH)
+    if run is None:
+        print("No endurance run.")
+        return
+    for dot_num in range(run.dot_count):
+        if run.active[dot_num]:
+            print(json.dumps(run.dot_summary(dot_num)))
+    print(
+        f"{run.completed_cycles()}/{run.target_cycles()} cycles, "
+        f"{run.now_ms // 1000} s of run time."
+    )
+
+
+def run_endurance(run: EnduranceRun) -> None:
+    """Drive the moves scheduled by `run` until it's done. Both buttons: stop."""
+    frame: list[int] = []
+    last_ms = time.ticks_ms()
+    last_checkpoint_ms = run.now_ms
+    last_progress_ms = run.now_ms
+    start_cycles = run.completed_cycles()
+    start_run_ms = run.now_ms
+    print(f"Endurance run: {start_cycles}/{run.target_cycles()} cycles done.")
+
+    try:
+        while not run.done():
+            if PIN_SW1.value() == 0 and PIN_SW2.value() == 0:
+                print("Both buttons pressed. Stopping.")
+                break
+            now_ms = time.ticks_ms()
+            run.advance(time.ticks_diff(now_ms, last_ms))
+            last_ms = now_ms
+
+            wait_ms = run.next_frame(frame)
+            if wait_ms:
+                time.sleep_ms(min(wait_ms, 100))
+                continue
+
+            if len(frame) == 1:
+                dot_num = frame[0]
+                direction = run.direction(dot_num)
+                drive_ms = drive_tuner.drive_ms(run.slot(dot_num))
+                label = actuate_dot(dot_num, direction, drive_ms, drive_ms)
+                run.record_solo(
+                    dot_num,
+                    current_logger.drive_us // 1000,
+                    label,
+                    classifier.raw_to_mA(classifier.peak_raw),
+                    classifier.raw_to_mA(classifier.plateau_raw),
+                    classifier.knee_us // 1000 if classifier.knee_us >= 0 else -1,
+                )
+                if run.failed_at_cycle[dot_num] >= 0:
+                    print(
+                        f"WARNING: Dot #{dot_num} retired after repeated faults, "
+                        f"at cycle {run.failed_at_cycle[dot_num]}."
+                    )
+            else:
+                for i in range(OUTPUT_COUNT):
+                    register_state[i] = 0
+                drive_ms = 0
+                board = board_for_dot(frame[0])
+                for dot_num in frame:
+                    slot = run.slot(dot_num)
+                    register_state[SLOT_OUTPUTS[slot]] = 1
+                    drive_ms = max(drive_ms, drive_tuner.drive_ms(slot))
+                    dot_positions[dot_num] = DOT_POSITION_UNKNOWN
+                    if board_for_dot(dot_num) != board:
+                        board = -1  # Total of all boards.
+                actuate_guarded(register_state, drive_ms, drive_ms, board)
+                for dot_num in frame:
+                    run.record_shared(dot_num, current_logger.drive_us // 1000)
+
+            if run.now_ms - last_progress_ms >= ENDURANCE_PROGRESS_INTERVAL_MS:
+                last_progress_ms = run.now_ms
+                cycles = run.completed_cycles()
+                elapsed_ms = max(run.now_ms - start_run_ms, 1)
+                rate = (cycles - start_cycles) * 1000 / elapsed_ms
+                remaining_s = (run.target_cycles() - cycles) / max(rate, 1e-6)
+                print(
+                    f"Endurance: {cycles}/{run.target_cycles()} cycles, "
+                    f"{rate:.2f} cycles/s, ~{remaining_s / 3600:.1f} h left."
+                )
+            if run.now_ms - last_checkpoint_ms >= ENDURANCE_CHECKPOINT_INTERVAL_MS:
+                last_checkpoint_ms = run.now_ms
+                run.save(ENDURANCE_CHECKPOINT_PATH)
+    except KeyboardInterrupt:
+        print("Interrupted.")
+    finally:
+        fast_clear_shift_register()
+        run.save(ENDURANCE_CHECKPOINT_PATH)
+        print(f"Saved the endurance run to {ENDURANCE_CHECKPOINT_PATH}.")
+    endurance_status()
+
+
 def respond_to_buttons_single_dot(dot_num: int) -> None:
     """Respond to the button presses by setting the state of `dot_num`."""
 
@@ -211,25 +923,155 @@ def respond_to_buttons_single_dot(dot_num: int) -> None:
     else:
         return
 
-    register_state = [False] * 48
-    register_state[(dot_num * 2) + DOT_ADDITION_CONSTANTS[direction]] = True
-
-    # print(f"Setting shift registers: {register_state}")
-    set_shift_registers(register_state)
-
-    sleep_ms_and_log_ina_json(
-        ACTION_TIME_MS, log_period_ms=int(round(ACTION_TIME_MS / 15))
-    )
+    actuate_dot(dot_num, direction, ACTION_TIME_MS, log_period_ms=ACTION_TIME_MS // 15)
 
-    fast_clear_shift_register()
     print("Waiting for debounce.")
     time.sleep_ms(DEBOUNCE_TIME_MS)
     PIN_GP_LED_0.low()
     PIN_GP_LED_1.low()
 
 
+def fill_frame_transition(prev_frame: int, frame: int) -> int:
+    """Set `register_state` to move the dots from `prev_frame` to `frame`.
+
+    Frame bit `n` is the raised (up) state of dot `n`. Returns the number of dots that
+    need to move.
+    """
+    flips = 0
+    for dot_num in range(DOT_COUNT):
+        bit = 1 << dot_num
+        changed = (prev_frame ^ frame) & bit
+        up = SLOT_OUTPUTS[dot_num * 2 + DOT_ADDITION_CONSTANT_UP]
+        down = SLOT_OUTPUTS[dot_num * 2 + DOT_ADDITION_CONSTANT_DOWN]
+        register_state[up] = bool(changed & frame)
+        register_state[down] = bool(changed & prev_frame)
+        if changed:
+            flips += 1
+    return flips
+
+
+def read_text(text: str, duration_ms: int = 50, cell_count: int = 4) -> None:
+    """Show `text` as braille, one page at a time.
+
+    SW1: next page. SW2: previous page. Both: exit. The next page is laid out while
+    the current one is being read.
+    """
+    if cell_count * 6 > DOT_COUNT:
+        raise ValueError("Not enough dots for that many cells.")
+
+    pager = Pager(text, cell_count)
+    if not pager.prefetch(0):
+        print("Nothing to show.")
+        return
+
+    # Dot states are unknown at the start, so drive every dot for the first page.
+    displayed = pager.frames[0] ^ ((1 << (cell_count * 6)) - 1)
+    page_index = 0
+    pages_shown = 0
+    dots_flipped = 0
+    start_time_ms = time.ticks_ms()
+
+    while True:
+        frame = pager.frames[page_index]
+        flips = fill_frame_transition(displayed, frame)
+        if flips:
+            actuate_guarded(register_state, duration_ms, log_period_ms=duration_ms)
+            for dot_num in range(cell_count * 6):
+                dot_positions[dot_num] = (
+                    DOT_POSITION_UP if frame >> dot_num & 1 else DOT_POSITION_DOWN
+                )
+        displayed = frame
+        pages_shown += 1
+        dots_flipped += flips
+        print(f"Page {page_index + 1} ({flips} dots moved).")
+
+        # Plan the next page while this one is being read.
+        has_next_page = pager.prefetch(page_index + 1)
+
+        while True:
+            if PIN_SW1.value() == 0 or PIN_SW2.value() == 0:
+                time.sleep_ms(50)  # Give time for a two-button press.
+                sw1 = PIN_SW1.value()
+                sw2 = PIN_SW2.value()
+                if sw1 == 0 and sw2 == 0:
+                    break
+                if sw1 == 0 and has_next_page:
+                    page_index += 1
+                    break
+                if sw2 == 0 and page_index > 0:
+                    page_index -= 1
+                    break
+            time.sleep_ms(20)
+
+        if sw1 == 0 and sw2 == 0:
+            break
+        time.sleep_ms(200)  # Debounce.
+
+    elapsed_ms = time.ticks_diff(time.ticks_ms(), start_time_ms)
+    print(f"Showed {pages_shown} pages, moving {dots_flipped} dots.")
+    print(f"Throughput: {pages_shown * 60_000 / max(elapsed_ms, 1):.1f} pages/min.")
+
+
+def play_schedule(path: str) -> None:
+    """Play back an actuation schedule compiled on the host.
+
+    Compile it with `host_tools/schedule_compiler.py` and copy it to the board first
+    (e.g., `mpremote cp frames.bds :`). All planning was done on the host, so playback
+    only latches each event's state at its time.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, version, state_bytes, event_count = struct.unpack_from(
+        SCHEDULE_HEADER_FORMAT, data
+    )
+    if magic != SCHEDULE_MAGIC or version != SCHEDULE_VERSION:
+        raise ValueError("Not a supported schedule file.")
+    if state_bytes * 8 != len(register_state):
+        raise ValueError("Schedule is for a different number of outputs.")
+    if event_count == 0:
+        return
+
+    # Decode the event times up front, so that the playback loop only reads ints.
+    record_bytes = SCHEDULE_TIME_BYTES + state_bytes
+    times_us = array("i", [0] * event_count)
+    for i in range(event_count):
+        offset = SCHEDULE_HEADER_BYTES + i * record_bytes
+        times_us[i] = int.from_bytes(data[offset : offset + 4], "little")
+    total_ms = times_us[event_count - 1] // 1000 + 1
+    print(f"Playing {event_count} events over {total_ms} ms.")
+
+    max_late_us = 0
+    late_us = 0
+    begin_drive()
+    try:
+        safety_cutoff.arm(total_ms)
+        trace_log.drive(ARG_ALL_BOARDS, total_ms)
+        start_us = time.ticks_us()
+        for i in range(event_count):
+            event_us = times_us[i]
+            while time.ticks_diff(time.ticks_us(), start_us) < event_us:
+                pass
+            state_offset = (
+                SCHEDULE_HEADER_BYTES + i * record_bytes + SCHEDULE_TIME_BYTES
+            )
+            set_shift_registers_packed(data, state_offset)
+            late_us = time.ticks_diff(time.ticks_us(), start_us) - event_us
+            if late_us > max_late_us:
+                max_late_us = late_us
+            trace_log.outputs_packed(
+                data, state_offset, state_bytes, event_us + late_us
+            )
+    finally:
+        end_drive()
+    trace_log.end(times_us[event_count - 1] + late_us)
+    trace_log.commit()
+
+    print(f"Schedule done. Max event lateness: {max_late_us} us.")
+
+
 def demo_each_dot_one_by_one() -> None:
-    for dot_num in range(24):
+    for dot_num in range(DOT_COUNT):
         print(f"Dot {dot_num} - down")
         set_dot(dot_num, "down", duration_ms=1000)
 
@@ -244,16 +1086,17 @@ def log_ina_json(
         Literal["current_mA", "bus_voltage_mV", "shunt_voltage_mV"], ...
     ] = ("current_mA",),
 ) -> None:
-    shunt_mV = ina.shunt_voltage * 1000
+    # Read as ints (no allocation), and convert to floats only for the export.
+    shunt_raw = ina.shunt_raw
 
     data = {}
 
     if "current_mA" in enable_fields:
-        data["current_mA"] = shunt_mV / INA_SHUNT_OMHS
+        data["current_mA"] = ina.shunt_raw_to_uA(shunt_raw) / 1000
     if "bus_voltage_mV" in enable_fields:
-        data["bus_voltage_mV"] = ina.bus_voltage
+        data["bus_voltage_mV"] = ina.bus_mV_int
     if "shunt_voltage_mV" in enable_fields:
-        data["shunt_voltage_mV"] = shunt_mV
+        data["shunt_voltage_mV"] = shunt_raw * INA_SHUNT_LSB_UV / 1000
 
     if timestamp_ms is not None:
         data["timestamp_ms"] = timestamp_ms
@@ -261,47 +1104,267 @@ def log_ina_json(
     print(json.dumps(data))
 
 
-def sleep_ms_and_log_ina_json(sleep_time_ms: int, log_period_ms: int = 250) -> None:
-    start_time_ms = time.ticks_ms()
+class CurrentEnvelopeLogger:
+    """Full-rate current sampling, emitted as decimated per-window JSON summaries.
 
-    while True:
-        current_time_ms = time.ticks_ms()
-        elapsed_time_ms = time.ticks_diff(current_time_ms, start_time_ms)
+    Every INA219 reading is folded into the current window (min/max/mean current, and
+    charge, the integral of current over time). Windows are stretched when needed so
+    that the printed output stays within `budget_bytes_per_s` (token bucket, with up
+    to 1 second of burst).
 
-        if elapsed_time_ms >= sleep_time_ms:
-            break  # Stop when the total sleep time has elapsed
+    Sampling (`log_for()`) does not allocate: readings are kept as raw ints, and the
+    closed windows go into preallocated arrays. `flush()` prints them afterwards.
+    """
 
-        log_ina_json(elapsed_time_ms)
+    def __init__(self, budget_bytes_per_s: int = LOG_OUTPUT_BUDGET_BYTES_PER_S) -> None:
+        self.budget_bytes_per_s = budget_bytes_per_s
+        self.tokens_bytes = budget_bytes_per_s
+        self.last_refill_ms = time.ticks_ms()
+        self.refill_remainder = 0  # In bytes * ms / s, below one byte.
+        self.last_line_bytes = 100  # Estimate, updated after each line.
+        self.lines_emitted = 0
+        self.bytes_emitted = 0
+        self.drive_us = 0  # Actual sampling time of the last `log_for()`.
+        self.board = -1  # Board to sample. -1: all boards, round-robin (total).
+        # Dot being driven, added to the summaries for host-side ingestion. -1: none.
+        self.dot = -1
+        self.direction = ""
+        # Board whose bus voltage is passed to `supply_guard` during sampling. -1: none.
+        self.supply_board = -1
+
+        # Raw shunt LSB * us per uC of charge.
+        self.charge_unit = INA_SHUNT_MILLIOHMS * 1_000_000 // (INA_SHUNT_LSB_UV * 1000)
+
+        # Closed windows, waiting for `flush()`.
+        self.window_count = 0
+        self.win_start_ms = array("i", [0] * LOG_MAX_WINDOWS_PER_DRIVE)
+        self.win_end_ms = array("i", [0] * LOG_MAX_WINDOWS_PER_DRIVE)
+        self.win_samples = array("i", [0] * LOG_MAX_WINDOWS_PER_DRIVE)
+        self.win_min_raw = array("i", [0] * LOG_MAX_WINDOWS_PER_DRIVE)
+        self.win_max_raw = array("i", [0] * LOG_MAX_WINDOWS_PER_DRIVE)
+        self.win_sum_raw = array("i", [0] * LOG_MAX_WINDOWS_PER_DRIVE)
+        self.win_charge_uC = array("i", [0] * LOG_MAX_WINDOWS_PER_DRIVE)
+
+        self._reset_window(0)
+
+    def _reset_window(self, start_ms: int) -> None:
+        self.window_start_ms = start_ms
+        self.sample_count = 0
+        self.min_raw = 0
+        self.max_raw = 0
+        self.sum_raw = 0
+        self.charge_uC = 0
+        self.charge_remainder = 0  # In raw * us, below one `charge_unit`.
+
+    def _refill(self) -> None:
+        now_ms = time.ticks_ms()
+        # Capped (enough to refill, even after a debt) so the product is a small int.
+        elapsed_ms = min(time.ticks_diff(now_ms, self.last_refill_ms), 10_000)
+        self.last_refill_ms = now_ms
+        # Keep the fraction of a byte, as refills can be only ms apart.
+        credit = self.refill_remainder + self.budget_bytes_per_s * elapsed_ms
+        self.refill_remainder = credit % 1000
+        self.tokens_bytes += credit // 1000
+        if self.tokens_bytes >= self.budget_bytes_per_s:
+            self.tokens_bytes = self.budget_bytes_per_s
+            self.refill_remainder = 0
+
+    def _close_window(self, end_ms: int) -> None:
+        if self.sample_count == 0:
+            return
+
+        # May go negative on a forced close. The debt is paid off by later windows.
+        self.tokens_bytes -= self.last_line_bytes
+
+        i = self.window_count
+        self.win_start_ms[i] = self.window_start_ms
+        self.win_end_ms[i] = end_ms
+        self.win_samples[i] = self.sample_count
+        self.win_min_raw[i] = self.min_raw
+        self.win_max_raw[i] = self.max_raw
+        self.win_sum_raw[i] = self.sum_raw
+        self.win_charge_uC[i] = self.charge_uC
+        self.window_count = i + 1
+
+    def log_for(self, duration_ms: int, window_ms: int) -> None:
+        """Sample for `duration_ms`, closing a summary window at most every `window_ms`.
+
+        Does not allocate. Call `flush()` afterwards to print the summaries.
+        """
+        start_us = time.ticks_us()
+        last_sample_us = start_us
+        elapsed_us = 0
+        charge_unit = self.charge_unit
+        trace_board = self.board if self.board >= 0 else ARG_ALL_BOARDS
+        last_window = LOG_MAX_WINDOWS_PER_DRIVE - 1
+        bus_countdown = SUPPLY_BUS_SAMPLE_EVERY
+        self._reset_window(0)
+
+        while True:
+            now_us = time.ticks_us()
+            elapsed_us = time.ticks_diff(now_us, start_us)
+            elapsed_ms = elapsed_us // 1000
+            if elapsed_ms >= duration_ms:
+                break
+
+            profiler.start(PROF_INA_SAMPLE)
+            if self.board >= 0:
+                raw = ina_bank.read(self.board)
+            else:
+                raw = ina_bank.read_next()
+            profiler.stop(PROF_INA_SAMPLE)
+            trace_log.sample(trace_board, raw, elapsed_us)
+
+            if self.supply_board >= 0:
+                bus_countdown -= 1
+                if bus_countdown == 0:
+                    bus_countdown = SUPPLY_BUS_SAMPLE_EVERY
+                    supply_guard.sample(ina_bank.sensors[self.supply_board].bus_mV_int)
+
+            if classifier.active:
+                label = classifier.add_sample(raw, elapsed_us)
+                # Not `in (...)`: that tuple of globals would be allocated per sample.
+                if STOP_DRIVE_ON_STALL and label != LABEL_PENDING and label != LABEL_OK:
+                    duration_ms = elapsed_ms
+                    break
+
+            if self.sample_count == 0:
+                self.min_raw = raw
+                self.max_raw = raw
+            elif raw < self.min_raw:
+                self.min_raw = raw
+            elif raw > self.max_raw:
+                self.max_raw = raw
+            self.sum_raw += raw
+            self.sample_count += 1
+
+            # Clamp dt so the product stays a small int, even after a long stall.
+            dt_us = min(time.ticks_diff(now_us, last_sample_us), 20_000)
+            last_sample_us = now_us
+            charge = self.charge_remainder + raw * dt_us
+            whole_uC = charge // charge_unit
+            self.charge_uC += whole_uC
+            self.charge_remainder = charge - whole_uC * charge_unit
+
+            if self.window_count < last_window and (
+                self.sample_count >= LOG_MAX_SAMPLES_PER_WINDOW
+                or elapsed_ms - self.window_start_ms >= window_ms
+            ):
+                self._refill()
+                if (
+                    self.tokens_bytes >= self.last_line_bytes
+                    or self.sample_count >= LOG_MAX_SAMPLES_PER_WINDOW
+                ):
+                    self._close_window(elapsed_ms)
+                    self._reset_window(elapsed_ms)
+
+        # Always close the tail, so every actuation gets at least one summary.
+        self._close_window(duration_ms)
+        self._refill()
+        self.drive_us = elapsed_us
+
+    def flush(self) -> None:
+        """Print the windows recorded by `log_for()` as JSON lines. Allocates."""
+        profiler.start(PROF_LOG_EMIT)
+        for i in range(self.window_count):
+            samples = self.win_samples[i]
+            data = {
+                "timestamp_ms": self.win_start_ms[i],
+                "duration_ms": self.win_end_ms[i] - self.win_start_ms[i],
+                "samples": samples,
+                "min_mA": round(shunt_raw_to_mA(self.win_min_raw[i]), 1),
+                "max_mA": round(shunt_raw_to_mA(self.win_max_raw[i]), 1),
+                "mean_mA": round(shunt_raw_to_mA(self.win_sum_raw[i]) / samples, 1),
+                "charge_uC": self.win_charge_uC[i],
+            }
+            if self.dot >= 0:
+                data["dot"] = self.dot
+                data["direction"] = self.direction
+            line = json.dumps(data)
+            print(line)
+
+            self.last_line_bytes = len(line) + 1
+            self.lines_emitted += 1
+            self.bytes_emitted += self.last_line_bytes
+            profiler.count(PROF_COUNT_LOG_BYTES, self.last_line_bytes)
+        self.window_count = 0
+        profiler.stop(PROF_LOG_EMIT)
+
+
+current_logger = CurrentEnvelopeLogger()
+
+
+def set_log_budget(bytes_per_s: int = LOG_OUTPUT_BUDGET_BYTES_PER_S) -> None:
+    """Set the output budget for current logging, in bytes per second."""
+    current_logger.budget_bytes_per_s = bytes_per_s
+    current_logger.tokens_bytes = min(current_logger.tokens_bytes, bytes_per_s)
+    print(f"Log budget: {bytes_per_s} bytes/s.")
+    print(
+        f"Logged so far: {current_logger.lines_emitted} lines, "
+        f"{current_logger.bytes_emitted} bytes."
+    )
 
-        # Calculate the remaining time
-        next_log_time_ms = time.ticks_add(
-            start_time_ms, elapsed_time_ms + log_period_ms
-        )
-        remaining_time_ms = time.ticks_diff(next_log_time_ms, time.ticks_ms())
 
-        if remaining_time_ms > 0:
-            time.sleep_ms(min(remaining_time_ms, sleep_time_ms - elapsed_time_ms))
+def sleep_ms_and_log_ina_json(sleep_time_ms: int, log_period_ms: int = 250) -> None:
+    """Sample current at full rate for `sleep_time_ms`, logging decimated summaries.
 
+    Args:
+        sleep_time_ms: total time to sample for.
+        log_period_ms: minimum window length of each summary line. Windows are
+            stretched further if needed to stay within the logging output budget.
+    """
+    current_logger.log_for(sleep_time_ms, max(log_period_ms, 1))
+    current_logger.flush()
+
+
+# Running [min, max, sum, count] of raw shunt readings, from `sample_ina_stats()`.
+ina_stats_raw = array("i", [0, 0, 0, 0])
 
-def sleep_ms_and_get_ina_stats_mA(sleep_time_ms: int) -> dict[str, float]:
-    start_time_ms = time.ticks_ms()
-    current_values_mA = []
-    while True:
-        current_values_mA.append(ina.shunt_voltage * 1000 / INA_SHUNT_OMHS)
-        current_time_ms = time.ticks_ms()
-        elapsed_time_ms = time.ticks_diff(current_time_ms, start_time_ms)
 
-        if elapsed_time_ms >= sleep_time_ms:
+def sample_ina_stats(sleep_time_ms: int, board: int = 0) -> None:
+    """Sample `board`'s current for `sleep_time_ms` into `ina_stats_raw`.
+
+    `board` -1: all boards, round-robin (total). Does not allocate.
+    """
+    start_time_us = time.ticks_us()
+    ina_stats_raw[3] = 0
+    while True:
+        raw = ina_bank.read(board) if board >= 0 else ina_bank.read_next()
+        elapsed_time_us = time.ticks_diff(time.ticks_us(), start_time_us)
+        if classifier.active:
+            classifier.add_sample(raw, elapsed_time_us)
+        if ina_stats_raw[3] == 0:
+            ina_stats_raw[0] = raw
+            ina_stats_raw[1] = raw
+            ina_stats_raw[2] = 0
+        elif raw < ina_stats_raw[0]:
+            ina_stats_raw[0] = raw
+        elif raw > ina_stats_raw[1]:
+            ina_stats_raw[1] = raw
+        ina_stats_raw[2] += raw
+        ina_stats_raw[3] += 1
+
+        if elapsed_time_us >= sleep_time_ms * 1000:
             break
 
+
+def ina_stats_mA() -> dict[str, float]:
+    """Convert the last `sample_ina_stats()` result to mA."""
     return {
-        "min": min(current_values_mA),
-        "max": max(current_values_mA),
-        "avg": sum(current_values_mA) / len(current_values_mA),
-        "data_points": len(current_values_mA),
+        "min": shunt_raw_to_mA(ina_stats_raw[0]),
+        "max": shunt_raw_to_mA(ina_stats_raw[1]),
+        "avg": shunt_raw_to_mA(ina_stats_raw[2]) / ina_stats_raw[3],
+        "data_points": ina_stats_raw[3],
     }
 
 
+def sleep_ms_and_get_ina_stats_mA(
+    sleep_time_ms: int, board: int = 0
+) -> dict[str, float]:
+    sample_ina_stats(sleep_time_ms, board)
+    return ina_stats_mA()
+
+
 def minimum_measure_time() -> None:
     """Measure the minimum time it takes to log INA219 data."""
     start_time_us = time.ticks_us()
@@ -314,17 +1377,25 @@ def minimum_measure_time() -> None:
 def self_test_each_dot(duration_per_dot_ms: int = 10) -> None:
     dot_pass_list = []
     dot_fail_list = []
-    for dot_num in range(24):
+    for dot_num in range(DOT_COUNT):
         dot_failed = False
 
         for direction in ("down", "up"):
             print(f"Dot {dot_num} - {direction}")
-            register_state = [False] * 48
-            register_state[dot_num * 2 + DOT_ADDITION_CONSTANTS[direction]] = True
-            set_shift_registers(register_state)
-            stats_mA = sleep_ms_and_get_ina_stats_mA(duration_per_dot_ms)
+            fill_single_dot(dot_num, direction)
+            classifier.start(expected_travel(dot_num, direction))
+            begin_drive()
+            try:
+                set_shift_registers(register_state, drive_ms=duration_per_dot_ms)
+                sample_ina_stats(duration_per_dot_ms, board_for_dot(dot_num))
+            finally:
+                end_drive()
+                classifier.active = False
+            classifier.finish(duration_per_dot_ms * 1000)
+            stats_mA = ina_stats_mA()
             print(f"    Stats (mA): {json.dumps(stats_mA)}")
-            if stats_mA["max"] < 20:
+            print(f"    Signature: {json.dumps(classifier.summary())}")
+            if record_dot_label(dot_num, direction) in FAULT_LABELS:
                 print(f"WARNING: Dot #{dot_num} '{direction}' failed self-test.")
                 dot_failed = True
 
@@ -380,10 +1451,43 @@ Available commands:
         -> Set all outputs to each state in turn, starting with high-impedance, then down, then up.
     - self_test_each_dot(duration_per_dot_ms: int = 10) -> None
         -> Test each dot by setting it to down and up for a short duration.
-        -> Prints a list of passing and failing dots, based on those that draw current.
+        -> Prints a list of passing and failing dots, based on their current signature.
     - self_test_lights_and_buttons()
-    - set_dot(dot_num: int, direction: "up"/"down", duration_ms: int = 0) -> None:
-    - cycle_dot(dot_num: int, duration_ms: int = 0, count: int = 10, pause_ms: int = 1000) -> None:
+    - ina_boards()
+        -> Print the current measured by each board's INA219, and detected resets.
+    - dot_health()
+        -> Print the current-signature label (ok/open/short/stuck/...) of each dot.
+        -> Thresholds tuned with `host_tools/detector_bench.py` are loaded at init
+           from classifier_params.json.
+    - supply_status(), supply_reset(sag_limit_mV: int = 400)
+        -> Show/forget how many motors the supply can start at once, learned from bus
+           voltage sag. Multi-dot drives are batched and staggered to stay within it.
+    - set_dot(dot_num: int, direction: "up"/"down", duration_ms: int | None = None) -> None:
+        -> Without duration_ms, uses the dot's learned drive time.
+    - cycle_dot(dot_num: int, duration_ms: int | None = None, count: int = 10, pause_ms: int = 1000) -> None:
+    - endurance(cycles: int = 10_000, dots: list[int] | None = None, max_concurrent: int = 1, board_budget_mA: int = 600, max_duty_pct: int = 20) -> None
+        -> Cycle many dots, interleaved within duty-cycle/thermal/current limits.
+        -> Checkpointed to flash. Both buttons: stop.
+    - endurance_resume(), endurance_status()
+        -> Continue the saved endurance run, or print its per-dot stats.
+    - drive_tuning(), save_drive_tuning(), reset_drive_baseline(dot_num: int)
+        -> Show/save the learned per-dot drive times, or accept a drifted dot as normal.
+    - set_log_budget(bytes_per_s: int = 2000) -> None
+        -> Limit the current logging output rate. Summaries are decimated to fit.
+    - alloc_check(enabled: bool = True) -> None
+        -> Test mode: raise if anything allocates on the heap during a drive.
+    - profile_enable(enabled: bool = True), profile_dump(), profile_reset()
+        -> Time hot-path scopes (histograms, allocations, counters) and print them.
+    - read_text(text: str, duration_ms: int = 50, cell_count: int = 4) -> None
+        -> Page through text as braille (SW1: next, SW2: previous, both: exit).
+        -> Page breaks are chosen to minimize the number of dots that move.
+    - play_schedule(path: str) -> None
+        -> Play back a schedule file made by `host_tools/schedule_compiler.py`.
+    - safety_cutoff_stats()
+        -> Print how many times the hardware-timer safety cutoff had to clear outputs.
+    - trace_start(), trace_stop(), trace_status()
+        -> Record actuations (outputs, raw current samples, labels) to flash, in
+           rotating files under `traces/`. Replay with `host_tools/trace_replay.py`.
     - <just a single period>
         -> Repeat the last command.
     """)
@@ -406,6 +1510,13 @@ class GlobalStoreSingleton:
     def __init__(self):
         self.last_command = "help"
 
+        # See `begin_drive()`, `end_drive()`, and `alloc_check()`.
+        self.alloc_check = False
+        self.drive_alloc_start = 0
+
+        # See `endurance()`. None until a run is started or resumed.
+        self.endurance_run: EnduranceRun | None = None
+
 
 global_store = GlobalStoreSingleton()
 
@@ -430,6 +1541,7 @@ def prompt_and_execute() -> None:
     try:
         exec(command)
     except Exception as e:
+        fast_clear_shift_register()  # Never leave motors driven after an error.
         print(f"Error: {e}")
     print()
 
@@ -0,0 +1,163 @@
+"""Lightweight hot-path profiler for the firmware.
+
+Scopes and counters are registered up front (at import time) and each gets a slot in
+preallocated arrays, so recording a measurement does not allocate. When disabled,
+`start()`/`stop()`/`count()` return immediately.
+
+Usage:
+    PROF_SHIFT = profiler.scope("set_shift_registers")
+    profiler.start(PROF_SHIFT)
+    ...
+    profiler.stop(PROF_SHIFT)
+"""
+
+import gc
+import time
+from array import array
+
+# Histogram bucket upper bounds (inclusive), in us. The last bucket is for overflow.
+BUCKET_LIMITS_US = (
+    10,
+    20,
+    50,
+    100,
+    200,
+    500,
+    1_000,
+    2_000,
+    5_000,
+    10_000,
+    20_000,
+    50_000,
+    100_000,
+)
+BUCKET_COUNT = len(BUCKET_LIMITS_US) + 1
+
+MAX_SCOPES = 16
+MAX_COUNTERS = 16
+
+
+class Profiler:
+    """Named timing scopes with fixed-bucket histograms, counters, and alloc deltas."""
+
+    def __init__(self, max_scopes: int = MAX_SCOPES, max_counters: int = MAX_COUNTERS):
+        self.enabled = False
+
+        self.scope_names: list[str] = []
+        self.counter_names: list[str] = []
+
+        self._bucket_limits_us = array("i", BUCKET_LIMITS_US)
+
+        # Per-scope stats. Total time is split into seconds + remainder in us, so that
+        # every value stays a small int (no long-int allocation on MicroPython).
+        self.calls = array("i", [0] * max_scopes)
+        self.total_s = array("i", [0] * max_scopes)
+        self.total_us = array("i", [0] * max_scopes)
+        self.min_us = array("i", [0] * max_scopes)
+        self.max_us = array("i", [0] * max_scopes)
+        self.alloc_bytes = array("i", [0] * max_scopes)
+        self.histogram = array("i", [0] * (max_scopes * BUCKET_COUNT))
+
+        self.counters = array("i", [0] * max_counters)
+
+        # In-flight state for each scope.
+        self._start_us = array("i", [0] * max_scopes)
+        self._start_alloc = array("i", [0] * max_scopes)
+
+    def scope(self, name: str) -> int:
+        """Register a timing scope, and return its id. Call at import time."""
+        if name in self.scope_names:
+            return self.scope_names.index(name)
+        if len(self.scope_names) >= len(self.calls):
+            raise ValueError("Too many profiler scopes.")
+        self.scope_names.append(name)
+        return len(self.scope_names) - 1
+
+    def counter(self, name: str) -> int:
+        """Register a counter, and return its id. Call at import time."""
+        if name in self.counter_names:
+            return self.counter_names.index(name)
+        if len(self.counter_names) >= len(self.counters):
+            raise ValueError("Too many profiler counters.")
+        self.counter_names.append(name)
+        return len(self.counter_names) - 1
+
+    def start(self, scope_id: int) -> None:
+        if not self.enabled:
+            return
+        self._start_alloc[scope_id] = gc.mem_alloc()
+        self._start_us[scope_id] = time.ticks_us()
+
+    def stop(self, scope_id: int) -> None:
+        if not self.enabled:
+            return
+        duration_us = time.ticks_diff(time.ticks_us(), self._start_us[scope_id])
+        alloc_delta = gc.mem_alloc() - self._start_alloc[scope_id]
+
+        calls = self.calls[scope_id]
+        if calls == 0 or duration_us < self.min_us[scope_id]:
+            self.min_us[scope_id] = duration_us
+        if duration_us > self.max_us[scope_id]:
+            self.max_us[scope_id] = duration_us
+        self.calls[scope_id] = calls + 1
+
+        total_us = self.total_us[scope_id] + duration_us
+        while total_us >= 1_000_000:
+            total_us -= 1_000_000
+            self.total_s[scope_id] += 1
+        self.total_us[scope_id] = total_us
+
+        # A GC run during the scope makes the delta negative. Ignore those.
+        if alloc_delta > 0:
+            self.alloc_bytes[scope_id] += alloc_delta
+
+        bucket = 0
+        limits = self._bucket_limits_us
+        while bucket < len(limits) and duration_us > limits[bucket]:
+            bucket += 1
+        self.histogram[scope_id * BUCKET_COUNT + bucket] += 1
+
+    def count(self, counter_id: int, amount: int = 1) -> None:
+        if not self.enabled:
+            return
+        self.counters[counter_id] += amount
+
+    def reset(self) -> None:
+        """Zero all recorded stats. Registered scopes and counters are kept."""
+        for arr in (
+            self.calls,
+            self.total_s,
+            self.total_us,
+            self.min_us,
+            self.max_us,
+            self.alloc_bytes,
+            self.histogram,
+            self.counters,
+        ):
+            for i in range(len(arr)):
+                arr[i] = 0
+
+    def dump(self) -> None:
+        """Print all stats. Allocates freely, so call it outside of the hot path."""
+        print(f"Profiler ({'enabled' if self.enabled else 'disabled'}):")
+        print(f"  Histogram bucket limits (us): {list(BUCKET_LIMITS_US)} + overflow")
+        for scope_id, name in enumerate(self.scope_names):
+            calls = self.calls[scope_id]
+            if calls == 0:
+                print(f"  {name}: no calls")
+                continue
+            total_us = self.total_s[scope_id] * 1_000_000 + self.total_us[scope_id]
+            start = scope_id * BUCKET_COUNT
+            histogram = list(self.histogram[start : start + BUCKET_COUNT])
+            print(
+                f"  {name}: calls={calls}, mean={total_us // calls} us, "
+                f"min={self.min_us[scope_id]} us, max={self.max_us[scope_id]} us, "
+                f"total={total_us // 1000} ms, "
+                f"alloc={self.alloc_bytes[scope_id]} bytes"
+            )
+            print(f"    histogram: {histogram}")
+        for counter_id, name in enumerate(self.counter_names):
+            print(f"  [counter] {name}: {self.counters[counter_id]}")
+
+
+profiler = Profiler()
@@ -0,0 +1,232 @@
+"""Supply-aware limits for driving many motors at once, learned from bus voltage sag.
+
+Every motor start draws an inrush current. Many starts together on a weak supply
+(e.g., USB) pull the bus voltage down, and the RP2040 can brown out. Instead of
+limiting every drive for the worst supply, the guard learns the connected one:
+* Sag: the drop of the bus voltage during a drive below its idle voltage (tracked
+  between drives). Sag beyond `sag_limit_mV` counts as a sag event.
+* `max_motors`: how many motors may be driven at once. Raised by one after
+  `PROBE_AFTER` clean drives at the limit, cut to 3/4 of the motor count on a sag
+  event (additive increase, multiplicative decrease).
+* `stagger_us`: motors of a drive are started this far apart, so their inrush peaks
+  do not add up. Doubled on a sag event, halved after clean drives once every motor
+  may be driven at once. A start is also delayed while the bus is sagging.
+
+A brown-out resets the board before anything can be saved. So before a drive with more
+motors than ever verified, the attempt is saved (`probing`): if it's still set at the
+next boot, the attempt is counted as a brown-out. Any reboot before the attempt
+finished is counted that way too, which errs on the side of fewer motors.
+
+All state is ints. The methods called during a drive do not allocate.
+"""
+
+import os
+import struct
+
+DEFAULT_SAG_LIMIT_MV = 400
+INITIAL_MAX_MOTORS = 4
+PROBE_AFTER = 20  # Clean drives at the limit before trying one more motor.
+RETRY_FACTOR = 8  # Probe this much more slowly past a motor count that sagged.
+MIN_STAGGER_US = 500
+MAX_STAGGER_US = 8_000
+
+_FILE_MAGIC = b"BDG1"  # Not "BDS1": that is the schedule files' magic.
+_FILE_VERSION = 1
+# Magic, version, hard max motors, sag limit (mV), max motors, stagger (us),
+# clean drives, probing, smallest sagged, largest clean, worst sag (mV), sag events,
+# brown-outs, idle bus voltage (mV * 8).
+_HEADER_FORMAT = "<4sHHHHHHHHHHIIi"
+
+
+class SupplyGuard:
+    """Learned motor count and start stagger for the connected supply."""
+
+    def __init__(
+        self, hard_max_motors: int, sag_limit_mV: int = DEFAULT_SAG_LIMIT_MV
+    ) -> None:
+        self.hard_max_motors = hard_max_motors
+        self.sag_limit_mV = sag_limit_mV
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the learned limits (e.g., after connecting another supply)."""
+        self.max_motors = min(INITIAL_MAX_MOTORS, self.hard_max_motors)
+        self.stagger_us = MIN_STAGGER_US
+        self.clean_drives = 0
+        self.probing = 0  # Motor count being tried for the first time. 0: none.
+        self.smallest_sagged = 0  # Fewest motors that sagged. 0: none yet.
+        self.largest_clean = 0  # Most motors driven without sag.
+        self.worst_sag_mV = 0
+        self.sag_events = 0
+        self.brownouts = 0
+        self.idle_x8 = 0  # Idle bus voltage, fixed-point with 3 fractional bits.
+
+        self.motors = 0  # Motors of the current drive.
+        self.min_mV = 0  # Lowest bus voltage of the current drive.
+
+    @property
+    def idle_mV(self) -> int:
+        return self.idle_x8 >> 3
+
+    def idle(self, bus_mV: int) -> None:
+        """Add a bus voltage reading taken with all outputs off."""
+        if self.idle_x8 == 0:
+            self.idle_x8 = bus_mV << 3
+        else:
+            self.idle_x8 += bus_mV - (self.idle_x8 >> 3)
+
+    def floor_mV(self) -> int:
+        """Bus voltage below which the supply is sagging."""
+        return self.idle_mV - self.sag_limit_mV
+
+    def begin(self) -> None:
+        """Start monitoring a drive."""
+        self.motors = 0
+        self.min_mV = self.idle_mV
+
+    def sample(self, bus_mV: int) -> bool:
+        """Add a bus voltage reading taken during the drive. Returns True if sagging."""
+        if bus_mV < self.min_mV:
+            self.min_mV = bus_mV
+        return bus_mV < self.floor_mV()
+
+    def started(self) -> None:
+        """Count one more motor started in the current drive."""
+        self.motors += 1
+
+    def end(self) -> bool:
+        """Learn from the drive that just ended. Returns True if the limits changed."""
+        motors = self.motors
+        if motors == 0:
+            return False
+        sag_mV = self.idle_mV - self.min_mV
+        if sag_mV > self.worst_sag_mV:
+            self.worst_sag_mV = sag_mV
+
+        if sag_mV > self.sag_limit_mV:
+            self.sag_events += 1
+            self._sagged(motors)
+            return True
+
+        self.largest_clean = max(self.largest_clean, motors)
+        changed = False
+        if self.probing and motors >= self.probing:
+            self.probing = 0  # The new limit is verified.
+            changed = True
+        if motors < self.max_motors:
+            return changed
+
+        self.clean_drives += 1
+        probe_after = PROBE_AFTER
+        if self.smallest_sagged and self.max_motors + 1 >= self.smallest_sagged:
+            probe_after *= RETRY_FACTOR
+        if self.clean_drives < probe_after:
+            return changed
+        self.clean_drives = 0
+        if self.max_motors < self.hard_max_motors:
+            self.max_motors += 1
+            if self.max_motors > self.largest_clean:
+                self.probing = self.max_motors
+        elif self.stagger_us > MIN_STAGGER_US:
+            self.stagger_us = max(MIN_STAGGER_US, self.stagger_us // 2)
+        else:
+            return changed
+        return True
+
+    def _sagged(self, motors: int) -> None:
+        if self.smallest_sagged == 0 or motors < self.smallest_sagged:
+            self.smallest_sagged = motors
+        self.max_motors = max(1, min(self.max_motors, motors * 3 // 4))
+        self.stagger_us = min(MAX_STAGGER_US, self.stagger_us * 2)
+        self.clean_drives = 0
+        self.probing = 0
+
+    def status(self) -> dict:
+        """Learned limits and counters (allocates)."""
+        return {
+            "max_motors": self.max_motors,
+            "stagger_us": self.stagger_us,
+            "idle_mV": self.idle_mV,
+            "sag_limit_mV": self.sag_limit_mV,
+            "worst_sag_mV": self.worst_sag_mV,
+            "largest_clean": self.largest_clean,
+            "smallest_sagged": self.smallest_sagged,
+            "sag_events": self.sag_events,
+            "brownouts": self.brownouts,
+        }
+
+    def save(self, path: str) -> None:
+        """Save to `path` (written to a temporary file, then renamed)."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(
+                struct.pack(
+                    _HEADER_FORMAT,
+                    _FILE_MAGIC,
+                    _FILE_VERSION,
+                    self.hard_max_motors,
+                    self.sag_limit_mV,
+                    self.max_motors,
+                    self.stagger_us,
+                    self.clean_drives,
+                    self.probing,
+                    self.smallest_sagged,
+                    self.largest_clean,
+                    self.worst_sag_mV,
+                    self.sag_events,
+                    self.brownouts,
+                    self.idle_x8,
+                )
+            )
+        os.rename(tmp_path, path)
+
+    def load(self, path: str) -> bool:
+        """Load saved state. Returns False if it's missing or for a different size.
+
+        A probe still pending in the file is counted as a brown-out at that motor
+        count (and saved right away).
+        """
+        try:
+            with open(path, "rb") as f:
+                header = f.read(struct.calcsize(_HEADER_FORMAT))
+        except OSError:
+            return False
+        if len(header) != struct.calcsize(_HEADER_FORMAT):
+            return False
+        (
+            magic,
+            version,
+            hard_max_motors,
+            sag_limit_mV,
+            max_motors,
+            stagger_us,
+            clean_drives,
+            probing,
+            smallest_sagged,
+            largest_clean,
+            worst_sag_mV,
+            sag_events,
+            brownouts,
+            idle_x8,
+        ) = struct.unpack(_HEADER_FORMAT, header)
+        if magic != _FILE_MAGIC or version != _FILE_VERSION:
+            return False
+        if hard_max_motors != self.hard_max_motors:
+            return False
+        self.sag_limit_mV = sag_limit_mV
+        self.max_motors = max_motors
+        self.stagger_us = stagger_us
+        self.clean_drives = clean_drives
+        self.probing = probing
+        self.smallest_sagged = smallest_sagged
+        self.largest_clean = largest_clean
+        self.worst_sag_mV = worst_sag_mV
+        self.sag_events = sag_events
+        self.brownouts = brownouts
+        self.idle_x8 = idle_x8
+
+        if self.probing:
+            self.brownouts += 1
+            self._sagged(self.probing)
+            self.save(path)
+        return True
@@ -0,0 +1,223 @@
+"""Record actuation sessions to flash, for replay on the host.
+
+Append-only log of fixed-size binary records: the frames issued, when, and every raw
+current sample taken during the drive. Read it back with `host_tools/trace_replay.py`.
+
+Records are buffered in RAM during a drive (writing to flash can stall for tens of
+ms), and appended to the log file by `commit()` after the outputs are cleared.
+Recording into the buffer does not allocate. When the active file reaches
+`max_file_bytes`, it's rotated: `trace.bin` -> `trace.1.bin` -> ... and the oldest
+file is deleted.
+
+Record format: `<BBhi` (8 bytes): kind, arg, value, time. Each file starts with a
+header of the same size: magic `b"BDT1"`, version (u16), record size (u16).
+* SESSION: time = `time.time()` when recording was enabled.
+* DRIVE: arg = board (255 = all), value = drive_ms, time = `ticks_ms()`.
+* OUTPUTS: arg = chunk `i`, value = outputs `16 * i` to `16 * i + 15` (bit = output),
+  time = us since the drive started when they were latched.
+* SAMPLE: arg = board (255 = total), value = raw shunt reading, time = us since the
+  drive started.
+* END: time = us the drive lasted.
+* LABEL: arg = dot_num, value = label | direction << 8 | (expect_travel + 1) << 10,
+  time = knee in us (-1 = none). Direction is 0 = up, 1 = down.
+* DROPPED: value = samples dropped in the drive, because the buffer was full.
+"""
+
+import os
+import time
+
+TRACE_MAGIC = b"BDT1"
+TRACE_VERSION = 1
+RECORD_BYTES = 8
+
+KIND_SESSION = 1
+KIND_DRIVE = 2
+KIND_OUTPUTS = 3
+KIND_SAMPLE = 4
+KIND_END = 5
+KIND_LABEL = 6
+KIND_DROPPED = 7
+
+ARG_ALL_BOARDS = 255
+
+DEFAULT_BUFFER_RECORDS = 4_096  # About 1.5 s of samples at full rate.
+DEFAULT_MAX_FILE_BYTES = 128_000
+DEFAULT_KEEP_FILES = 4  # Including the active one.
+
+# Records kept free at the end of the buffer for the end-of-drive records.
+_RESERVED_RECORDS = 16
+
+
+class TraceLog:
+    """Buffered, rotating trace recorder. Disabled (and without a buffer) until
+    `enable()` is called."""
+
+    def __init__(
+        self,
+        directory: str = "traces",
+        *,
+        buffer_records: int = DEFAULT_BUFFER_RECORDS,
+        max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+        keep_files: int = DEFAULT_KEEP_FILES,
+    ) -> None:
+        self.directory = directory
+        self.buffer_records = buffer_records
+        self.max_file_bytes = max_file_bytes
+        self.keep_files = keep_files
+
+        self.enabled = False
+        self.buf = bytearray(0)
+        self.count = 0
+        self.dropped = 0
+        self.file_bytes = 0
+
+    def path(self, index: int = 0) -> str:
+        """Path of the active file (0), or of the `index`-th most recent rotated one."""
+        if index == 0:
+            return f"{self.directory}/trace.bin"
+        return f"{self.directory}/trace.{index}.bin"
+
+    def enable(self) -> None:
+        """Allocate the buffer, and start a new session."""
+        if len(self.buf) != self.buffer_records * RECORD_BYTES:
+            self.buf = bytearray(self.buffer_records * RECORD_BYTES)
+        try:
+            os.mkdir(self.directory)
+        except OSError:
+            pass  # Already exists.
+        try:
+            self.file_bytes = os.stat(self.path())[6]
+        except OSError:
+            self.file_bytes = 0
+        self.count = 0
+        self.dropped = 0
+        self.enabled = True
+        self._put(KIND_SESSION, 0, 0, int(time.time()))
+        self.commit()
+
+    def disable(self) -> None:
+        """Write out anything buffered, stop recording, and free the buffer."""
+        self.commit()
+        self.enabled = False
+        self.buf = bytearray(0)
+
+    def _put(self, kind: int, arg: int, value: int, time_value: int) -> None:
+        n = self.count
+        if n >= self.buffer_records:
+            return
+        buf = self.buf
+        o = n * RECORD_BYTES
+        buf[o] = kind
+        buf[o + 1] = arg & 0xFF
+        buf[o + 2] = value & 0xFF
+        buf[o + 3] = (value >> 8) & 0xFF
+        buf[o + 4] = time_value & 0xFF
+        buf[o + 5] = (time_value >> 8) & 0xFF
+        buf[o + 6] = (time_value >> 16) & 0xFF
+        buf[o + 7] = (time_value >> 24) & 0xFF
+        self.count = n + 1
+
+    def drive(self, board: int, drive_ms: int) -> None:
+        """Start of a drive. Follow with its outputs."""
+        if not self.enabled:
+            return
+        self.dropped = 0
+        self._put(KIND_DRIVE, board, drive_ms, time.ticks_ms())
+
+    def outputs(self, state, elapsed_us: int = 0) -> None:
+        """The outputs latched, `elapsed_us` into the drive.
+
+        `state` has one bool/int per output.
+        """
+        if not self.enabled:
+            return
+        chunk = 0
+        bits = 0
+        for output_num in range(len(state)):
+            if state[output_num]:
+                bits |= 1 << (output_num & 15)
+            if output_num & 15 == 15 or output_num == len(state) - 1:
+                self._put(KIND_OUTPUTS, chunk, bits, elapsed_us)
+                chunk += 1
+                bits = 0
+
+    def outputs_packed(
+        self, data, offset: int, state_bytes: int, elapsed_us: int = 0
+    ) -> None:
+        """Like `outputs()`, for a packed state (output `n` is bit `n % 8` of byte
+        `offset + n // 8`), as in schedules."""
+        if not self.enabled:
+            return
+        for chunk in range((state_bytes + 1) // 2):
+            i = offset + chunk * 2
+            bits = data[i]
+            if chunk * 2 + 1 < state_bytes:
+                bits |= data[i + 1] << 8
+            self._put(KIND_OUTPUTS, chunk, bits, elapsed_us)
+
+    def sample(self, board: int, raw: int, elapsed_us: int) -> None:
+        """A raw current sample, `elapsed_us` into the drive."""
+        if not self.enabled:
+            return
+        if self.count >= self.buffer_records - _RESERVED_RECORDS:
+            self.dropped += 1
+            return
+        self._put(KIND_SAMPLE, board, raw, elapsed_us)
+
+    def end(self, drive_us: int) -> None:
+        """End of the drive, after `drive_us`."""
+        if not self.enabled:
+            return
+        if self.dropped:
+            self._put(KIND_DROPPED, 0, min(self.dropped, 0x7FFF), 0)
+        self._put(KIND_END, 0, 0, drive_us)
+
+    def label(
+        self, dot_num: int, direction: int, label: int, expect_travel: int, knee_us: int
+    ) -> None:
+        """The classification of the last drive (of a single dot)."""
+        if not self.enabled:
+            return
+        self._put(
+            KIND_LABEL,
+            dot_num,
+            label | direction << 8 | (expect_travel + 1) << 10,
+            knee_us,
+        )
+
+    def _rotate(self) -> None:
+        try:
+            os.remove(self.path(self.keep_files - 1))
+        except OSError:
+            pass
+        for index in range(self.keep_files - 2, -1, -1):
+            try:
+                os.rename(self.path(index), self.path(index + 1))
+            except OSError:
+                pass
+        self.file_bytes = 0
+
+    def commit(self) -> None:
+        """Append the buffered records to flash. Call outside of drives (allocates)."""
+        if not self.enabled or self.count == 0:
+            return
+        size = self.count * RECORD_BYTES
+        if self.file_bytes > 0 and self.file_bytes + size > self.max_file_bytes:
+            self._rotate()
+        with open(self.path(), "ab") as f:
+            if self.file_bytes == 0:
+                header = bytearray(TRACE_MAGIC)
+                header.extend(TRACE_VERSION.to_bytes(2, "little"))
+                header.extend(RECORD_BYTES.to_bytes(2, "little"))
+                f.write(header)
+                self.file_bytes = len(header)
+            f.write(memoryview(self.buf)[:size])
+        self.file_bytes += size
+        self.count = 0
+
+    def status(self) -> None:
+        print(
+            f"Trace log {'enabled' if self.enabled else 'disabled'}: "
+            f"{self.path()} is {self.file_bytes} bytes "
+            f"(rotates at {self.max_file_bytes} bytes, keeps {self.keep_files} files)."
+        )
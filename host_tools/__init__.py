@@ -0,0 +1 @@
+"""Host-side (PC) tools for the Braille-Display-DC-Motors-Vertical project."""
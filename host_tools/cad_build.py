@@ -0,0 +1,146 @@
+"""Build every CAD part: run the generators in `cad/` in parallel.
+
+A generator is a script under `cad/` with a `__main__` block (files under a `no_ci`
+folder are skipped). Each runs in its own Python process, like `python cad/x.py`, up
+to `--jobs` at once, so a full build takes about as long as the slowest generator
+rather than the sum of all of them.
+
+The output of each generator goes to `build/logs/<name>.log`. Progress is logged as
+each generator finishes, then the time of each, slowest first. Exits with status 1 if
+any generator failed (after printing the end of its log).
+
+Usage:
+    python -m host_tools.cad_build --jobs 4
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+CAD_DIR = REPO_DIR / "cad"
+LOG_DIR = REPO_DIR / "build" / "logs"
+FAILED_LOG_TAIL_LINES = 30
+
+_MAIN_BLOCK_RE = re.compile(r"^if __name__ == ['\"]__main__['\"]:", re.MULTILINE)
+
+
+@dataclass(kw_only=True)
+class BuildResult:
+    """Outcome of running one generator."""
+
+    name: str
+    returncode: int
+    duration_s: float
+    log_path: Path
+
+
+def find_generators(cad_dir: Path = CAD_DIR) -> list[Path]:
+    """List the generator scripts under `cad_dir`."""
+    return sorted(
+        path
+        for path in cad_dir.rglob("*.py")
+        if "no_ci" not in path.parts
+        and _MAIN_BLOCK_RE.search(path.read_text(encoding="utf-8"))
+    )
+
+
+def generator_name(path: Path, cad_dir: Path = CAD_DIR) -> str:
+    """Name of a generator, from its path (e.g., `test_and_demos.tiny_motor`)."""
+    return ".".join(path.relative_to(cad_dir).with_suffix("").parts)
+
+
+def run_generator(path: Path, log_dir: Path = LOG_DIR) -> BuildResult:
+    """Run the generator at `path` in a new Python process, logging to a file."""
+    name = generator_name(path)
+    log_path = log_dir / f"{name}.log"
+    start_s = time.perf_counter()
+    with log_path.open("w") as log:
+        completed = subprocess.run(  # noqa: S603
+            [sys.executable, str(path)],
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            cwd=REPO_DIR,
+            check=False,
+        )
+    return BuildResult(
+        name=name,
+        returncode=completed.returncode,
+        duration_s=time.perf_counter() - start_s,
+        log_path=log_path,
+    )
+
+
+def _log_failure(result: BuildResult) -> None:
+    lines = result.log_path.read_text(errors="replace").splitlines()
+    tail = "\n".join(lines[-FAILED_LOG_TAIL_LINES:])
+    logger.error(f"End of {result.log_path.relative_to(REPO_DIR)}:\n{tail}")
+
+
+def build(generators: list[Path], jobs: int) -> list[BuildResult]:
+    """Run `generators`, `jobs` at a time. Returns the results as they finished."""
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    results = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_generator, path) for path in generators]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            progress = f"[{done}/{len(generators)}] {result.name}"
+            if result.returncode == 0:
+                logger.info(f"{progress}: done in {result.duration_s:.1f} s.")
+            else:
+                logger.error(
+                    f"{progress}: failed (exit status {result.returncode}) after "
+                    f"{result.duration_s:.1f} s."
+                )
+    return results
+
+
+def main() -> None:
+    """Run all CAD generators in parallel, and summarize their times."""
+    parser = argparse.ArgumentParser(description="Build all CAD parts in parallel.")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Generators run at once. Default: one per CPU.",
+    )
+    parser.add_argument(
+        "names", nargs="*", help="Only the generators with these names (substrings)."
+    )
+    args = parser.parse_args()
+
+    generators = [
+        path
+        for path in find_generators()
+        if not args.names or any(name in generator_name(path) for name in args.names)
+    ]
+    logger.info(f"Building {len(generators)} CAD generators, {args.jobs} at a time.")
+    start_s = time.perf_counter()
+    results = build(generators, args.jobs)
+    duration_s = time.perf_counter() - start_s
+
+    for result in sorted(results, key=lambda result: -result.duration_s):
+        status = "ok" if result.returncode == 0 else "FAILED"
+        logger.info(f"{result.duration_s:7.1f} s  {status:6}  {result.name}")
+    total_s = sum(result.duration_s for result in results)
+    logger.info(f"Built in {duration_s:.1f} s ({total_s:.1f} s if run one by one).")
+
+    failed = [result for result in results if result.returncode != 0]
+    for result in failed:
+        _log_failure(result)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Check that the motor housing (CAD) and the PCB agree on where things are.
+
+Positions are extracted from both sides without building any geometry:
+* CAD: `motor_coordinates()` and `mounting_hole_coordinates()` of a `HousingSpec`
+  (`cad/housing_spec.py`), in the housing's frame (centered, Y up).
+* PCB: footprint positions read through the board file's index (`kicad_sexpr.py`).
+  Motors of this layer are `Motor_Tiny_0408_Vertical` footprints, motors of the other
+  layer pass through `Hole_for_Motor_Shaft` footprints, and the mounting holes are the
+  pads of the `Braille_Block_MountingHoles_M2_3x` footprints.
+
+The housing's origin on the board is the centroid of the motor footprints (unless
+given). Each CAD feature is then matched to the nearest PCB feature of its kind with a
+KD-tree, and reported if it's further than the tolerance. A motor footprint that no
+CAD motor matches is reported too. Other holes are not: the board also has holes for
+other housings.
+
+The dots themselves (`dot_pitch_*`, `dot_count_*`) are not checked: they are holes in
+the top plate, reached by the bent motor shafts, and the board has no footprint at
+their positions. The motors are what the board has to match.
+
+Exits with status 1 if there's any mismatch, so it can run on every commit.
+
+Usage:
+    python -m host_tools.cad_pcb_check --tolerance-mm 0.05
+"""
+
+import argparse
+import math
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+from loguru import logger
+from scipy.spatial import KDTree
+
+from cad.housing_spec import (
+    HousingSpec,
+    motor_coordinates,
+    mounting_hole_coordinates,
+)
+from host_tools import kicad_sexpr
+from host_tools.dot_map_generator import DEFAULT_SCHEMATIC
+
+DEFAULT_BOARD = DEFAULT_SCHEMATIC.with_suffix(".kicad_pcb")
+DEFAULT_TOLERANCE_MM = 0.05
+
+MOTOR_FOOTPRINT = "Motor_Tiny_0408_Vertical"
+SHAFT_HOLE_FOOTPRINT = "Hole_for_Motor_Shaft"
+MOUNTING_HOLES_FOOTPRINT = "Braille_Block_MountingHoles_M2_3x"
+
+
+@dataclass(kw_only=True)
+class Features:
+    """Positions of one kind of feature, in the housing's frame (mm, Y up)."""
+
+    kind: str
+    cad: npt.NDArray[np.float64]  # Shape (n, 2).
+    pcb: npt.NDArray[np.float64]  # Shape (m, 2).
+    pcb_names: list[str]  # E.g., "M201", or "H105 pad 2".
+    every_pcb_feature: bool = False  # Whether each PCB feature must match one in CAD.
+
+
+@dataclass(kw_only=True)
+class Mismatch:
+    """A feature without a counterpart within the tolerance."""
+
+    kind: str
+    side: str  # "CAD" or "PCB": the side that has the feature.
+    position: tuple[float, float]
+    pcb_name: str  # The PCB feature, or the one nearest to the CAD feature.
+    distance_mm: float  # To the nearest feature on the other side.
+
+
+def footprint_positions(
+    index: kicad_sexpr.FileIndex, lib_id: str
+) -> dict[str, tuple[float, float]]:
+    """Get the board positions (mm, Y down) of the footprints with `lib_id`."""
+    return {
+        reference: index.at(span)[:2]
+        for reference, span in index.footprints_of(lib_id).items()
+    }
+
+
+def pad_positions(
+    index: kicad_sexpr.FileIndex, lib_id: str
+) -> dict[str, tuple[float, float]]:
+    """Get the board positions (mm, Y down) of the pads of footprints with `lib_id`."""
+    positions = {}
+    for reference, span in index.footprints_of(lib_id).items():
+        footprint = index.node(span)
+        x, y, angle = kicad_sexpr.at(footprint)
+        # KiCad angles are counterclockwise on screen, with Y down.
+        cos, sin = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        for pad_num, pad in enumerate(kicad_sexpr.children(footprint, "pad"), 1):
+            px, py, _ = kicad_sexpr.at(pad)
+            positions[f"{reference} pad {pad_num}"] = (
+                x + px * cos + py * sin,
+                y - px * sin + py * cos,
+            )
+    return positions
+
+
+def housing_origin(
+    spec: HousingSpec, motors: dict[str, tuple[float, float]]
+) -> tuple[float, float]:
+    """Board position of the housing's center, which puts its motors on `motors`."""
+    centroid = np.mean(list(motors.values()), axis=0)
+    cad_centroid = np.mean(motor_coordinates(spec), axis=0)
+    return float(centroid[0] - cad_centroid[0]), float(centroid[1] + cad_centroid[1])
+
+
+def _to_housing_frame(
+    positions: dict[str, tuple[float, float]], origin: tuple[float, float]
+) -> npt.NDArray[np.float64]:
+    """Board positions (Y down) relative to `origin`, with Y up."""
+    points = np.array(list(positions.values()), dtype=np.float64).reshape(-1, 2)
+    return (points - origin) * (1, -1)
+
+
+def extract_features(
+    spec: HousingSpec, board: Path, origin: tuple[float, float] | None
+) -> list[Features]:
+    """Get the CAD and PCB positions of each kind of feature."""
+    cad_motors = np.array(motor_coordinates(spec), dtype=np.float64)
+    with kicad_sexpr.FileIndex(board) as index:
+        motors = footprint_positions(index, MOTOR_FOOTPRINT)
+        shaft_holes = footprint_positions(index, SHAFT_HOLE_FOOTPRINT)
+        mounting_holes = pad_positions(index, MOUNTING_HOLES_FOOTPRINT)
+    if not motors:
+        msg = f"No {MOTOR_FOOTPRINT} footprints in {board}."
+        raise ValueError(msg)
+    if origin is None:
+        origin = housing_origin(spec, motors)
+        logger.info(f"Housing origin on the board: {origin[0]:.3f}, {origin[1]:.3f}")
+
+    return [
+        Features(
+            kind="motor",
+            cad=cad_motors,
+            pcb=_to_housing_frame(motors, origin),
+            pcb_names=list(motors),
+            every_pcb_feature=True,
+        ),
+        Features(
+            kind="other layer's motor (shaft hole)",
+            cad=np.array(motor_coordinates(spec, other_layer=True), dtype=np.float64),
+            pcb=_to_housing_frame(shaft_holes, origin),
+            pcb_names=list(shaft_holes),
+        ),
+        Features(
+            kind="mounting hole",
+            cad=np.array(mounting_hole_coordinates(spec), dtype=np.float64),
+            pcb=_to_housing_frame(mounting_holes, origin),
+            pcb_names=list(mounting_holes),
+        ),
+    ]
+
+
+def find_mismatches(features: Features, tolerance_mm: float) -> list[Mismatch]:
+    """Find the features without a counterpart within `tolerance_mm`."""
+    mismatches = []
+    if len(features.pcb) == 0:
+        return [
+            Mismatch(
+                kind=features.kind,
+                side="CAD",
+                position=(float(x), float(y)),
+                pcb_name="(none)",
+                distance_mm=math.inf,
+            )
+            for x, y in features.cad
+        ]
+
+    distances, nearest = KDTree(features.pcb).query(features.cad)
+    for (x, y), distance, pcb_index in zip(
+        features.cad, np.asarray(distances), np.asarray(nearest), strict=True
+    ):
+        if distance > tolerance_mm:
+            mismatches.append(
+                Mismatch(
+                    kind=features.kind,
+                    side="CAD",
+                    position=(float(x), float(y)),
+                    pcb_name=features.pcb_names[pcb_index],
+                    distance_mm=float(distance),
+                )
+            )
+
+    if features.every_pcb_feature and len(features.cad):
+        distances, _ = KDTree(features.cad).query(features.pcb)
+        for (x, y), distance, name in zip(
+            features.pcb, np.asarray(distances), features.pcb_names, strict=True
+        ):
+            if distance > tolerance_mm:
+                mismatches.append(
+                    Mismatch(
+                        kind=features.kind,
+                        side="PCB",
+                        position=(float(x), float(y)),
+                        pcb_name=name,
+                        distance_mm=float(distance),
+                    )
+                )
+    return mismatches
+
+
+def main() -> None:
+    """Check the default housing against the board, and report the mismatches."""
+    parser = argparse.ArgumentParser(description="Check the CAD against the PCB.")
+    parser.add_argument("--board", type=Path, default=DEFAULT_BOARD)
+    parser.add_argument(
+        "--tolerance-mm", type=float, default=DEFAULT_TOLERANCE_MM, help="Max offset."
+    )
+    parser.add_argument(
+        "--origin",
+        type=float,
+        nargs=2,
+        metavar=("X", "Y"),
+        help="Board position of the housing's center. Default: the motors' centroid.",
+    )
+    args = parser.parse_args()
+
+    start_s = time.perf_counter()
+    mismatch_count = 0
+    for features in extract_features(HousingSpec(), args.board, args.origin):
+        mismatches = find_mismatches(features, args.tolerance_mm)
+        logger.info(
+            f"{features.kind}: {len(features.cad)} in CAD, {len(features.pcb)} on "
+            f"the PCB, {len(mismatches)} mismatched."
+        )
+        for mismatch in mismatches:
+            x, y = mismatch.position
+            if mismatch.side == "CAD":
+                what, other = "CAD", f"the nearest on the PCB, {mismatch.pcb_name}"
+            else:
+                what, other = f"PCB {mismatch.pcb_name}", "the nearest in CAD"
+            logger.warning(
+                f"{features.kind} at ({x:.3f}, {y:.3f}) in {what}: "
+                f"{mismatch.distance_mm:.3f} mm from {other}."
+            )
+        mismatch_count += len(mismatches)
+    duration_ms = (time.perf_counter() - start_s) * 1000
+    logger.info(f"Checked in {duration_ms:.1f} ms.")
+    if mismatch_count:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
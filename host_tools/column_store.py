@@ -0,0 +1,279 @@
+"""Append-only columnar tables on disk, read back as memory-mapped NumPy arrays.
+
+A table is a directory with one raw little-endian file per column (`<name>.bin`)
+and `table.json` (the schema and the row count). Appending only writes to the end of
+the column files, and reading memory-maps them, so tables can be far larger than RAM.
+"""
+
+import json
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+META_FILE_NAME = "table.json"
+INDEX_FILE_NAME = "index.json"
+RUNS_DIR_NAME = "runs"
+
+
+class ColumnTable:
+    """One append-only table of equal-length columns."""
+
+    def __init__(self, directory: Path, schema: dict[str, str], rows: int) -> None:
+        """Use `create()` or `open()` instead."""
+        self.directory = directory
+        self.schema = schema
+        self.rows = rows
+
+    @classmethod
+    def create(cls, directory: Path, schema: dict[str, str]) -> "ColumnTable":
+        """Create an empty table. `schema` maps column names to NumPy dtype strings."""
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in schema:
+            (directory / f"{name}.bin").write_bytes(b"")
+        table = cls(directory, dict(schema), 0)
+        table._write_meta()
+        return table
+
+    @classmethod
+    def open(cls, directory: Path) -> "ColumnTable":
+        """Open an existing table."""
+        meta = json.loads((directory / META_FILE_NAME).read_text())
+        return cls(directory, meta["schema"], meta["rows"])
+
+    def _write_meta(self) -> None:
+        # Write then rename, so that a crash never leaves a half-written meta file.
+        tmp_path = self.directory / f"{META_FILE_NAME}.tmp"
+        tmp_path.write_text(json.dumps({"schema": self.schema, "rows": self.rows}))
+        tmp_path.replace(self.directory / META_FILE_NAME)
+
+    def append(self, columns: Mapping[str, npt.ArrayLike]) -> None:
+        """Append rows. Every column of the schema must be given, at equal lengths."""
+        if set(columns) != set(self.schema):
+            msg = f"Expected columns {sorted(self.schema)}, got {sorted(columns)}."
+            raise ValueError(msg)
+        arrays = {
+            name: np.asarray(values, dtype=self.schema[name])
+            for name, values in columns.items()
+        }
+        lengths = {len(array) for array in arrays.values()}
+        if len(lengths) != 1:
+            msg = f"Columns have different lengths: {lengths}."
+            raise ValueError(msg)
+
+        for name, array in arrays.items():
+            with (self.directory / f"{name}.bin").open("ab") as f:
+                f.write(array.tobytes())
+        self.rows += lengths.pop()
+        self._write_meta()
+
+    def column(self, name: str) -> np.ndarray:
+        """Memory-map a column (read-only)."""
+        dtype = np.dtype(self.schema[name])
+        if self.rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(
+            self.directory / f"{name}.bin", dtype=dtype, mode="r", shape=(self.rows,)
+        )
+
+    def columns(self) -> dict[str, np.ndarray]:
+        """Memory-map every column."""
+        return {name: self.column(name) for name in self.schema}
+
+
+class ChunkedTable:
+    """An append-only table in chunks of `chunk_rows`, indexed by `index_columns`.
+
+    Each chunk is a `ColumnTable` (`chunk_00000/`, ...). The index lists runs of
+    consecutive rows with equal index column values, so `query()` only memory-maps
+    the matching ranges, no matter how large the table grows.
+
+    The runs are a `ColumnTable` too (`runs/`), so an append only adds the runs it
+    closed. The last run can still grow, so it's kept in the small header
+    (`index.json`) with the schema and the chunk names, until a later run follows it.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        schema: dict[str, str],
+        *,
+        chunk_rows: int,
+        index_columns: tuple[str, ...],
+    ) -> None:
+        """Use `create()` or `open()` instead."""
+        self.directory = directory
+        self.schema = schema
+        self.chunk_rows = chunk_rows
+        self.index_columns = index_columns
+        # Runs: [chunk, start_row, stop_row, *index values].
+        self.runs: list[list[int]] = []
+        self.saved_runs = 0  # Runs in the runs table. The others are in the header.
+        self.chunks: list[ColumnTable] = []
+
+    @classmethod
+    def create(
+        cls,
+        directory: Path,
+        schema: dict[str, str],
+        *,
+        chunk_rows: int = 1_000_000,
+        index_columns: tuple[str, ...] = (),
+    ) -> "ChunkedTable":
+        """Create an empty table, or open it if it already exists."""
+        if (directory / INDEX_FILE_NAME).exists():
+            return cls.open(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        table = cls(
+            directory, dict(schema), chunk_rows=chunk_rows, index_columns=index_columns
+        )
+        table._write_index()
+        return table
+
+    @classmethod
+    def open(cls, directory: Path) -> "ChunkedTable":
+        """Open an existing table."""
+        meta = json.loads((directory / INDEX_FILE_NAME).read_text())
+        table = cls(
+            directory,
+            meta["schema"],
+            chunk_rows=meta["chunk_rows"],
+            index_columns=tuple(meta["index_columns"]),
+        )
+        if "runs" in meta:  # Written before the runs had their own table.
+            table.runs = meta["runs"]
+        else:
+            runs_dir = directory / RUNS_DIR_NAME
+            if (runs_dir / META_FILE_NAME).exists():
+                columns = ColumnTable.open(runs_dir).columns().values()
+                table.runs = np.column_stack(list(columns)).tolist()
+                table.saved_runs = len(table.runs)
+            if meta["open_run"] is not None:
+                table.runs.append(meta["open_run"])
+        table.chunks = [
+            ColumnTable.open(directory / name) for name in meta["chunk_names"]
+        ]
+        return table
+
+    def _write_index(self) -> None:
+        """Save the runs closed since the last save, then the header."""
+        closed = self.runs[self.saved_runs : -1]
+        if closed:
+            runs_dir = self.directory / RUNS_DIR_NAME
+            if (runs_dir / META_FILE_NAME).exists():
+                runs_table = ColumnTable.open(runs_dir)
+            else:
+                names = ["chunk", "start", "stop", *self.index_columns]
+                runs_table = ColumnTable.create(runs_dir, dict.fromkeys(names, "<i8"))
+            runs = np.array(closed, dtype=np.int64)
+            runs_table.append(
+                {name: runs[:, i] for i, name in enumerate(runs_table.schema)}
+            )
+            self.saved_runs += len(closed)
+
+        tmp_path = self.directory / f"{INDEX_FILE_NAME}.tmp"
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "schema": self.schema,
+                    "chunk_rows": self.chunk_rows,
+                    "index_columns": self.index_columns,
+                    "chunk_names": [chunk.directory.name for chunk in self.chunks],
+                    "open_run": self.runs[-1] if self.runs else None,
+                }
+            )
+        )
+        tmp_path.replace(self.directory / INDEX_FILE_NAME)
+
+    @property
+    def rows(self) -> int:
+        """Total number of rows."""
+        return sum(chunk.rows for chunk in self.chunks)
+
+    def _index_runs(self, columns: dict[str, np.ndarray], offset: int) -> list[list]:
+        """Find the runs of equal index values in `columns` (rows + `offset`)."""
+        length = len(next(iter(columns.values())))
+        if not self.index_columns:
+            return [[offset, offset + length]]
+        change = np.zeros(length, dtype=bool)
+        change[0] = True
+        for name in self.index_columns:
+            change[1:] |= columns[name][1:] != columns[name][:-1]
+        starts = np.flatnonzero(change)
+        stops = np.append(starts[1:], length)
+        return [
+            [
+                offset + int(start),
+                offset + int(stop),
+                *(int(columns[name][start]) for name in self.index_columns),
+            ]
+            for start, stop in zip(starts, stops, strict=True)
+        ]
+
+    def append(self, columns: Mapping[str, npt.ArrayLike]) -> None:
+        """Append rows, starting new chunks as needed, and update the index."""
+        arrays = {
+            name: np.asarray(values, dtype=self.schema[name])
+            for name, values in columns.items()
+        }
+        length = len(next(iter(arrays.values()))) if arrays else 0
+        position = 0
+        while position < length:
+            if not self.chunks or self.chunks[-1].rows >= self.chunk_rows:
+                name = f"chunk_{len(self.chunks):05d}"
+                self.chunks.append(
+                    ColumnTable.create(self.directory / name, self.schema)
+                )
+            chunk = self.chunks[-1]
+            take = min(length - position, self.chunk_rows - chunk.rows)
+            part = {
+                name: array[position : position + take]
+                for name, array in arrays.items()
+            }
+            for run in self._index_runs(part, chunk.rows):
+                previous = self.runs[-1] if self.runs else None
+                if (
+                    previous is not None
+                    and previous[0] == len(self.chunks) - 1
+                    and previous[2] == run[0]
+                    and previous[3:] == run[2:]
+                ):
+                    previous[2] = run[1]  # Extends the last run.
+                else:
+                    self.runs.append([len(self.chunks) - 1, *run])
+            chunk.append(part)
+            position += take
+        self._write_index()
+
+    def query(self, **equals: int) -> dict[str, np.ndarray]:
+        """Rows whose index columns equal the given values (all rows if none given).
+
+        Only the matching row ranges are read.
+        """
+        unknown = set(equals) - set(self.index_columns)
+        if unknown:
+            msg = f"Not index columns: {sorted(unknown)}."
+            raise ValueError(msg)
+        positions = [self.index_columns.index(name) for name in equals]
+        wanted = list(equals.values())
+        parts: dict[str, list[np.ndarray]] = {name: [] for name in self.schema}
+        mapped: dict[int, dict[str, np.ndarray]] = {}
+        for chunk_num, start, stop, *values in self.runs:
+            if [values[i] for i in positions] != wanted:
+                continue
+            if chunk_num not in mapped:
+                mapped[chunk_num] = self.chunks[chunk_num].columns()
+            for name, column in mapped[chunk_num].items():
+                parts[name].append(np.asarray(column[start:stop]))
+        return {
+            name: np.concatenate(arrays)
+            if arrays
+            else np.empty(0, dtype=self.schema[name])
+            for name, arrays in parts.items()
+        }
+
+    def index_values(self, name: str) -> list[int]:
+        """Distinct values of index column `name`, from the index alone."""
+        position = self.index_columns.index(name)
+        return sorted({run[3 + position] for run in self.runs})
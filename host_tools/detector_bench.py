@@ -0,0 +1,578 @@
+"""Benchmark actuation classifier thresholds against a labelled corpus of traces.
+
+The firmware classifier (`actuation_classifier.py`) decides ok/open/short/stuck/...
+from thresholds (e.g., `open_mA`, the 20 mA open-circuit cutoff). This harness runs
+a grid of candidate thresholds over thousands of labelled traces at once, ranks
+them, and exports the best ones as `classifier_params.json`, which the firmware loads
+at init (`ActuationClassifier.load()`).
+
+Corpus (`.npz`): padded 2D arrays of traces (raw INA219 shunt readings and their
+times), with the true label, the true knee time (ok traces), the expected travel
+and the drive time of each trace. Made by:
+* `simulate`: synthetic signatures of every label, with noise and glitches, and
+  exact ground truth.
+* `from-traces`: drives recorded on the board (`trace_replay.py download`). Labels
+  are the board's, unless overridden with reviewed labels (`--labels`).
+
+`BatchClassifier` is the firmware classifier's state machine, vectorized over traces
+and candidates: one NumPy step per sample index, for every (trace, candidate) row.
+It's checked against the firmware code itself on a subset of the traces.
+
+Per candidate:
+* Label accuracy, and fault false positives/negatives (`FAULT_LABELS`).
+* Detection latency: for ok traces, from the true knee to the decision; for faults,
+  from the drive start to the decision (when the firmware can cut the drive).
+* CPU cost per sample, of the firmware code on the host.
+
+Usage:
+    python -m host_tools.detector_bench simulate corpus.npz --count 5000
+    python -m host_tools.detector_bench from-traces traces/ corpus.npz
+    python -m host_tools.detector_bench run corpus.npz --grid open_mA=10,20,30 \
+        --export classifier_params.json
+"""
+
+import argparse
+import itertools
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from host_tools.firmware import actuation_classifier as ac
+from host_tools.trace_replay import parse_drives, trace_files
+
+DEFAULT_GRID: dict[str, list[int]] = {
+    "open_mA": [10, 20, 30],
+    "knee_ratio_x16": [20, 24, 28],
+    "knee_min_us": [500, 1_000, 2_000],
+    "short_min_us": [250, 500, 1_000],
+}
+BATCH_ROWS = 250_000  # (trace, candidate) rows per vectorized batch.
+REFERENCE_TRACES = 50  # Traces replayed through the firmware code, per candidate.
+SAMPLE_INTERVAL_US = 450  # Typical INA219 read interval on the board.
+
+# Phases, as in `actuation_classifier`.
+PHASE_IDLE = 0
+PHASE_INRUSH = 1
+PHASE_RUNNING = 2
+PHASE_DONE = 3
+
+
+@dataclass(kw_only=True)
+class Corpus:
+    """Labelled traces, padded to the longest one. Times in us."""
+
+    raw: np.ndarray  # (traces, samples) int16.
+    elapsed_us: np.ndarray  # (traces, samples) int32.
+    length: np.ndarray  # Samples per trace.
+    drive_us: np.ndarray
+    expect_travel: np.ndarray
+    label: np.ndarray  # True label.
+    knee_us: np.ndarray  # True knee. -1 if none.
+
+    @property
+    def count(self) -> int:
+        """Number of traces."""
+        return len(self.length)
+
+    def save(self, path: Path) -> None:
+        """Save as a `.npz` file."""
+        np.savez_compressed(path, **vars(self))
+
+    @classmethod
+    def load(cls, path: Path) -> "Corpus":
+        """Load a `.npz` file made by `save()`."""
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+
+@dataclass(kw_only=True)
+class BatchResult:
+    """Classifier output per row."""
+
+    label: np.ndarray
+    knee_us: np.ndarray
+    decided_us: np.ndarray  # When the label was decided.
+
+
+def _stalled_labels(expect_travel: np.ndarray) -> np.ndarray:
+    return np.select(
+        [expect_travel == ac.TRAVEL_YES, expect_travel == ac.TRAVEL_NO],
+        [ac.LABEL_STUCK, ac.LABEL_AT_END_STOP],
+        ac.LABEL_NO_TRAVEL,
+    ).astype(np.int8)
+
+
+class BatchClassifier:
+    """`ActuationClassifier`, vectorized over rows of (trace, thresholds)."""
+
+    def __init__(self, params: dict[str, np.ndarray]) -> None:
+        """Thresholds per row, by `PARAM_NAMES` (in mA, us and 1/16ths)."""
+        # As `ActuationClassifier.mA_to_raw()`, with the default shunt.
+        shunt = ac.ActuationClassifier()
+        self.open_raw = params["open_mA"] * shunt.shunt_milliohms // shunt.shunt_lsb_uv
+        self.short_raw = (
+            params["short_mA"] * shunt.shunt_milliohms // shunt.shunt_lsb_uv
+        )
+        self.short_min_us = params["short_min_us"]
+        self.run_ratio_x16 = params["run_ratio_x16"]
+        self.knee_ratio_x16 = params["knee_ratio_x16"]
+        self.knee_min_us = params["knee_min_us"]
+        self.stuck_min_us = params["stuck_min_us"]
+
+    def start(self, expect_travel: np.ndarray) -> None:
+        """Reset for a new actuation per row. As `ActuationClassifier.start()`."""
+        rows = len(expect_travel)
+        self.stalled_label = _stalled_labels(expect_travel)
+        self.phase = np.full(rows, PHASE_IDLE, dtype=np.int8)
+        self.label = np.full(rows, ac.LABEL_PENDING, dtype=np.int8)
+        self.decided_us = np.full(rows, -1, dtype=np.int64)
+        self.peak_raw = np.zeros(rows, dtype=np.int64)
+        self.rise_us = np.full(rows, -1, dtype=np.int64)
+        self.plateau_x8 = np.zeros(rows, dtype=np.int64)
+        self.knee_us = np.full(rows, -1, dtype=np.int64)
+        self.knee_start_us = np.full(rows, -1, dtype=np.int64)
+        self.short_start_us = np.full(rows, -1, dtype=np.int64)
+
+    def _decide(
+        self, mask: np.ndarray, label: np.ndarray | int, elapsed_us: np.ndarray
+    ) -> None:
+        self.label[mask] = label if isinstance(label, int) else label[mask]
+        self.phase[mask] = PHASE_DONE
+        self.decided_us[mask] = elapsed_us[mask]
+
+    def add_samples(
+        self, raw: np.ndarray, elapsed_us: np.ndarray, valid: np.ndarray
+    ) -> bool:
+        """Add a reading to each `valid` row. As `ActuationClassifier.add_sample()`.
+
+        Returns False once every row is decided.
+        """
+        t = elapsed_us
+        np.maximum(self.peak_raw, np.where(valid, raw, 0), out=self.peak_raw)
+        active = valid & (self.phase != PHASE_DONE)
+        if not active.any():
+            return bool((self.phase != PHASE_DONE).any())
+        phase = self.phase.copy()  # Each row takes one branch, as in the firmware.
+
+        # Short: far above any stall current, for long enough to not be a glitch.
+        over = raw >= self.short_raw
+        new_short = active & over & (self.short_start_us < 0)
+        short = (
+            active & over & ~new_short & (t - self.short_start_us >= self.short_min_us)
+        )
+        self.short_start_us[new_short] = t[new_short]
+        self.short_start_us[active & ~over] = -1
+        self._decide(short, ac.LABEL_SHORT, t)
+        active &= ~short
+
+        rise = active & (phase == PHASE_IDLE) & (raw >= self.open_raw)
+        self.phase[rise] = PHASE_INRUSH
+        self.rise_us[rise] = t[rise]
+
+        inrush = active & (phase == PHASE_INRUSH)
+        spinning = inrush & (raw * 16 <= self.peak_raw * self.run_ratio_x16)
+        self.phase[spinning] = PHASE_RUNNING
+        self.plateau_x8[spinning] = raw[spinning] << 3
+        stalled = inrush & ~spinning & (t - self.rise_us >= self.stuck_min_us)
+        self._decide(stalled, self.stalled_label, t)
+
+        running = active & (phase == PHASE_RUNNING)
+        knee_raw = (self.plateau_x8 >> 3) * self.knee_ratio_x16 >> 4
+        high = running & (raw >= knee_raw) & (raw >= self.open_raw)
+        new_knee = high & (self.knee_start_us < 0)
+        ok = high & ~new_knee & (t - self.knee_start_us >= self.knee_min_us)
+        self.knee_start_us[new_knee] = t[new_knee]
+        self.knee_us[ok] = self.knee_start_us[ok]
+        self._decide(ok, ac.LABEL_OK, t)
+        low = running & ~high
+        self.knee_start_us[low] = -1
+        self.plateau_x8[low] += raw[low] - (self.plateau_x8[low] >> 3)
+        return True
+
+    def finish(self, elapsed_us: np.ndarray) -> None:
+        """End the actuation of each row. As `ActuationClassifier.finish()`."""
+        pending = self.label == ac.LABEL_PENDING
+        self._decide(pending & (self.phase == PHASE_IDLE), ac.LABEL_OPEN, elapsed_us)
+        stalled = (
+            pending
+            & (self.phase == PHASE_INRUSH)
+            & (elapsed_us - self.rise_us >= self.stuck_min_us)
+        )
+        self._decide(stalled, self.stalled_label, elapsed_us)
+        knee = pending & (self.phase == PHASE_RUNNING) & (self.knee_start_us >= 0)
+        self.knee_us[knee] = self.knee_start_us[knee]
+        self._decide(knee, ac.LABEL_OK, elapsed_us)
+        self._decide(self.label == ac.LABEL_PENDING, ac.LABEL_INCOMPLETE, elapsed_us)
+
+    def run(self, corpus: Corpus, traces: np.ndarray) -> BatchResult:
+        """Classify `corpus` trace `traces[i]` with the thresholds of row `i`."""
+        self.start(corpus.expect_travel[traces])
+        length = corpus.length[traces]
+        for i in range(int(length.max(initial=0))):
+            if not self.add_samples(
+                corpus.raw[traces, i].astype(np.int64),
+                corpus.elapsed_us[traces, i].astype(np.int64),
+                length > i,
+            ):
+                break
+        self.finish(corpus.drive_us[traces].astype(np.int64))
+        return BatchResult(
+            label=self.label, knee_us=self.knee_us, decided_us=self.decided_us
+        )
+
+
+def _reference_run(
+    corpus: Corpus, traces: np.ndarray, params: dict[str, int]
+) -> tuple[BatchResult, float]:
+    """Classify with the firmware code. Also returns its time per sample (s)."""
+    classifier = ac.ActuationClassifier(**params)
+    labels, knees = [], []
+    samples = 0
+    start_s = time.perf_counter()
+    for trace in traces.tolist():
+        classifier.start(int(corpus.expect_travel[trace]))
+        length = int(corpus.length[trace])
+        for raw, elapsed_us in zip(
+            corpus.raw[trace, :length].tolist(),
+            corpus.elapsed_us[trace, :length].tolist(),
+            strict=True,
+        ):
+            classifier.add_sample(raw, elapsed_us)
+        labels.append(classifier.finish(int(corpus.drive_us[trace])))
+        knees.append(classifier.knee_us)
+        samples += length
+    elapsed_s = time.perf_counter() - start_s
+    result = BatchResult(
+        label=np.array(labels, dtype=np.int8),
+        knee_us=np.array(knees, dtype=np.int64),
+        decided_us=np.empty(0),
+    )
+    return result, elapsed_s / max(samples, 1)
+
+
+def candidates(grid: dict[str, list[int]]) -> list[dict[str, int]]:
+    """Every combination of the grid values, other thresholds at their defaults."""
+    defaults = ac.ActuationClassifier().params()
+    names = list(grid)
+    return [
+        {**defaults, **dict(zip(names, values, strict=True))}
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def _percentile(values: np.ndarray, q: float) -> float | None:
+    return round(float(np.percentile(values, q)), 2) if len(values) else None
+
+
+def score(corpus: Corpus, result: BatchResult) -> dict:
+    """Accuracy, fault false positives/negatives, and latencies of one candidate."""
+    truth_fault = np.isin(corpus.label, ac.FAULT_LABELS)
+    found_fault = np.isin(result.label, ac.FAULT_LABELS)
+    correct = result.label == corpus.label
+    ok = (corpus.label == ac.LABEL_OK) & (result.label == ac.LABEL_OK)
+    knee_latency_ms = (result.decided_us[ok] - corpus.knee_us[ok]) / 1000
+    knee_error_ms = np.abs(result.knee_us[ok] - corpus.knee_us[ok]) / 1000
+    caught = truth_fault & found_fault
+    fault_latency_ms = result.decided_us[caught] / 1000
+    return {
+        "accuracy": round(float(correct.mean()), 4),
+        "false_positives": int(np.count_nonzero(found_fault & ~truth_fault)),
+        "false_negatives": int(np.count_nonzero(truth_fault & ~found_fault)),
+        "mislabels": int(np.count_nonzero(~correct)),
+        "ok_latency_ms": _percentile(knee_latency_ms, 50),
+        "ok_latency_p95_ms": _percentile(knee_latency_ms, 95),
+        "knee_error_ms": _percentile(knee_error_ms, 50),
+        "fault_latency_ms": _percentile(fault_latency_ms, 50),
+        "fault_latency_p95_ms": _percentile(fault_latency_ms, 95),
+    }
+
+
+def _rank_key(entry: dict) -> tuple:
+    metrics = entry["metrics"]
+    latency = metrics["ok_latency_ms"]
+    return (
+        metrics["false_positives"] + metrics["false_negatives"],
+        metrics["mislabels"],
+        latency if latency is not None else float("inf"),
+    )
+
+
+def benchmark(corpus: Corpus, params_list: list[dict[str, int]]) -> list[dict]:
+    """Run every candidate over the corpus. Returns them ranked, best first."""
+    per_batch = max(1, BATCH_ROWS // max(corpus.count, 1))
+    rng = np.random.default_rng(0)
+    reference_traces = np.sort(
+        rng.choice(
+            corpus.count, size=min(REFERENCE_TRACES, corpus.count), replace=False
+        )
+    )
+    entries = []
+    for first in range(0, len(params_list), per_batch):
+        batch = params_list[first : first + per_batch]
+        traces = np.tile(np.arange(corpus.count), len(batch))
+        row_params = {
+            name: np.repeat([params[name] for params in batch], corpus.count)
+            for name in ac.PARAM_NAMES
+        }
+        start_s = time.perf_counter()
+        result = BatchClassifier(row_params).run(corpus, traces)
+        batch_s = time.perf_counter() - start_s
+        batch_samples = int(corpus.length.sum()) * len(batch)
+        logger.info(
+            f"Candidates {first + 1}-{first + len(batch)}/{len(params_list)}: "
+            f"{batch_s:.2f} s ({batch_s / batch_samples * 1e9:.0f} ns/sample)."
+        )
+
+        for i, params in enumerate(batch):
+            rows = slice(i * corpus.count, (i + 1) * corpus.count)
+            row_result = BatchResult(
+                label=result.label[rows],
+                knee_us=result.knee_us[rows],
+                decided_us=result.decided_us[rows],
+            )
+            reference, per_sample_s = _reference_run(corpus, reference_traces, params)
+            if not (
+                np.array_equal(reference.label, row_result.label[reference_traces])
+                and np.array_equal(
+                    reference.knee_us, row_result.knee_us[reference_traces]
+                )
+            ):
+                msg = f"Batch classifier disagrees with the firmware code for {params}."
+                raise AssertionError(msg)
+            entries.append(
+                {
+                    "params": params,
+                    "metrics": {
+                        **score(corpus, row_result),
+                        "firmware_us_per_sample": round(per_sample_s * 1e6, 2),
+                    },
+                }
+            )
+    return sorted(entries, key=_rank_key)
+
+
+def _signature(
+    rng: np.random.Generator, label: int, times_us: np.ndarray, drive_us: int
+) -> tuple[np.ndarray, int]:
+    """Simulate the current (mA) of one drive with the true `label`, and its knee."""
+    noise_ma = rng.uniform(2, 8)
+    current = rng.normal(0, noise_ma, len(times_us))
+    stall_ma = rng.uniform(220, 380)
+    rise_us = rng.uniform(100, 600)
+    on = times_us >= rise_us
+    knee_us = -1
+    if label == ac.LABEL_OPEN:
+        current = np.abs(current) * rng.uniform(0.5, 1.5)  # Leakage and noise only.
+    elif label == ac.LABEL_SHORT:
+        current[on] += rng.uniform(600, 1_000)
+    elif label in (ac.LABEL_STUCK, ac.LABEL_AT_END_STOP, ac.LABEL_NO_TRAVEL):
+        current[on] += stall_ma
+    else:
+        plateau_ma = stall_ma * rng.uniform(0.3, 0.55)
+        inrush_us = rng.uniform(1_500, 4_000)
+        travel_us = (
+            rng.uniform(1.2, 2) * drive_us  # Never reaches the end stop.
+            if label == ac.LABEL_INCOMPLETE
+            else rng.uniform(0.3, 0.8) * drive_us
+        )
+        knee_us = int(rise_us + inrush_us + travel_us)
+        inrush = on & (times_us < rise_us + inrush_us)
+        running = (times_us >= rise_us + inrush_us) & (times_us < knee_us)
+        current[inrush] += stall_ma
+        current[running] += plateau_ma
+        current[times_us >= knee_us] += stall_ma
+        if label == ac.LABEL_INCOMPLETE:
+            knee_us = -1
+    # Occasional single-sample glitches (e.g., brush noise).
+    glitches = rng.random(len(times_us)) < rng.uniform(0, 0.01)
+    current[glitches] += rng.uniform(100, 700, np.count_nonzero(glitches))
+    return np.clip(current, 0, None), knee_us
+
+
+def simulate(count: int, seed: int = 0) -> Corpus:
+    """Make a corpus of `count` synthetic traces of every label."""
+    rng = np.random.default_rng(seed)
+    reference = ac.ActuationClassifier()
+    raw_per_ma = reference.mA_to_raw(1_000) / 1_000
+    # Label and the expected travel that goes with it. Ok drives are the most common.
+    kinds = [
+        (ac.LABEL_OK, ac.TRAVEL_YES, 0.5),
+        (ac.LABEL_OK, ac.TRAVEL_UNKNOWN, 0.1),
+        (ac.LABEL_AT_END_STOP, ac.TRAVEL_NO, 0.1),
+        (ac.LABEL_NO_TRAVEL, ac.TRAVEL_UNKNOWN, 0.05),
+        (ac.LABEL_STUCK, ac.TRAVEL_YES, 0.05),
+        (ac.LABEL_OPEN, ac.TRAVEL_YES, 0.07),
+        (ac.LABEL_SHORT, ac.TRAVEL_YES, 0.05),
+        (ac.LABEL_INCOMPLETE, ac.TRAVEL_YES, 0.08),
+    ]
+    choice = rng.choice(len(kinds), size=count, p=[kind[2] for kind in kinds])
+    drive_us = rng.integers(40_000, 120_000, count)
+    # Samples every ~SAMPLE_INTERVAL_US, with jitter.
+    max_samples = int(drive_us.max() / SAMPLE_INTERVAL_US * 1.2) + 1
+    intervals = rng.uniform(0.8, 1.2, (count, max_samples)) * SAMPLE_INTERVAL_US
+    elapsed_us = np.cumsum(intervals, axis=1).astype(np.int32)
+    length = (elapsed_us < drive_us[:, None]).sum(axis=1)
+
+    raw = np.zeros((count, max_samples), dtype=np.int16)
+    label = np.array([kinds[k][0] for k in choice], dtype=np.int8)
+    knee_us = np.full(count, -1, dtype=np.int64)
+    for i in range(count):
+        current_ma, knee_us[i] = _signature(
+            rng, int(label[i]), elapsed_us[i], int(drive_us[i])
+        )
+        raw[i] = np.minimum(current_ma * raw_per_ma, np.iinfo(np.int16).max)
+    return Corpus(
+        raw=raw,
+        elapsed_us=elapsed_us,
+        length=length,
+        drive_us=drive_us,
+        expect_travel=np.array([kinds[k][1] for k in choice], dtype=np.int8),
+        label=label,
+        knee_us=knee_us,
+    )
+
+
+def from_traces(traces_dir: Path, labels_path: Path | None = None) -> Corpus:
+    """Make a corpus of the single-dot drives recorded in `traces_dir`.
+
+    True labels are the board's, overridden by `labels_path` (JSON: drive index ->
+    label name, or {"label": ..., "knee_us": ...}), e.g., after reviewing outliers.
+    """
+    drives = [
+        drive
+        for drive in parse_drives(trace_files(traces_dir))
+        if drive.label is not None and drive.samples_raw
+    ]
+    overrides = json.loads(labels_path.read_text()) if labels_path else {}
+    count = len(drives)
+    max_samples = max((len(drive.samples_raw) for drive in drives), default=0)
+    raw = np.zeros((count, max_samples), dtype=np.int16)
+    elapsed_us = np.zeros((count, max_samples), dtype=np.int32)
+    label = np.empty(count, dtype=np.int8)
+    knee_us = np.empty(count, dtype=np.int64)
+    for i, drive in enumerate(drives):
+        raw[i, : len(drive.samples_raw)] = drive.samples_raw
+        elapsed_us[i, : len(drive.samples_us)] = drive.samples_us
+        override = overrides.get(str(i), {})
+        if isinstance(override, str):
+            override = {"label": override}
+        label[i] = (
+            ac.LABEL_NAMES.index(override["label"])
+            if "label" in override
+            else int(drive.label or ac.LABEL_PENDING)
+        )
+        knee_us[i] = override.get("knee_us", drive.knee_us)
+    return Corpus(
+        raw=raw,
+        elapsed_us=elapsed_us,
+        length=np.array([len(drive.samples_raw) for drive in drives]),
+        drive_us=np.array(
+            [
+                drive.drive_us if drive.drive_us is not None else drive.samples_us[-1]
+                for drive in drives
+            ]
+        ),
+        expect_travel=np.array([drive.expect_travel for drive in drives], np.int8),
+        label=label,
+        knee_us=knee_us,
+    )
+
+
+def export(entry: dict, path: Path, corpus_path: Path) -> None:
+    """Write a candidate's thresholds for `ActuationClassifier.load()`."""
+    data = {
+        "params": entry["params"],
+        "metrics": entry["metrics"],
+        "corpus": str(corpus_path),
+    }
+    path.write_text(json.dumps(data, indent=2))
+
+
+def _parse_grid(items: list[str] | None) -> dict[str, list[int]]:
+    if not items:
+        return DEFAULT_GRID
+    grid = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        if name not in ac.PARAM_NAMES:
+            msg = f"Unknown threshold {name!r}. Choose from {ac.PARAM_NAMES}."
+            raise ValueError(msg)
+        grid[name] = [int(value) for value in values.split(",")]
+    return grid
+
+
+def main() -> None:
+    """Make a corpus, or benchmark classifier thresholds on one."""
+    parser = argparse.ArgumentParser(description="Benchmark classifier thresholds.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    simulate_parser = subparsers.add_parser("simulate", help="Synthetic corpus.")
+    simulate_parser.add_argument("corpus", type=Path)
+    simulate_parser.add_argument("--count", type=int, default=5_000)
+    simulate_parser.add_argument("--seed", type=int, default=0)
+
+    traces_parser = subparsers.add_parser("from-traces", help="Recorded corpus.")
+    traces_parser.add_argument("traces", type=Path, help="Downloaded traces.")
+    traces_parser.add_argument("corpus", type=Path)
+    traces_parser.add_argument("--labels", type=Path, help="Reviewed labels (JSON).")
+
+    run_parser = subparsers.add_parser("run", help="Benchmark a grid of thresholds.")
+    run_parser.add_argument("corpus", type=Path)
+    run_parser.add_argument(
+        "--grid",
+        action="append",
+        help="name=v1,v2,... Repeatable. Default: a grid of the main thresholds.",
+    )
+    run_parser.add_argument("--top", type=int, default=10)
+    run_parser.add_argument("--json", type=Path, help="Write every result here.")
+    run_parser.add_argument("--export", type=Path, help="Write the best thresholds.")
+
+    args = parser.parse_args()
+
+    if args.command in ("simulate", "from-traces"):
+        if args.command == "simulate":
+            corpus = simulate(args.count, args.seed)
+        else:
+            corpus = from_traces(args.traces, args.labels)
+        corpus.save(args.corpus)
+        counts = np.bincount(corpus.label, minlength=len(ac.LABEL_NAMES))
+        logger.info(
+            f"Wrote {corpus.count} traces to {args.corpus}: "
+            + ", ".join(
+                f"{name}={count}"
+                for name, count in zip(ac.LABEL_NAMES, counts.tolist(), strict=True)
+                if count
+            )
+        )
+        return
+
+    corpus = Corpus.load(args.corpus)
+    params_list = candidates(_parse_grid(args.grid))
+    logger.info(
+        f"{len(params_list)} candidates x {corpus.count} traces "
+        f"({int(corpus.length.sum())} samples)."
+    )
+    start_s = time.perf_counter()
+    ranked = benchmark(corpus, params_list)
+    logger.info(f"Done in {time.perf_counter() - start_s:.1f} s. Best first:")
+    defaults = ac.ActuationClassifier().params()
+    for entry in ranked[: args.top]:
+        changed = {k: v for k, v in entry["params"].items() if v != defaults[k]}
+        logger.info(f"  {changed or 'defaults'}: {entry['metrics']}")
+
+    if args.json:
+        args.json.write_text(json.dumps(ranked, indent=2))
+    if args.export:
+        export(ranked[0], args.export, args.corpus)
+        logger.info(
+            f"Exported the best thresholds to {args.export}. Copy it to the board: "
+            f"mpremote cp {args.export} :classifier_params.json"
+        )
+
+
+if __name__ == "__main__":
+    main()
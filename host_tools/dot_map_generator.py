@@ -0,0 +1,242 @@
+"""Generate the firmware's dot <-> shift register output table from the schematic.
+
+The wiring is traced through the KiCad schematic's netlist (`kicad_schematic.py`):
+* Shift register chain: 74HC595s (pins `SER`, `QA`..`QH`, `QH'`), in order from the
+  one whose `SER` is not driven by another's `QH'`. The first bit shifted out by the
+  firmware ends up on the last output, so output `n` is pin `QA + n % 8` of the
+  `n // 8`-th register in the chain.
+* Each output drives an H-bridge input (`IN_x`), whose output (`OUT_x`) goes to a pin
+  of a motor connector. Driving pin 1 of the connector is "up", pin 2 is "down" (as
+  wired on Type 5 Rev 3, where the firmware's up/down were set).
+* Dots are numbered in chain order (by their first output), then per board. Boards
+  are chained (`SHIFT_SER_OUT` to the next board's `SHIFT_SER_IN`), each wired the same.
+
+The result is written as a firmware module (`firmware_upy/src/dot_map.py`): constant
+`bytes` tables, so a lookup is one index, with no allocation.
+
+Usage:
+    python -m host_tools.dot_map_generator --boards 2
+"""
+
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+from host_tools import kicad_sexpr
+from host_tools.firmware import FIRMWARE_SRC_DIR
+from host_tools.kicad_schematic import Netlist, load_netlist
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_SCHEMATIC = (
+    REPO_DIR
+    / "pcb"
+    / "Braille-PCB-Type-5-Vertical-Motors"
+    / "Braille-PCB-Type-5-Vertical-Motors.kicad_sch"
+)
+DEFAULT_OUTPUT = FIRMWARE_SRC_DIR / "dot_map.py"
+
+SHIFT_REGISTER_OUTPUTS = ("QA", "QB", "QC", "QD", "QE", "QF", "QG", "QH")
+DIRECTIONS = ("up", "down")  # Index = offset in the slot (dot * 2 + direction).
+MOTOR_PIN_DIRECTIONS = {"1": 0, "2": 1}  # Motor connector pin driven -> direction.
+NO_SLOT = 255
+
+
+@dataclass(kw_only=True)
+class OutputWiring:
+    """What one shift register output of a board drives."""
+
+    output: int
+    register: str  # E.g., "U601 QA".
+    driver: str  # E.g., "U201 IN_A".
+    motor: str  # Motor connector reference.
+    motor_pin: str  # Connector pin number driven.
+    net: str
+
+
+@dataclass(kw_only=True)
+class BoardMap:
+    """Wiring of one board."""
+
+    outputs: list[OutputWiring]
+    dot_motors: list[str]  # Motor connector of each dot.
+    revision: str
+
+    @property
+    def dot_count(self) -> int:
+        """Dots on one board."""
+        return len(self.dot_motors)
+
+    def slot_outputs(self) -> list[int]:
+        """Output of each slot (dot * 2 + direction) of the board."""
+        outputs = [NO_SLOT] * (self.dot_count * 2)
+        for wiring in self.outputs:
+            dot = self.dot_motors.index(wiring.motor)
+            outputs[dot * 2 + MOTOR_PIN_DIRECTIONS[wiring.motor_pin]] = wiring.output
+        return outputs
+
+
+def shift_register_chain(netlist: Netlist) -> list[str]:
+    """List the shift registers, from the first (fed by the MCU) to the last."""
+    registers = [
+        reference
+        for reference, component in netlist.components.items()
+        if {"SER", "QH'", *SHIFT_REGISTER_OUTPUTS} <= set(component.pin_names.values())
+    ]
+    fed_by = {}
+    for reference in registers:
+        for pin in netlist.net(reference, "SER").pins:
+            if pin[0] in registers and netlist.pin_name(*pin) == "QH'":
+                fed_by[reference] = pin[0]
+    heads = [reference for reference in registers if reference not in fed_by]
+    if len(heads) != 1:
+        msg = f"Expected one shift register chain, found heads {heads}."
+        raise ValueError(msg)
+    chain = heads
+    next_of = {previous: reference for reference, previous in fed_by.items()}
+    while chain[-1] in next_of:
+        chain.append(next_of[chain[-1]])
+    return chain
+
+
+def _trace_output(
+    netlist: Netlist, output: int, register: str, pin: str
+) -> OutputWiring:
+    """Follow output `pin` of `register` through its H-bridge to a motor connector."""
+    net = netlist.net(register, pin)
+    for reference, number in net.pins:
+        name = netlist.pin_name(reference, number)
+        if not name.startswith("IN"):
+            continue
+        driven = netlist.net(reference, "OUT" + name[2:])
+        motor_pins = [
+            (motor, motor_pin)
+            for motor, motor_pin in driven.pins
+            if netlist.components[motor].lib_id.startswith("Connector")
+        ]
+        if len(motor_pins) != 1:
+            msg = f"{reference} {name} drives {len(motor_pins)} connector pins."
+            raise ValueError(msg)
+        motor, motor_pin = motor_pins[0]
+        return OutputWiring(
+            output=output,
+            register=f"{register} {pin}",
+            driver=f"{reference} {name}",
+            motor=motor,
+            motor_pin=motor_pin,
+            net=net.name,
+        )
+    msg = f"{register} {pin} ({net.name}) does not drive an H-bridge input."
+    raise ValueError(msg)
+
+
+def board_map(schematic: Path) -> BoardMap:
+    """Trace every shift register output of the board in `schematic`."""
+    netlist = load_netlist(schematic)
+    outputs = []
+    for index, register in enumerate(shift_register_chain(netlist)):
+        for bit, pin in enumerate(SHIFT_REGISTER_OUTPUTS):
+            output = index * len(SHIFT_REGISTER_OUTPUTS) + bit
+            outputs.append(_trace_output(netlist, output, register, pin))
+
+    dot_motors: list[str] = []
+    for wiring in outputs:  # In output order, so dots are numbered in chain order.
+        if wiring.motor not in dot_motors:
+            dot_motors.append(wiring.motor)
+    for motor in dot_motors:
+        pins = sorted(w.motor_pin for w in outputs if w.motor == motor)
+        if pins != sorted(MOTOR_PIN_DIRECTIONS):
+            msg = f"Motor {motor} is driven on pins {pins}, expected one of each."
+            raise ValueError(msg)
+
+    title_block = kicad_sexpr.child(kicad_sexpr.load(schematic), "title_block")
+    revision = kicad_sexpr.child(title_block, "rev") if title_block else None
+    return BoardMap(
+        outputs=outputs,
+        dot_motors=dot_motors,
+        revision=revision[1] if revision else "",
+    )
+
+
+def _bytes_literal(values: list[int]) -> str:
+    """`bytes((...))` source, 16 values per line."""
+    rows = "".join(
+        "    " + ", ".join(str(value) for value in values[i : i + 16]) + ",\n"
+        for i in range(0, len(values), 16)
+    )
+    return f"bytes((\n{rows}))"
+
+
+def render_module(board: BoardMap, board_count: int, schematic: Path) -> str:
+    """Source of the firmware module for `board_count` chained boards."""
+    outputs_per_board = len(board.outputs)
+    slot_outputs = [
+        output + b * outputs_per_board
+        for b in range(board_count)
+        for output in board.slot_outputs()
+    ]
+    output_slots = [NO_SLOT] * (outputs_per_board * board_count)
+    for slot, output in enumerate(slot_outputs):
+        output_slots[output] = slot
+
+    wiring_lines = []
+    for dot, motor in enumerate(board.dot_motors):
+        parts = []
+        for wiring in sorted(
+            (w for w in board.outputs if w.motor == motor),
+            key=lambda w: MOTOR_PIN_DIRECTIONS[w.motor_pin],
+        ):
+            direction = DIRECTIONS[MOTOR_PIN_DIRECTIONS[wiring.motor_pin]]
+            parts.append(
+                f"{direction}: {wiring.output} ({wiring.register}, {wiring.driver})"
+            )
+        wiring_lines.append(f"#   Dot {dot}: {motor}, {', '.join(parts)}.")
+    wiring = "\n".join(wiring_lines)
+
+    revision = f" ({board.revision})" if board.revision else ""
+    return f'''"""Shift register output of each dot and direction, and back.
+
+Generated by `host_tools/dot_map_generator.py` from the schematic{revision}:
+{schematic.name}
+Do not edit: regenerate it after changing the schematic or the number of boards.
+"""
+
+BOARD_COUNT = {board_count}
+DOTS_PER_BOARD = {board.dot_count}
+OUTPUTS_PER_BOARD = {outputs_per_board}
+DOT_COUNT = {board.dot_count * board_count}
+OUTPUT_COUNT = {outputs_per_board * board_count}
+NO_SLOT = {NO_SLOT}
+
+# fmt: off
+# Output that drives each slot: `SLOT_OUTPUTS[dot * 2 + direction]` (0: up, 1: down).
+SLOT_OUTPUTS = {_bytes_literal(slot_outputs)}
+
+# Slot driven by each output (`NO_SLOT` if none).
+OUTPUT_SLOTS = {_bytes_literal(output_slots)}
+# fmt: on
+
+# Wiring of each board:
+{wiring}
+'''
+
+
+def main() -> None:
+    """Trace the schematic and write the firmware's dot map module."""
+    parser = argparse.ArgumentParser(description="Generate the firmware's dot map.")
+    parser.add_argument("--schematic", type=Path, default=DEFAULT_SCHEMATIC)
+    parser.add_argument("--boards", type=int, default=2, help="Chained boards.")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    board = board_map(args.schematic)
+    args.output.write_text(render_module(board, args.boards, args.schematic))
+    logger.info(
+        f"Wrote {args.output}: {args.boards} boards x {board.dot_count} dots "
+        f"({len(board.outputs)} outputs per board)."
+    )
+
+
+if __name__ == "__main__":
+    main()
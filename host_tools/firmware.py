@@ -0,0 +1,26 @@
+"""Import the pure-Python firmware modules (`firmware_upy/src/`) on the host.
+
+The classifier and drive tuner run unchanged on the host, so that recorded sessions
+can be replayed through exactly the code that runs on the board.
+"""
+
+import sys
+from pathlib import Path
+
+FIRMWARE_SRC_DIR = Path(__file__).resolve().parent.parent / "firmware_upy" / "src"
+
+if str(FIRMWARE_SRC_DIR) not in sys.path:
+    sys.path.append(str(FIRMWARE_SRC_DIR))
+
+import actuation_classifier  # noqa: E402
+import dot_map  # noqa: E402
+import drive_tuning  # noqa: E402
+import trace_log  # noqa: E402
+
+__all__ = [
+    "FIRMWARE_SRC_DIR",
+    "actuation_classifier",
+    "dot_map",
+    "drive_tuning",
+    "trace_log",
+]
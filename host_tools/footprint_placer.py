@@ -0,0 +1,245 @@
+"""Place the housing's footprints on the KiCad board from a `HousingSpec`.
+
+Moves these footprints to the positions computed in `cad/housing_spec.py`
+(the same ones `cad_pcb_check.py` checks):
+* `Motor_Tiny_0408_Vertical`: the motors of this layer (`motor_coordinates()`).
+* `Hole_for_Motor_Shaft`: the motors of the other layer.
+* `Braille_Block_MountingHoles_M2_3x`: one per column of mounting holes, at its
+  center (the footprint has the 3 holes of a column).
+
+Only footprints already in the housing are moved: those within its current extent
+(the bounding box of the default spec's positions, plus a margin). Others, e.g., of
+another housing on the board, are left where they are. Each CAD position is assigned
+the footprint of its kind that's closest overall (an optimal assignment, so the
+footprints keep their relative order after a pitch change). The housing's center
+stays where its motors are now, unless given.
+
+Footprints are never added or removed: a spec with more positions than the housing
+has footprints (e.g., more cells) is an error: add the footprints in KiCad first.
+With fewer positions, the housing's extra footprints are left where they are.
+
+Only the `(at ...)` of each moved footprint is rewritten, keeping its rotation: the
+rest of the file is copied as is, in one pass. Tracks are not moved; re-route them in
+KiCad.
+
+Usage:
+    python -m host_tools.footprint_placer --set cell_pitch_x=6.2 --dry-run
+"""
+
+import argparse
+import dataclasses
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
+
+from cad.housing_spec import (
+    HousingSpec,
+    motor_coordinates,
+    mounting_hole_coordinates,
+)
+from host_tools import kicad_sexpr
+from host_tools.cad_pcb_check import (
+    DEFAULT_BOARD,
+    MOTOR_FOOTPRINT,
+    MOUNTING_HOLES_FOOTPRINT,
+    SHAFT_HOLE_FOOTPRINT,
+    footprint_positions,
+    housing_origin,
+)
+
+MOVE_EPSILON_MM = 1e-4  # Footprints closer than this to their target are not moved.
+# Footprints this far outside the housing's current positions still belong to it.
+EXTENT_MARGIN_MM = 1.0
+
+
+@dataclass(kw_only=True)
+class Placement:
+    """A footprint and where it goes."""
+
+    reference: str
+    span: kicad_sexpr.Span  # The footprint's `(at ...)` node.
+    old: tuple[float, float, float]  # X, Y (mm), rotation (degrees).
+    new: tuple[float, float]
+
+    @property
+    def distance_mm(self) -> float:
+        """How far the footprint moves."""
+        return float(np.hypot(self.new[0] - self.old[0], self.new[1] - self.old[1]))
+
+    def at_text(self) -> str:
+        """Source of the new `(at ...)` node."""
+        values = [*self.new, self.old[2]] if self.old[2] else self.new
+        return f"(at {' '.join(_format_mm(value) for value in values)})"
+
+
+def _format_mm(value: float) -> str:
+    """Format like KiCad: up to 6 decimals, no trailing zeros."""
+    text = f"{value:.6f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _column_centers(points: list[tuple[float, float]]) -> list[tuple[float, float]]:
+    """Center of each column (same X) of `points`."""
+    columns: dict[float, list[float]] = {}
+    for x, y in points:
+        columns.setdefault(x, []).append(y)
+    return [(x, sum(ys) / len(ys)) for x, ys in sorted(columns.items())]
+
+
+def target_positions(spec: HousingSpec) -> dict[str, list[tuple[float, float]]]:
+    """Positions (housing frame, mm, Y up) of each footprint, by library ID."""
+    return {
+        MOTOR_FOOTPRINT: motor_coordinates(spec),
+        SHAFT_HOLE_FOOTPRINT: motor_coordinates(spec, other_layer=True),
+        MOUNTING_HOLES_FOOTPRINT: _column_centers(mounting_hole_coordinates(spec)),
+    }
+
+
+def housing_extent(
+    spec: HousingSpec, origin: tuple[float, float]
+) -> tuple[float, float, float, float]:
+    """Board bounding box (min X, min Y, max X, max Y) of the positions of `spec`."""
+    points = np.array(
+        [point for targets in target_positions(spec).values() for point in targets]
+    )
+    x_min, y_min = points.min(axis=0)
+    x_max, y_max = points.max(axis=0)
+    # Housing frame (Y up) to board (Y down).
+    return (
+        origin[0] + x_min - EXTENT_MARGIN_MM,
+        origin[1] - y_max - EXTENT_MARGIN_MM,
+        origin[0] + x_max + EXTENT_MARGIN_MM,
+        origin[1] - y_min + EXTENT_MARGIN_MM,
+    )
+
+
+def plan_placements(
+    index: kicad_sexpr.FileIndex,
+    spec: HousingSpec,
+    origin: tuple[float, float] | None = None,
+    *,
+    current_spec: HousingSpec | None = None,
+) -> list[Placement]:
+    """Assign each position of `spec` a footprint of the housing, and where it goes.
+
+    `origin` is the board position of the housing's center. Default: where the
+    current motor footprints are centered. The housing's footprints are those within
+    the extent of `current_spec` (the layout the board has now; default: the default
+    spec). Raises `ValueError` if there are fewer of them than positions.
+    """
+    if origin is None:
+        origin = housing_origin(spec, footprint_positions(index, MOTOR_FOOTPRINT))
+    x_min, y_min, x_max, y_max = housing_extent(current_spec or HousingSpec(), origin)
+    placements = []
+    for lib_id, targets in target_positions(spec).items():
+        footprints = {
+            reference: span
+            for reference, span in index.footprints_of(lib_id).items()
+            if x_min <= index.at(span)[0] <= x_max
+            and y_min <= index.at(span)[1] <= y_max
+        }
+        if len(footprints) < len(targets):
+            msg = (
+                f"{len(targets)} {lib_id} positions, but only {len(footprints)} such "
+                "footprints in the housing: add the missing ones in KiCad first."
+            )
+            raise ValueError(msg)
+        if not targets:
+            continue
+        references = list(footprints)
+        current = [index.at(footprints[reference]) for reference in references]
+        # Housing frame (Y up) to board (Y down).
+        board_targets = [(origin[0] + x, origin[1] - y) for x, y in targets]
+        cost = cdist(np.array(board_targets), np.array(current)[:, :2])
+        target_indices, footprint_indices = linear_sum_assignment(cost)
+        for target_index, footprint_index in zip(
+            target_indices, footprint_indices, strict=True
+        ):
+            reference = references[footprint_index]
+            at_span = index.child_span(footprints[reference], "at")
+            if at_span is None:
+                msg = f"Footprint {reference} has no position."
+                raise ValueError(msg)
+            placements.append(
+                Placement(
+                    reference=reference,
+                    span=at_span,
+                    old=current[footprint_index],
+                    new=board_targets[target_index],
+                )
+            )
+    return placements
+
+
+def _parse_spec(assignments: list[str]) -> HousingSpec:
+    """Make the default `HousingSpec`, with `name=value` fields changed."""
+    spec = HousingSpec()
+    numeric_fields = {
+        field.name: float if field.type in (float, "float") else int
+        for field in dataclasses.fields(spec)
+        if field.type in (int, float, "int", "float")
+    }
+    changes: dict[str, int | float] = {}
+    for assignment in assignments:
+        name, _, value = assignment.partition("=")
+        if name not in numeric_fields:
+            msg = f"Not a numeric HousingSpec field: {name!r}."
+            raise ValueError(msg)
+        changes[name] = numeric_fields[name](value)
+    return dataclasses.replace(spec, **changes) if changes else spec
+
+
+def main() -> None:
+    """Move the housing's footprints on the board to the spec's positions."""
+    parser = argparse.ArgumentParser(description="Place footprints from the CAD.")
+    parser.add_argument("--board", type=Path, default=DEFAULT_BOARD)
+    parser.add_argument(
+        "--output", type=Path, help="Where to write the board. Default: in place."
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Change a HousingSpec field (e.g., cell_pitch_x=6.2).",
+    )
+    parser.add_argument(
+        "--origin",
+        type=float,
+        nargs=2,
+        metavar=("X", "Y"),
+        help="Board position of the housing's center. Default: the motors' center.",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only list the moves.")
+    args = parser.parse_args()
+
+    spec = _parse_spec(args.set)
+    start_s = time.perf_counter()
+    with kicad_sexpr.FileIndex(args.board) as index:
+        placements = plan_placements(index, spec, args.origin)
+        moves = [p for p in placements if p.distance_mm > MOVE_EPSILON_MM]
+        for placement in moves:
+            logger.info(
+                f"{placement.reference}: ({placement.old[0]}, {placement.old[1]}) -> "
+                f"({placement.new[0]:.4f}, {placement.new[1]:.4f}), "
+                f"{placement.distance_mm:.3f} mm."
+            )
+        if moves and not args.dry_run:
+            index.write(
+                args.output or args.board,
+                {placement.span: placement.at_text() for placement in moves},
+            )
+    duration_ms = (time.perf_counter() - start_s) * 1000
+    logger.info(
+        f"{len(moves)} of {len(placements)} footprints moved"
+        f"{' (dry run)' if args.dry_run else ''}, in {duration_ms:.1f} ms."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Netlist of a hierarchical KiCad schematic, from the drawing itself.
+
+KiCad only writes a netlist on export. This derives it from the `.kicad_sch` files,
+the same way the schematic editor connects items:
+* Items connect where their connection points coincide: wire ends, symbol pins, label
+  anchors, sheet pins, and junctions. A point on the middle of a wire connects to it.
+* Labels connect by name: local labels within one sheet instance, hierarchical labels
+  to the pin of the same name on the parent's sheet symbol, global labels and power
+  symbols everywhere.
+
+Every instance of a sheet (e.g., 4 x `Braille_Cell.kicad_sch`) gets its own nets, and
+its symbols get the reference designators of that instance.
+
+Not supported (not used by this project): buses, net classes, `no_connect` checks.
+"""
+
+import itertools
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from host_tools import kicad_sexpr
+from host_tools.kicad_sexpr import Node
+
+GRID_PER_MM = 100  # Coordinates are matched on a 0.01 mm grid.
+
+Point = tuple[int, int]
+
+
+@dataclass(kw_only=True)
+class Component:
+    """A placed symbol (all of its units), in one sheet instance."""
+
+    reference: str
+    lib_id: str
+    value: str
+    sheet: str  # Sheet instance, as names (e.g., "/Braille_Cells_and_Controls/...").
+    pin_names: dict[str, str] = field(default_factory=dict)  # By pin number.
+
+
+@dataclass(kw_only=True)
+class Net:
+    """Pins connected together, and the labels on them."""
+
+    name: str
+    pins: list[tuple[str, str]] = field(default_factory=list)  # (Reference, number).
+    labels: list[str] = field(default_factory=list)  # Sheet-qualified, e.g. "/A/x".
+
+
+@dataclass(kw_only=True)
+class Netlist:
+    """Components and nets of a whole schematic hierarchy."""
+
+    components: dict[str, Component]
+    nets: list[Net]
+    net_of_pin: dict[tuple[str, str], Net]  # By (reference, pin number).
+
+    def net(self, reference: str, pin_name: str) -> Net:
+        """Net of the pin named `pin_name` (e.g., "QA") of `reference`."""
+        component = self.components[reference]
+        for number, name in component.pin_names.items():
+            if name == pin_name:
+                return self.net_of_pin[reference, number]
+        msg = f"{reference} has no pin {pin_name!r}."
+        raise KeyError(msg)
+
+    def pin_name(self, reference: str, number: str) -> str:
+        """Name of pin `number` of `reference`."""
+        return self.components[reference].pin_names[number]
+
+
+class _UnionFind:
+    def __init__(self) -> None:
+        self.parent: dict[tuple, tuple] = {}
+
+    def find(self, key: tuple) -> tuple:
+        parent = self.parent.setdefault(key, key)
+        if parent == key:
+            return key
+        root = self.find(parent)
+        self.parent[key] = root
+        return root
+
+    def union(self, a: tuple, b: tuple) -> None:
+        root_a = self.find(a)
+        root_b = self.find(b)
+        if root_a != root_b:
+            self.parent[root_a] = root_b
+
+
+def _point(x: float, y: float) -> Point:
+    return round(x * GRID_PER_MM), round(y * GRID_PER_MM)
+
+
+def _pin_position(symbol: Node, pin: Node) -> Point:
+    """Schematic position of `pin` (from the library symbol) of placed `symbol`.
+
+    Library coordinates have Y up, schematic coordinates Y down. The symbol is rotated
+    (counterclockwise on screen), then mirrored.
+    """
+    x, y, angle = kicad_sexpr.at(symbol)
+    px, py, _ = kicad_sexpr.at(pin)
+    py = -py
+    turns = round(angle / 90) % 4
+    for _ in range(turns):
+        px, py = py, -px
+    mirror = kicad_sexpr.child(symbol, "mirror")
+    if mirror is not None and mirror[1] == "x":
+        py = -py
+    elif mirror is not None and mirror[1] == "y":
+        px = -px
+    return _point(x + px, y + py)
+
+
+def _library_pins(library: Node, unit: int) -> list[Node]:
+    """Pins of `unit` of a library symbol (with the pins common to all units)."""
+    pins = []
+    for sub in kicad_sexpr.children(library, "symbol"):
+        sub_unit, body_style = (int(part) for part in sub[1].rsplit("_", 2)[1:])
+        if sub_unit in (0, unit) and body_style in (0, 1):
+            pins.extend(kicad_sexpr.children(sub, "pin"))
+    return pins
+
+
+def _instance_reference(symbol: Node, instance: str) -> tuple[str, int]:
+    """Get the reference designator and unit of `symbol` in sheet `instance`."""
+    instances = kicad_sexpr.child(symbol, "instances")
+    unit_node = kicad_sexpr.child(symbol, "unit")
+    unit = int(unit_node[1]) if unit_node else 1
+    if instances is not None:
+        for project in kicad_sexpr.children(instances, "project"):
+            for path in kicad_sexpr.children(project, "path"):
+                if path[1] == instance:
+                    reference = kicad_sexpr.child(path, "reference")
+                    path_unit = kicad_sexpr.child(path, "unit")
+                    if reference is not None:
+                        return reference[1], int(path_unit[1]) if path_unit else unit
+    return kicad_sexpr.properties(symbol)["Reference"], unit
+
+
+def _on_segment(point: Point, start: Point, end: Point) -> bool:
+    (x, y), (x1, y1), (x2, y2) = point, start, end
+    if not (min(x1, x2) <= x <= max(x1, x2) and min(y1, y2) <= y <= max(y1, y2)):
+        return False
+    return (x2 - x1) * (y - y1) == (y2 - y1) * (x - x1)
+
+
+class _Builder:
+    def __init__(self) -> None:
+        self.union_find = _UnionFind()
+        self.components: dict[str, Component] = {}
+        self.labels: dict[tuple, str] = {}  # Label key -> sheet-qualified name.
+        self.files: dict[Path, Node] = {}
+        # Connection points and wire segments of the sheet instance being added.
+        self.points: set[Point] = set()
+        self.segments: list[tuple[Point, Point]] = []
+
+    def _connect(self, instance: str, point: Point, key: tuple) -> None:
+        self.points.add(point)
+        self.union_find.union(("point", instance, point), key)
+
+    def add_sheet(self, path: Path, instance: str, sheet_names: str) -> None:
+        """Add one instance of the sheet in `path`, and its sub-sheets."""
+        if path not in self.files:
+            self.files[path] = kicad_sexpr.load(path)
+        schematic = self.files[path]
+        if not instance:
+            instance = "/" + kicad_sexpr.child(schematic, "uuid")[1]  # type: ignore[index]
+        self._add_wires(schematic, instance)
+        self._add_labels(schematic, instance, sheet_names)
+        self._add_symbols(schematic, instance, sheet_names)
+        sheets = list(kicad_sexpr.children(schematic, "sheet"))
+        for sheet in sheets:
+            uuid = kicad_sexpr.child(sheet, "uuid")[1]  # type: ignore[index]
+            for pin in kicad_sexpr.children(sheet, "pin"):
+                self._connect(
+                    instance,
+                    _point(*kicad_sexpr.at(pin)[:2]),
+                    ("hierarchical_label", f"{instance}/{uuid}", pin[1]),
+                )
+
+        # Points on the middle of a wire connect to it.
+        for point in self.points:
+            for start, end in self.segments:
+                if point not in (start, end) and _on_segment(point, start, end):
+                    self._connect(instance, point, ("point", instance, start))
+
+        for sheet in sheets:
+            sheet_properties = kicad_sexpr.properties(sheet)
+            uuid = kicad_sexpr.child(sheet, "uuid")[1]  # type: ignore[index]
+            self.add_sheet(
+                path.parent / sheet_properties["Sheetfile"],
+                f"{instance}/{uuid}",
+                f"{sheet_names}/{sheet_properties['Sheetname']}",
+            )
+
+    def _add_wires(self, schematic: Node, instance: str) -> None:
+        self.points = set()
+        self.segments = []
+        for wire in kicad_sexpr.children(schematic, "wire"):
+            pts = kicad_sexpr.child(wire, "pts") or ["pts"]
+            ends = [_point(float(xy[1]), float(xy[2])) for xy in pts[1:]]
+            for start, end in itertools.pairwise(ends):
+                self._connect(instance, start, ("point", instance, end))
+                self.points.add(end)
+                self.segments.append((start, end))
+        for junction in kicad_sexpr.children(schematic, "junction"):
+            self.points.add(_point(*kicad_sexpr.at(junction)[:2]))
+
+    def _add_labels(self, schematic: Node, instance: str, sheet_names: str) -> None:
+        for kind, scope in (
+            ("label", instance),
+            ("hierarchical_label", instance),
+            ("global_label", ""),
+        ):
+            for label in kicad_sexpr.children(schematic, kind):
+                key = (kind, scope, label[1])
+                self.labels[key] = (
+                    label[1] if kind == "global_label" else f"{sheet_names}/{label[1]}"
+                )
+                self._connect(instance, _point(*kicad_sexpr.at(label)[:2]), key)
+
+    def _add_symbols(self, schematic: Node, instance: str, sheet_names: str) -> None:
+        lib_symbols = kicad_sexpr.child(schematic, "lib_symbols") or ["lib_symbols"]
+        libraries = {lib[1]: lib for lib in kicad_sexpr.children(lib_symbols, "symbol")}
+        for symbol in kicad_sexpr.children(schematic, "symbol"):
+            lib_id = kicad_sexpr.child(symbol, "lib_id")
+            if lib_id is None:
+                continue
+            reference, unit = _instance_reference(symbol, instance)
+            value = kicad_sexpr.properties(symbol).get("Value", "")
+            # Power symbols connect their pin to the global net of their value.
+            power = lib_id[1].startswith("power:")
+            if power:
+                self.labels.setdefault(("global_label", "", value), value)
+            elif reference not in self.components:
+                self.components[reference] = Component(
+                    reference=reference,
+                    lib_id=lib_id[1],
+                    value=value,
+                    sheet=sheet_names or "/",
+                )
+            for pin in _library_pins(libraries[lib_id[1]], unit):
+                number = kicad_sexpr.child(pin, "number")[1]  # type: ignore[index]
+                if power:
+                    key = ("global_label", "", value)
+                else:
+                    name = kicad_sexpr.child(pin, "name")[1]  # type: ignore[index]
+                    self.components[reference].pin_names[number] = name
+                    key = ("pin", reference, number)
+                self._connect(instance, _pin_position(symbol, pin), key)
+
+    def netlist(self) -> Netlist:
+        groups: dict[tuple, Net] = {}
+        net_of_pin: dict[tuple[str, str], Net] = {}
+        find = self.union_find.find
+        for key in list(self.union_find.parent):
+            if key[0] == "pin":
+                net = groups.setdefault(find(key), Net(name=""))
+                net.pins.append((key[1], key[2]))
+                net_of_pin[key[1], key[2]] = net
+        for key, label in self.labels.items():
+            net = groups.get(find(key))
+            if net is not None and label not in net.labels:
+                net.labels.append(label)
+        for net in groups.values():
+            net.pins.sort(key=_pin_sort_key)
+            # Global names first, then the shortest (highest-level) label.
+            named = sorted(net.labels, key=lambda n: (n.startswith("/"), n.count("/")))
+            reference, number = net.pins[0]
+            net.name = named[0] if named else f"Net-({reference}-Pad{number})"
+        return Netlist(
+            components=self.components,
+            nets=sorted(groups.values(), key=lambda net: net.name),
+            net_of_pin=net_of_pin,
+        )
+
+
+def _pin_sort_key(pin: tuple[str, str]) -> tuple:
+    reference, number = pin
+    prefix = reference.rstrip("0123456789")
+    suffix = reference[len(prefix) :]
+    return prefix, int(suffix) if suffix else -1, number.zfill(4)
+
+
+def load_netlist(root_schematic: Path) -> Netlist:
+    """Derive the netlist of the hierarchy under `root_schematic`."""
+    builder = _Builder()
+    builder.add_sheet(root_schematic, "", "")
+    return builder.netlist()
@@ -0,0 +1,330 @@
+"""Parse KiCad files (schematics, boards): S-expressions into nested lists.
+
+A node is a list: its first item is the node's keyword (e.g., `"symbol"`), then its
+atoms and child nodes, in order. Atoms are strings, quoted or not (so `(at 1 2 0)`
+becomes `["at", "1", "2", "0"]`).
+
+Large files (the 2.2 MB `.kicad_pcb`) are better read through `FileIndex`: the file
+is memory-mapped, only the byte ranges of the top-level nodes are indexed, and a node
+is parsed when it's asked for. The index relies on KiCad's own layout (one top-level
+node per line, indented with one tab, no raw newlines in strings), and falls back to
+scanning every parenthesis for other files.
+
+Usage (e.g., the position of each motor):
+    python -m host_tools.kicad_sexpr BOARD --footprint Motor_Tiny_0408_Vertical
+"""
+
+import argparse
+import itertools
+import mmap
+import re
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+from types import TracebackType
+from typing import Self
+
+from loguru import logger
+
+Node = list  # list[str | Node]
+
+_TOKEN_RE = re.compile(r'\(|\)|"((?:[^"\\]|\\.)*)"|([^\s()"]+)')
+_ESCAPE_RE = re.compile(r"\\(.)")
+# The same, on the raw bytes of a file.
+_BYTES_TOKEN_RE = re.compile(rb'\(|\)|"((?:[^"\\]|\\.)*)"|([^\s()"]+)')
+_TOP_LEVEL_RE = re.compile(
+    rb'^\t\(([^\s()"]+)(?:[ \t]+"((?:[^"\\]|\\.)*)")?', re.MULTILINE
+)
+_REFERENCE_RE = re.compile(rb'\(property "Reference" "((?:[^"\\]|\\.)*)"')
+
+
+def parse(text: str) -> Node:
+    """Parse the first S-expression in `text`."""
+    stack: list[Node] = [[]]
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        if token == "(":  # noqa: S105
+            node: Node = []
+            stack[-1].append(node)
+            stack.append(node)
+        elif token == ")":  # noqa: S105
+            stack.pop()
+            if len(stack) == 1:
+                break
+        elif match.group(1) is not None:
+            stack[-1].append(_ESCAPE_RE.sub(r"\1", match.group(1)))
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1 or not stack[0]:
+        msg = "Unbalanced or empty S-expression."
+        raise ValueError(msg)
+    return stack[0][0]
+
+
+def load(path: Path) -> Node:
+    """Parse a KiCad file."""
+    return parse(path.read_text(encoding="utf-8"))
+
+
+def children(node: Node, keyword: str) -> Iterator[Node]:
+    """Child nodes of `node` with `keyword`."""
+    for item in node[1:]:
+        if isinstance(item, list) and item and item[0] == keyword:
+            yield item
+
+
+def child(node: Node, keyword: str) -> Node | None:
+    """Get the first child node of `node` with `keyword`, if any."""
+    return next(children(node, keyword), None)
+
+
+def properties(node: Node) -> dict[str, str]:
+    """Get the `(property "name" "value" ...)` children of `node`, by name."""
+    return {prop[1]: prop[2] for prop in children(node, "property")}
+
+
+def at(node: Node) -> tuple[float, float, float]:
+    """Get the `(at x y [angle])` of `node`: position (mm), rotation (degrees)."""
+    position = child(node, "at")
+    if position is None:
+        msg = f"No position in ({node[0]} ...)."
+        raise ValueError(msg)
+    x, y, *angle = (float(value) for value in position[1:4])
+    return x, y, angle[0] if angle else 0.0
+
+
+def _unquote(atom: bytes) -> str:
+    return _ESCAPE_RE.sub(r"\1", atom.decode())
+
+
+@dataclass(frozen=True, kw_only=True)
+class Span:
+    """Byte range of a node in a file, with its keyword and first atom."""
+
+    keyword: str
+    name: str  # First atom, if quoted (e.g., a footprint's library ID). Else "".
+    start: int  # Offset of the "(".
+    end: int  # Offset just after the ")".
+
+
+class FileIndex:
+    """Lazy index of the top-level nodes of a KiCad file, by byte range."""
+
+    def __init__(self, path: Path) -> None:
+        """Memory-map the file at `path`. Nothing is read until it's queried."""
+        self.path = path
+        with path.open("rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        """Unmap the file."""
+        self.buffer.close()
+
+    def __enter__(self) -> Self:
+        """Use as a context manager, to unmap the file at the end."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Unmap the file."""
+        self.close()
+
+    def tokens(self, start: int, end: int) -> Iterator[re.Match[bytes]]:
+        """Stream the tokens between offsets `start` and `end`, without parsing."""
+        return _BYTES_TOKEN_RE.finditer(self.buffer, start, end)
+
+    @cached_property
+    def spans(self) -> list[Span]:
+        """Top-level nodes, in file order."""
+        first_line = self.buffer.find(b"\n") + 1
+        if self.buffer[first_line : first_line + 2] != b"\t(":
+            return self._scan_spans()
+        matches = list(_TOP_LEVEL_RE.finditer(self.buffer))
+        ends = [match.start() for match in matches[1:]] + [self.buffer.rfind(b")")]
+        return [
+            Span(
+                keyword=match.group(1).decode(),
+                name=_unquote(match.group(2)) if match.group(2) is not None else "",
+                start=match.start() + 1,
+                end=self.buffer.rfind(b")", match.start(), end) + 1,
+            )
+            for match, end in zip(matches, ends, strict=True)
+        ]
+
+    def _scan_spans(self) -> list[Span]:
+        """Find the top-level nodes by tracking the depth of every token."""
+        spans = []
+        depth = 0
+        start = 0
+        header: list[re.Match[bytes]] = []
+        for match in self.tokens(0, len(self.buffer)):
+            token = match.group()
+            if token == b"(":
+                depth += 1
+                if depth == 2:  # noqa: PLR2004 (Children of the root node.)
+                    start = match.start()
+                    header = []
+            elif token == b")":
+                depth -= 1
+                if depth == 1:
+                    keyword = header[0].group() if header else b""
+                    quoted = header[1].group(1) if len(header) > 1 else None
+                    spans.append(
+                        Span(
+                            keyword=keyword.decode(),
+                            name=_unquote(quoted) if quoted is not None else "",
+                            start=start,
+                            end=match.end(),
+                        )
+                    )
+            elif depth == 2 and len(header) < 2:  # noqa: PLR2004
+                header.append(match)
+        return spans
+
+    def of(self, keyword: str) -> list[Span]:
+        """Top-level nodes with `keyword`."""
+        return [span for span in self.spans if span.keyword == keyword]
+
+    def text(self, span: Span) -> str:
+        """Source of the node at `span`."""
+        return self.buffer[span.start : span.end].decode()
+
+    def node(self, span: Span) -> Node:
+        """Parse the node at `span`."""
+        return parse(self.text(span))
+
+    def child_span(self, span: Span, keyword: str) -> Span | None:
+        """Byte range of the first direct child of `span` with `keyword`, if any.
+
+        Streams the node's tokens up to that child only.
+        """
+        depth = 0
+        child_start = -1  # Start of the current child, until its keyword is read.
+        found = -1  # Start of the child with `keyword`.
+        for match in self.tokens(span.start, span.end):
+            token = match.group()
+            if token == b"(":
+                depth += 1
+                if depth == 2:  # noqa: PLR2004 (Children of `span`.)
+                    child_start = match.start()
+            elif token == b")":
+                depth -= 1
+                if depth == 1 and found >= 0:
+                    return Span(keyword=keyword, name="", start=found, end=match.end())
+            elif child_start >= 0:
+                if token.decode() == keyword:
+                    found = child_start
+                child_start = -1
+        return None
+
+    def write(self, path: Path, replacements: dict[Span, str]) -> None:
+        """Write the file to `path`, with the node at each span replaced by its text.
+
+        The rest is copied byte for byte, in one pass. Written to a temporary file,
+        then renamed, so `path` can be this file.
+        """
+        spans = sorted(replacements, key=lambda span: span.start)
+        for previous, span in itertools.pairwise(spans):
+            if span.start < previous.end:
+                msg = f"Overlapping replacements at offset {span.start}."
+                raise ValueError(msg)
+        tmp_path = path.with_name(path.name + ".tmp")
+        offset = 0
+        with tmp_path.open("wb") as f:
+            for span in spans:
+                f.write(self.buffer[offset : span.start])
+                f.write(replacements[span].encode())
+                offset = span.end
+            f.write(self.buffer[offset:])
+        tmp_path.replace(path)
+
+    def at(self, span: Span) -> tuple[float, float, float]:
+        """Get the `(at x y [angle])` of the node at `span`, without parsing it."""
+        position = self.child_span(span, "at")
+        if position is None:
+            msg = f"No position in ({span.keyword} {span.name} ...)."
+            raise ValueError(msg)
+        return at([span.keyword, parse(self.text(position))])
+
+    @cached_property
+    def footprints(self) -> dict[str, Span]:
+        """Footprints by reference designator."""
+        result = {}
+        for span in self.of("footprint"):
+            match = _REFERENCE_RE.search(self.buffer, span.start, span.end)
+            if match is not None:
+                result[_unquote(match.group(1))] = span
+        return result
+
+    def footprints_of(self, lib_id: str) -> dict[str, Span]:
+        """Footprints with library ID `lib_id`, by reference designator.
+
+        `lib_id` can leave out the library (e.g., `"Motor_Tiny_0408_Vertical"`).
+        """
+        return {
+            reference: span
+            for reference, span in self.footprints.items()
+            if lib_id in (span.name, span.name.partition(":")[2])
+        }
+
+    @cached_property
+    def nets(self) -> dict[int, str]:
+        """Net names by net number."""
+        result = {}
+        for span in self.of("net"):
+            _, number, name = self.node(span)
+            result[int(number)] = name
+        return result
+
+    def graphics(self, layer: str) -> list[Node]:
+        """Top-level drawings (`gr_line`, `gr_rect`, ...) on `layer`."""
+        result = []
+        for span in self.spans:
+            if span.keyword.startswith("gr_"):
+                node = self.node(span)
+                layer_node = child(node, "layer")
+                if layer_node is not None and layer_node[1] == layer:
+                    result.append(node)
+        return result
+
+    def outline(self) -> list[Node]:
+        """Board outline: drawings on the `Edge.Cuts` layer."""
+        return self.graphics("Edge.Cuts")
+
+
+def main() -> None:
+    """Print the positions of footprints in a KiCad board file."""
+    parser = argparse.ArgumentParser(description="Query a KiCad board file.")
+    parser.add_argument("path", type=Path)
+    parser.add_argument(
+        "--footprint",
+        help="Library ID (e.g., MountingHole_M3_2x_3mm_Pitch). Default: all.",
+    )
+    args = parser.parse_args()
+
+    start_s = time.perf_counter()
+    with FileIndex(args.path) as index:
+        if args.footprint:
+            footprints = index.footprints_of(args.footprint)
+        else:
+            footprints = index.footprints
+        positions = {ref: index.at(span) for ref, span in footprints.items()}
+        duration_ms = (time.perf_counter() - start_s) * 1000
+        for reference, (x, y, angle) in sorted(positions.items()):
+            logger.info(
+                f"{reference} ({footprints[reference].name}): {x}, {y}, {angle}"
+            )
+        logger.info(
+            f"{len(positions)} footprints, of {len(index.spans)} top-level nodes, "
+            f"in {duration_ms:.1f} ms."
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,479 @@
+"""Indexed SQLite database of self-test and characterization results, per dot.
+
+Accumulates results across boards and over time, so that they can be queried:
+* Yield per dot position (and direction).
+* Drift of the peak current over cycles, per board/dot/direction.
+* Failure clustering: dots that fail together on the same board run.
+
+One row per result (`results`), keyed by board serial (`machine.unique_id()`), dot,
+direction and time, with the run it came from (`runs`). A run is keyed by its board,
+kind and start time (and a trace dataset also by a hash of its drives, so that
+rebuilding it doesn't add it again): adding it again is skipped, with a warning.
+Sources:
+* Test station reports (`test_station.py`): one result per dot and direction.
+* Trace datasets (`trace_analysis.py`): one result per single-dot drive, with its
+  features.
+
+`cycle` counts the results of each board/dot/direction, in the order they were added.
+
+Totals per board/dot/direction (`slot_totals`) and co-failures (`failure_pairs`) are
+updated as results are added, and queries over time ranges or single dots use
+covering indexes, so queries take milliseconds over hundreds of thousands of results.
+
+Usage:
+    python -m host_tools.results_db --db results.sqlite ingest-reports test_reports/
+    python -m host_tools.results_db --db results.sqlite ingest-traces dataset/ \
+        --board e66038b713636b2f
+    python -m host_tools.results_db --db results.sqlite yield
+    python -m host_tools.results_db --db results.sqlite drift --min-cycles 10
+    python -m host_tools.results_db --db results.sqlite clusters
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import sqlite3
+import time
+from collections.abc import Iterable, Mapping
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from host_tools.firmware import actuation_classifier
+from host_tools.trace_analysis import DRIVE_SCHEMA, drive_features, load_dataset
+from host_tools.trace_replay import DIRECTIONS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    board TEXT NOT NULL,
+    kind TEXT NOT NULL,  -- 'self_test' or 'characterization'.
+    timestamp_ms INTEGER NOT NULL,
+    passed INTEGER,  -- NULL if not a pass/fail test.
+    source TEXT NOT NULL,
+    content TEXT,  -- Hash of the data, if its time isn't enough to identify it.
+    UNIQUE (board, kind, timestamp_ms),  -- So that a run is only added once.
+    UNIQUE (board, kind, content)
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    board TEXT NOT NULL,
+    dot INTEGER NOT NULL,
+    direction TEXT NOT NULL,
+    timestamp_ms INTEGER NOT NULL,
+    cycle INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    failed INTEGER NOT NULL,
+    peak_ma REAL,
+    charge_uc REAL,
+    plateau_ma REAL,
+    stall_ms REAL
+);
+-- Per board/dot/direction totals, kept up to date as results are added: yield and
+-- drift queries read these instead of every result.
+CREATE TABLE IF NOT EXISTS slot_totals (
+    board TEXT NOT NULL,
+    dot INTEGER NOT NULL,
+    direction TEXT NOT NULL,
+    cycles INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    -- Sums for the least squares fit of the peak current over cycles.
+    n INTEGER NOT NULL,
+    sx REAL NOT NULL,
+    sy REAL NOT NULL,
+    sxy REAL NOT NULL,
+    sxx REAL NOT NULL,
+    PRIMARY KEY (board, dot, direction)
+) WITHOUT ROWID;
+-- Runs in which both dots failed, per board.
+CREATE TABLE IF NOT EXISTS failure_pairs (
+    board TEXT NOT NULL,
+    dot_a INTEGER NOT NULL,
+    dot_b INTEGER NOT NULL,
+    runs INTEGER NOT NULL,
+    PRIMARY KEY (board, dot_a, dot_b)
+) WITHOUT ROWID;
+-- Peak current history, in cycle order.
+CREATE INDEX IF NOT EXISTS results_by_cycle
+    ON results(board, dot, direction, cycle, peak_ma);
+-- Yield over a time range.
+CREATE INDEX IF NOT EXISTS results_by_time
+    ON results(timestamp_ms, dot, direction, failed);
+"""
+
+UPDATE_SLOT_TOTALS = """
+INSERT INTO slot_totals VALUES (
+    :board, :dot, :direction, :cycles, :failed, :n, :sx, :sy, :sxy, :sxx
+) ON CONFLICT DO UPDATE SET
+    cycles = cycles + excluded.cycles,
+    failed = failed + excluded.failed,
+    n = n + excluded.n,
+    sx = sx + excluded.sx,
+    sy = sy + excluded.sy,
+    sxy = sxy + excluded.sxy,
+    sxx = sxx + excluded.sxx
+"""
+UPDATE_FAILURE_PAIRS = """
+INSERT INTO failure_pairs VALUES (?, ?, ?, 1)
+ON CONFLICT DO UPDATE SET runs = runs + 1
+"""
+INSERT_RESULT = """
+INSERT INTO results (
+    run_id, board, dot, direction, timestamp_ms, cycle, label, failed,
+    peak_ma, charge_uc, plateau_ma, stall_ms
+) VALUES (
+    :run_id, :board, :dot, :direction, :timestamp_ms, :cycle, :label, :failed,
+    :peak_ma, :charge_uc, :plateau_ma, :stall_ms
+)
+"""
+FAULT_LABEL_NAMES = tuple(
+    actuation_classifier.LABEL_NAMES[label]
+    for label in actuation_classifier.FAULT_LABELS
+)
+
+
+def _migrate_runs_key(connection: sqlite3.Connection) -> None:
+    """Key the runs of a database made when they were keyed by source, or by time."""
+    row = connection.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'runs'"
+    ).fetchone()
+    if row is None or "UNIQUE (board, kind, content)" in row["sql"]:
+        return
+    logger.info("Keying the runs by board, kind, and time or content.")
+    with connection:
+        # SQLite can't change constraints: copy to a new table (ids kept for results).
+        connection.execute(
+            "CREATE TABLE runs_new (id INTEGER PRIMARY KEY, board TEXT NOT NULL, "
+            "kind TEXT NOT NULL, timestamp_ms INTEGER NOT NULL, passed INTEGER, "
+            "source TEXT NOT NULL, content TEXT, UNIQUE (board, kind, timestamp_ms), "
+            "UNIQUE (board, kind, content))"
+        )
+        connection.execute(
+            "INSERT OR IGNORE INTO runs_new "
+            "SELECT id, board, kind, timestamp_ms, passed, source, NULL FROM runs"
+        )
+        connection.execute("DROP TABLE runs")
+        connection.execute("ALTER TABLE runs_new RENAME TO runs")
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """Open the database at `path`, creating its tables and indexes if needed."""
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")  # Still safe with WAL.
+    _migrate_runs_key(connection)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _add_run(
+    connection: sqlite3.Connection,
+    run: Mapping,
+    results: Iterable[Mapping],
+) -> int | None:
+    """Add a run and its results, and update the totals. None if already added."""
+    cursor = connection.execute(
+        "INSERT OR IGNORE INTO runs "
+        "(board, kind, timestamp_ms, passed, source, content) "
+        "VALUES (:board, :kind, :timestamp_ms, :passed, :source, :content)",
+        {"content": None, **run},
+    )
+    if cursor.rowcount != 1:
+        logger.warning(
+            f"{run['kind']} run of {run['board']} at {run['timestamp_ms']} ms already "
+            f"added: skipped {run['source']}."
+        )
+        return None
+    run_id = cursor.lastrowid
+    board = run["board"]
+    next_cycle = {
+        (row["dot"], row["direction"]): row["cycles"]
+        for row in connection.execute(
+            "SELECT dot, direction, cycles FROM slot_totals WHERE board = ?", (board,)
+        )
+    }
+
+    rows = []
+    totals: dict[tuple[int, str], dict] = {}
+    failed_dots: set[int] = set()
+    for result in results:
+        key = (result["dot"], result["direction"])
+        cycle = next_cycle.get(key, 0)
+        next_cycle[key] = cycle + 1
+        row = {
+            "timestamp_ms": run["timestamp_ms"],
+            "failed": result["label"] in FAULT_LABEL_NAMES,
+            "charge_uc": None,
+            "plateau_ma": None,
+            "stall_ms": None,
+            **result,
+            "run_id": run_id,
+            "board": board,
+            "cycle": cycle,
+        }
+        rows.append(row)
+
+        total = totals.setdefault(
+            key,
+            {
+                "board": board,
+                "dot": key[0],
+                "direction": key[1],
+                **dict.fromkeys(("cycles", "failed", "n", "sx", "sy", "sxy", "sxx"), 0),
+            },
+        )
+        total["cycles"] += 1
+        if row["failed"]:
+            total["failed"] += 1
+            failed_dots.add(key[0])
+        if row["peak_ma"] is not None:
+            total["n"] += 1
+            total["sx"] += cycle
+            total["sy"] += row["peak_ma"]
+            total["sxy"] += cycle * row["peak_ma"]
+            total["sxx"] += cycle * cycle
+
+    connection.executemany(INSERT_RESULT, rows)
+    connection.executemany(UPDATE_SLOT_TOTALS, totals.values())
+    connection.executemany(
+        UPDATE_FAILURE_PAIRS,
+        ((board, a, b) for a, b in itertools.combinations(sorted(failed_dots), 2)),
+    )
+    return run_id
+
+
+def add_self_test(
+    connection: sqlite3.Connection, report: Mapping, source: str
+) -> int | None:
+    """Add a test station report (`BoardReport` as a dict). None if already added."""
+    # Also failed: dots the firmware failed without a fault label in this direction.
+    failing = set(report.get("firmware_failing_dots", []))
+    results = [
+        {
+            "dot": dot["dot"],
+            "direction": dot["direction"],
+            "label": dot["label"],
+            "failed": dot["dot"] in failing or dot["label"] in FAULT_LABEL_NAMES,
+            "peak_ma": dot["peak_ma"],
+        }
+        for dot in report["dots"]
+    ]
+    with connection:
+        return _add_run(
+            connection,
+            {
+                "board": report["unique_id"] or report["name"],
+                "kind": "self_test",
+                "timestamp_ms": report["timestamp_ms"],
+                "passed": report["passed"],
+                "source": source,
+            },
+            results,
+        )
+
+
+def ingest_reports(connection: sqlite3.Connection, directory: Path) -> int:
+    """Add every test station report in `directory`. Returns how many were new."""
+    added = 0
+    for path in sorted(directory.glob("*.json")):
+        report = json.loads(path.read_text())
+        # Reports written before timestamps were added: use the file time.
+        report.setdefault("timestamp_ms", int(path.stat().st_mtime * 1000))
+        added += add_self_test(connection, report, str(path.resolve())) is not None
+    return added
+
+
+def add_characterization(
+    connection: sqlite3.Connection, dataset_dir: Path, board: str
+) -> int | None:
+    """Add the single-dot drives of a trace dataset. None if already added.
+
+    The run is identified by a hash of the dataset's drives, so that a dataset built
+    again from the same traces isn't added twice.
+    """
+    dataset = load_dataset(dataset_dir)
+    content = hashlib.sha256()
+    for name in DRIVE_SCHEMA:
+        content.update(np.ascontiguousarray(dataset.drives[name]).tobytes())
+    features = drive_features(dataset)
+    dots = np.asarray(dataset.drives["dot"])
+    single = np.flatnonzero(dots >= 0)
+    directions = np.asarray(dataset.drives["direction"])[single]
+    labels = np.asarray(dataset.drives["label"])[single]
+    label_names = [
+        actuation_classifier.LABEL_NAMES[label] if label >= 0 else "none"
+        for label in labels.tolist()
+    ]
+    feature_lists = {
+        name: [None if np.isnan(v) else v for v in values[single].tolist()]
+        for name, values in features.items()
+    }
+    results = [
+        {
+            "dot": dot,
+            "direction": DIRECTIONS[direction],
+            "label": label,
+            **{name: values[i] for name, values in feature_lists.items()},
+        }
+        for i, (dot, direction, label) in enumerate(
+            zip(dots[single].tolist(), directions.tolist(), label_names, strict=True)
+        )
+    ]
+    with connection:
+        return _add_run(
+            connection,
+            {
+                "board": board,
+                "kind": "characterization",
+                "timestamp_ms": int(
+                    (dataset_dir / "drives" / "table.json").stat().st_mtime * 1000
+                ),
+                "passed": None,
+                "source": str(dataset_dir.resolve()),
+                "content": content.hexdigest(),
+            },
+            results,
+        )
+
+
+def dot_yield(
+    connection: sqlite3.Connection, *, since_ms: int = 0
+) -> list[sqlite3.Row]:
+    """Count the tested and failed results, and the yield, per dot and direction."""
+    if since_ms:
+        return connection.execute(
+            "SELECT dot, direction, COUNT(*) AS tested, SUM(failed) AS failed, "
+            "1.0 - AVG(failed) AS yield FROM results WHERE timestamp_ms >= ? "
+            "GROUP BY dot, direction ORDER BY dot, direction",
+            (since_ms,),
+        ).fetchall()
+    return connection.execute(
+        "SELECT dot, direction, SUM(cycles) AS tested, SUM(failed) AS failed, "
+        "1.0 - 1.0 * SUM(failed) / SUM(cycles) AS yield FROM slot_totals "
+        "GROUP BY dot, direction ORDER BY dot, direction"
+    ).fetchall()
+
+
+def peak_drift(
+    connection: sqlite3.Connection, *, board: str | None = None, min_cycles: int = 2
+) -> list[sqlite3.Row]:
+    """Peak current trend over cycles per board/dot/direction, steepest first.
+
+    `slope_ma_per_kcycle` is the least squares slope of the peak current, in mA per
+    1000 cycles.
+    """
+    return connection.execute(
+        "SELECT board, dot, direction, n AS cycles, sy / n AS mean_ma, "
+        "1000.0 * (n * sxy - sx * sy) / (n * sxx - sx * sx) AS slope_ma_per_kcycle "
+        "FROM slot_totals WHERE (:board IS NULL OR board = :board) "
+        "AND n >= :min_cycles AND n * sxx > sx * sx "
+        "ORDER BY ABS(slope_ma_per_kcycle) DESC",
+        {"board": board, "min_cycles": max(min_cycles, 2)},
+    ).fetchall()
+
+
+def peak_history(
+    connection: sqlite3.Connection, board: str, dot: int, direction: str
+) -> list[sqlite3.Row]:
+    """Peak current of every cycle of one board/dot/direction, in cycle order."""
+    return connection.execute(
+        "SELECT cycle, peak_ma FROM results "
+        "WHERE board = ? AND dot = ? AND direction = ? ORDER BY cycle",
+        (board, dot, direction),
+    ).fetchall()
+
+
+def failure_clusters(
+    connection: sqlite3.Connection, *, limit: int = 20
+) -> list[sqlite3.Row]:
+    """Pairs of dots that failed in the same run, most frequent first."""
+    return connection.execute(
+        "SELECT dot_a, dot_b, SUM(runs) AS runs, COUNT(*) AS boards "
+        "FROM failure_pairs GROUP BY dot_a, dot_b "
+        "ORDER BY runs DESC, dot_a, dot_b LIMIT ?",
+        (limit,),
+    ).fetchall()
+
+
+def _log_rows(title: str, rows: list[sqlite3.Row], elapsed_s: float) -> None:
+    logger.info(f"{title} ({len(rows)} rows, {elapsed_s * 1000:.1f} ms):")
+    for row in rows:
+        logger.info(
+            "  "
+            + ", ".join(
+                f"{key}={value:.3g}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in zip(row.keys(), row, strict=True)
+            )
+        )
+
+
+def main() -> None:
+    """Add results to the database, or query it."""
+    parser = argparse.ArgumentParser(description="Per-dot results database.")
+    parser.add_argument("--db", type=Path, default=Path("results.sqlite"))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reports_parser = subparsers.add_parser(
+        "ingest-reports", help="Add test station reports."
+    )
+    reports_parser.add_argument("directory", type=Path)
+
+    traces_parser = subparsers.add_parser(
+        "ingest-traces", help="Add a trace dataset (trace_analysis.py build)."
+    )
+    traces_parser.add_argument("dataset", type=Path)
+    traces_parser.add_argument("--board", required=True, help="Board unique ID.")
+
+    yield_parser = subparsers.add_parser("yield", help="Yield per dot.")
+    yield_parser.add_argument(
+        "--days", type=float, help="Only the last N days. Default: all."
+    )
+
+    drift_parser = subparsers.add_parser("drift", help="Peak current drift.")
+    drift_parser.add_argument("--board")
+    drift_parser.add_argument("--min-cycles", type=int, default=2)
+    drift_parser.add_argument("--limit", type=int, default=20)
+
+    clusters_parser = subparsers.add_parser("clusters", help="Dots failing together.")
+    clusters_parser.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args()
+    connection = connect(args.db)
+
+    if args.command == "ingest-reports":
+        added = ingest_reports(connection, args.directory)
+        logger.info(f"Added {added} new reports from {args.directory}.")
+        return
+    if args.command == "ingest-traces":
+        if add_characterization(connection, args.dataset, args.board) is None:
+            logger.info(f"{args.dataset} was already added.")
+        else:
+            logger.info(f"Added {args.dataset} for board {args.board}.")
+        return
+
+    start_s = time.perf_counter()
+    if args.command == "yield":
+        since_ms = int((time.time() - args.days * 86_400) * 1000) if args.days else 0
+        _log_rows(
+            "Yield per dot",
+            dot_yield(connection, since_ms=since_ms),
+            time.perf_counter() - start_s,
+        )
+    elif args.command == "drift":
+        rows = peak_drift(connection, board=args.board, min_cycles=args.min_cycles)[
+            : args.limit
+        ]
+        _log_rows("Peak current drift", rows, time.perf_counter() - start_s)
+    else:
+        _log_rows(
+            "Dots failing together",
+            failure_clusters(connection, limit=args.limit),
+            time.perf_counter() - start_s,
+        )
+
+
+if __name__ == "__main__":
+    main()
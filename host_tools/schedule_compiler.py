@@ -0,0 +1,258 @@
+"""Compile a sequence of target frames into a compact actuation schedule.
+
+The schedule is planned on the host, and the firmware only plays it back
+(`play_schedule()` in `firmware_upy/src/main.py`), with no planning on the board.
+
+Planning, per transition between consecutive frames:
+* Every dot that changes is one move, with its calibrated drive time and current.
+* Moves are list-scheduled, longest drive time first, starting as many at once as
+  fit within the current budget. Each dot is released as soon as its own drive time
+  is up, which frees budget for the next move.
+
+Binary schedule format (little-endian), version 1:
+* Header: `<4sHHI`: magic `b"BDS1"`, version, state bytes per event, event count.
+* Events: `<I` time in us since the start of the schedule, followed by the packed
+  shift register state (output `n` is bit `n % 8` of byte `n // 8`).
+
+Each event latches its state at its time. The last event is always all-off.
+
+Frames JSON: a list of frames, each a list of 0/1 (dot raised) per dot. The first
+frame is the state the display is in before the schedule is played.
+
+Calibration JSON (optional): `{"dots": {"<dot_num>": {"up_ms": ..., "down_ms": ...,
+"current_ma": ...}}}`. Missing dots/fields use the `DotCalibration` defaults.
+"""
+
+import argparse
+import itertools
+import json
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+
+from loguru import logger
+
+from host_tools.firmware import dot_map
+
+SCHEDULE_MAGIC = b"BDS1"
+SCHEDULE_VERSION = 1
+SCHEDULE_HEADER = struct.Struct("<4sHHI")
+SCHEDULE_EVENT_TIME = struct.Struct("<I")
+
+# Mirrors `DOT_ADDITION_CONSTANTS` in the firmware.
+DOT_ADDITION_CONSTANT_UP = 0
+DOT_ADDITION_CONSTANT_DOWN = 1
+OUTPUTS_PER_DOT = 2
+
+
+@dataclass(kw_only=True)
+class DotCalibration:
+    """Calibrated drive for one dot."""
+
+    up_ms: float = 50
+    down_ms: float = 50
+    current_ma: float = 100  # Draw while driven (worst case).
+
+
+@dataclass(kw_only=True)
+class Move:
+    """One dot driven in one direction."""
+
+    dot_num: int
+    up: bool
+    drive_us: int
+    current_ma: float
+
+    @property
+    def output_num(self) -> int:
+        """Shift register output which drives this move (see `dot_map.py`)."""
+        return dot_map.SLOT_OUTPUTS[
+            self.dot_num * OUTPUTS_PER_DOT
+            + (DOT_ADDITION_CONSTANT_UP if self.up else DOT_ADDITION_CONSTANT_DOWN)
+        ]
+
+
+@dataclass(kw_only=True)
+class ScheduleEvent:
+    """At `time_us`, latch the shift registers to `outputs` (set of output nums)."""
+
+    time_us: int
+    outputs: frozenset[int]
+
+
+def load_calibration(path: Path | None, dot_count: int) -> list[DotCalibration]:
+    """Load the per-dot calibration JSON. Defaults are used for anything missing."""
+    data: dict = json.loads(path.read_text())["dots"] if path else {}
+    return [
+        DotCalibration(**data.get(str(dot_num), {})) for dot_num in range(dot_count)
+    ]
+
+
+def frame_moves(
+    prev_frame: list[int], frame: list[int], calibration: list[DotCalibration]
+) -> list[Move]:
+    """List the moves needed to go from `prev_frame` to `frame`."""
+    moves: list[Move] = []
+    for dot_num, (prev_state, state) in enumerate(zip(prev_frame, frame, strict=True)):
+        if bool(prev_state) == bool(state):
+            continue
+        cal = calibration[dot_num]
+        moves.append(
+            Move(
+                dot_num=dot_num,
+                up=bool(state),
+                drive_us=round((cal.up_ms if state else cal.down_ms) * 1000),
+                current_ma=cal.current_ma,
+            )
+        )
+    return moves
+
+
+def schedule_moves(
+    moves: list[Move], start_us: int, current_budget_ma: float
+) -> tuple[list[ScheduleEvent], int]:
+    """List-schedule `moves` within the current budget, longest first.
+
+    Returns the events, and the time at which the last move is released.
+    """
+    pending = sorted(moves, key=lambda move: move.drive_us, reverse=True)
+    running: list[tuple[int, Move]] = []  # (release_us, move)
+    events: list[ScheduleEvent] = []
+    now_us = start_us
+
+    while pending or running:
+        # Start everything that fits, longest first. Always start at least one move,
+        # even if it alone exceeds the budget, so that the schedule completes.
+        used_ma = sum(move.current_ma for _, move in running)
+        for move in list(pending):
+            if running and used_ma + move.current_ma > current_budget_ma:
+                continue
+            pending.remove(move)
+            running.append((now_us + move.drive_us, move))
+            used_ma += move.current_ma
+
+        events.append(
+            ScheduleEvent(
+                time_us=now_us,
+                outputs=frozenset(move.output_num for _, move in running),
+            )
+        )
+
+        # Advance to the next release(s).
+        now_us = min(release_us for release_us, _ in running)
+        running = [
+            (release_us, move) for release_us, move in running if release_us > now_us
+        ]
+
+    events.append(ScheduleEvent(time_us=now_us, outputs=frozenset()))
+    return events, now_us
+
+
+def compile_schedule(
+    frames: list[list[int]],
+    calibration: list[DotCalibration],
+    *,
+    current_budget_ma: float,
+    dwell_ms: float = 0,
+) -> list[ScheduleEvent]:
+    """Compile the transitions between consecutive `frames` into one timeline.
+
+    Args:
+        frames: dot states per frame. `frames[0]` is the starting state.
+        calibration: per-dot drive times and currents.
+        current_budget_ma: maximum total current of the dots driven at once.
+        dwell_ms: time to hold each frame (outputs off) before the next transition.
+
+    """
+    events: list[ScheduleEvent] = []
+    now_us = 0
+    for prev_frame, frame in itertools.pairwise(frames):
+        moves = frame_moves(prev_frame, frame, calibration)
+        if not moves:
+            continue
+        frame_events, now_us = schedule_moves(moves, now_us, current_budget_ma)
+        events.extend(frame_events)
+        now_us += round(dwell_ms * 1000)
+
+    # Merge events at the same time (e.g., the release before a new transition).
+    merged: list[ScheduleEvent] = []
+    for event in events:
+        if merged and merged[-1].time_us == event.time_us:
+            merged[-1] = event
+        elif not merged or merged[-1].outputs != event.outputs:
+            merged.append(event)
+    return merged
+
+
+def encode_schedule(events: list[ScheduleEvent], output_count: int) -> bytes:
+    """Encode `events` in the binary schedule format."""
+    state_bytes = (output_count + 7) // 8
+    chunks = [
+        SCHEDULE_HEADER.pack(SCHEDULE_MAGIC, SCHEDULE_VERSION, state_bytes, len(events))
+    ]
+    for event in events:
+        state = sum(1 << output_num for output_num in event.outputs)
+        chunks.append(SCHEDULE_EVENT_TIME.pack(event.time_us))
+        chunks.append(state.to_bytes(state_bytes, "little"))
+    return b"".join(chunks)
+
+
+def decode_schedule(data: bytes) -> list[ScheduleEvent]:
+    """Decode a binary schedule (inverse of `encode_schedule()`)."""
+    magic, version, state_bytes, event_count = SCHEDULE_HEADER.unpack_from(data)
+    if magic != SCHEDULE_MAGIC or version != SCHEDULE_VERSION:
+        msg = f"Not a version {SCHEDULE_VERSION} schedule: {magic!r} v{version}."
+        raise ValueError(msg)
+
+    events: list[ScheduleEvent] = []
+    offset = SCHEDULE_HEADER.size
+    for _ in range(event_count):
+        (time_us,) = SCHEDULE_EVENT_TIME.unpack_from(data, offset)
+        offset += SCHEDULE_EVENT_TIME.size
+        state = int.from_bytes(data[offset : offset + state_bytes], "little")
+        offset += state_bytes
+        outputs = frozenset(n for n in range(state_bytes * 8) if state >> n & 1)
+        events.append(ScheduleEvent(time_us=time_us, outputs=outputs))
+    return events
+
+
+def main() -> None:
+    """Compile a frames JSON file into a binary schedule file."""
+    parser = argparse.ArgumentParser(description="Compile frames into a schedule.")
+    parser.add_argument("frames", type=Path, help="Frames JSON file.")
+    parser.add_argument("output", type=Path, help="Output schedule file (.bds).")
+    parser.add_argument("--calibration", type=Path, help="Per-dot calibration JSON.")
+    parser.add_argument(
+        "--current-budget-ma",
+        type=float,
+        default=500,
+        help="Max total current of dots driven at once.",
+    )
+    parser.add_argument(
+        "--dwell-ms", type=float, default=0, help="Hold time between frames."
+    )
+    args = parser.parse_args()
+
+    frames: list[list[int]] = json.loads(args.frames.read_text())
+    dot_count = len(frames[0])
+    if dot_count > dot_map.DOT_COUNT:
+        msg = f"Frames have {dot_count} dots, the firmware has {dot_map.DOT_COUNT}."
+        raise ValueError(msg)
+    events = compile_schedule(
+        frames,
+        load_calibration(args.calibration, dot_count),
+        current_budget_ma=args.current_budget_ma,
+        dwell_ms=args.dwell_ms,
+    )
+    data = encode_schedule(events, dot_map.OUTPUT_COUNT)
+    args.output.write_bytes(data)
+
+    duration_ms = events[-1].time_us / 1000 if events else 0
+    logger.info(
+        f"Wrote {len(events)} events ({len(data)} bytes, {duration_ms:.1f} ms) "
+        f"to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
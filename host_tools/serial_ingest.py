@@ -0,0 +1,262 @@
+"""Record the board's serial output into a chunked, memory-mapped columnar store.
+
+Parses the stream incrementally, as it arrives, and appends readings to a
+`ChunkedTable` indexed by session and dot. Multi-hour runs can be recorded, and then
+queried by session/dot without loading the whole store.
+
+Parsers turn raw bytes into readings. `JsonLinesParser` handles the JSON lines
+printed by the firmware today (`log_ina_json()` and the current summaries of each
+drive); other formats (e.g., binary frames) only need another parser with the same
+`feed()` method.
+
+Columns: host receive time, the line's own timestamp, current, bus voltage, dot,
+direction, and session. A session is one recording run; it also ends when the board
+reboots (MicroPython banner in the stream).
+
+Usage:
+    python -m host_tools.serial_ingest record --port /dev/ttyACM0 --store runs/
+    python -m host_tools.serial_ingest record --input capture.log --store runs/
+    python -m host_tools.serial_ingest query --store runs/ --session 0 --dot 3
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO, Protocol
+
+import numpy as np
+from loguru import logger
+
+from host_tools.column_store import ChunkedTable
+from host_tools.serial_port import SerialPort
+from host_tools.trace_replay import DIRECTIONS
+
+READING_SCHEMA = {
+    "timestamp_ms": "<i8",  # Host receive time, ms since the Unix epoch.
+    "board_ms": "<i4",  # `timestamp_ms` of the line itself. -1 if none.
+    "current_ma": "<f4",  # `current_mA`, or `mean_mA` for drive summaries.
+    "voltage_mv": "<f4",  # NaN if not reported.
+    "dot": "<i2",  # -1 if not a single-dot drive.
+    "direction": "<i1",  # Index into `DIRECTIONS`. -1 if none.
+    "session": "<i4",
+}
+INDEX_COLUMNS = ("session", "dot")
+
+REBOOT_BANNER = "MicroPython v"
+
+
+class Parser(Protocol):
+    """Turns chunks of the serial stream into JSON objects and text lines."""
+
+    def feed(self, data: bytes) -> list[dict | str]:
+        """Parse `data`. Returns complete items; partial ones are kept for later."""
+        ...
+
+
+class JsonLinesParser:
+    """Splits the stream into lines. JSON objects are decoded, other lines are text."""
+
+    def __init__(self) -> None:
+        """Start with an empty line buffer."""
+        self._buffer = b""
+
+    def feed(self, data: bytes) -> list[dict | str]:
+        """Parse `data`. Returns complete lines; a partial last line is kept."""
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        items: list[dict | str] = []
+        for raw_line in lines:
+            line = raw_line.strip().decode(errors="replace")
+            if line.startswith("{"):
+                try:
+                    items.append(json.loads(line))
+                    continue
+                except json.JSONDecodeError:
+                    pass  # E.g., an object interrupted by a reboot. Keep as text.
+            if line:
+                items.append(line)
+        return items
+
+
+class Ingestor:
+    """Buffers readings, and appends them to the store in batches."""
+
+    def __init__(
+        self,
+        store: ChunkedTable,
+        session: int,
+        *,
+        flush_rows: int = 10_000,
+        flush_interval_s: float = 1.0,
+    ) -> None:
+        """Record into `store`, starting at `session`."""
+        self.store = store
+        self.session = session
+        self.flush_rows = flush_rows
+        self.flush_interval_s = flush_interval_s
+        self.rows: dict[str, list] = {name: [] for name in READING_SCHEMA}
+        self.last_flush_s = time.monotonic()
+        self.readings = 0
+        self.session_readings = 0
+        self.text_lines = 0
+
+    def add(self, item: dict | str, received_ms: int) -> None:
+        """Add one parsed item. Items without a current are skipped."""
+        if isinstance(item, str):
+            self.text_lines += 1
+            if item.startswith(REBOOT_BANNER) and self.session_readings:
+                self.flush()
+                self.session += 1
+                self.session_readings = 0
+                logger.info(f"Board rebooted. Now recording session {self.session}.")
+            return
+
+        current = item.get("current_mA", item.get("mean_mA"))
+        if current is None:
+            return
+        direction = item.get("direction")
+        self.rows["timestamp_ms"].append(received_ms)
+        self.rows["board_ms"].append(item.get("timestamp_ms", -1))
+        self.rows["current_ma"].append(current)
+        self.rows["voltage_mv"].append(item.get("bus_voltage_mV", math.nan))
+        self.rows["dot"].append(item.get("dot", -1))
+        self.rows["direction"].append(
+            DIRECTIONS.index(direction) if direction in DIRECTIONS else -1
+        )
+        self.rows["session"].append(self.session)
+        self.readings += 1
+        self.session_readings += 1
+
+        if (
+            len(self.rows["session"]) >= self.flush_rows
+            or time.monotonic() - self.last_flush_s >= self.flush_interval_s
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Append the buffered readings to the store."""
+        self.last_flush_s = time.monotonic()
+        if not self.rows["session"]:
+            return
+        self.store.append(self.rows)
+        self.rows = {name: [] for name in READING_SCHEMA}
+
+
+def read_chunks(
+    port: str | None, input_file: BinaryIO | None, duration_s: float | None
+) -> Iterator[bytes]:
+    """Yield chunks of the stream from a serial port, or from a file/stdin."""
+    deadline = time.monotonic() + duration_s if duration_s else math.inf
+    if port:
+        with SerialPort(port) as serial:
+            while time.monotonic() < deadline:
+                yield serial.read(timeout_s=0.1)
+        return
+    if input_file is None:
+        return
+    while time.monotonic() < deadline:
+        data = os.read(input_file.fileno(), 65_536)
+        if not data:
+            return
+        yield data
+
+
+def open_store(directory: Path) -> ChunkedTable:
+    """Open the store in `directory`, creating it if needed."""
+    return ChunkedTable.create(directory, READING_SCHEMA, index_columns=INDEX_COLUMNS)
+
+
+def record(
+    store: ChunkedTable,
+    chunks: Iterator[bytes],
+    *,
+    session: int | None = None,
+    parser: Parser | None = None,
+) -> Ingestor:
+    """Parse `chunks` and record them into `store`, until the stream ends."""
+    if session is None:
+        sessions = store.index_values("session")
+        session = sessions[-1] + 1 if sessions else 0
+    parser = parser or JsonLinesParser()
+    ingestor = Ingestor(store, session)
+    logger.info(f"Recording session {session} into {store.directory}.")
+    try:
+        for chunk in chunks:
+            received_ms = time.time_ns() // 1_000_000
+            for item in parser.feed(chunk):
+                ingestor.add(item, received_ms)
+    except KeyboardInterrupt:
+        logger.info("Stopped.")
+    finally:
+        ingestor.flush()
+    logger.info(
+        f"Recorded {ingestor.readings} readings "
+        f"({ingestor.text_lines} other lines) in {store.directory}."
+    )
+    return ingestor
+
+
+def main() -> None:
+    """Record the serial stream, or query a store."""
+    parser = argparse.ArgumentParser(description="Record and query board readings.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="Record a serial stream.")
+    record_parser.add_argument("--store", type=Path, required=True)
+    source = record_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--port", help="Serial port, e.g. /dev/ttyACM0.")
+    source.add_argument(
+        "--input", type=Path, help="Captured output file, or - for stdin."
+    )
+    record_parser.add_argument("--session", type=int, help="Default: next unused.")
+    record_parser.add_argument("--duration-s", type=float, help="Default: until EOF.")
+
+    query_parser = subparsers.add_parser("query", help="Summarize stored readings.")
+    query_parser.add_argument("--store", type=Path, required=True)
+    query_parser.add_argument("--session", type=int)
+    query_parser.add_argument("--dot", type=int)
+
+    args = parser.parse_args()
+    store = open_store(args.store)
+
+    if args.command == "record":
+        if args.input is None:
+            record(
+                store,
+                read_chunks(args.port, None, args.duration_s),
+                session=args.session,
+            )
+        elif str(args.input) == "-":
+            chunks = read_chunks(None, sys.stdin.buffer, args.duration_s)
+            record(store, chunks, session=args.session)
+        else:
+            with args.input.open("rb") as f:
+                chunks = read_chunks(None, f, args.duration_s)
+                record(store, chunks, session=args.session)
+        return
+
+    filters = {
+        name: value
+        for name, value in (("session", args.session), ("dot", args.dot))
+        if value is not None
+    }
+    rows = store.query(**filters)
+    current = rows["current_ma"]
+    logger.info(
+        f"{len(current)} readings matching {filters or 'all'} "
+        f"(store: {store.rows} readings, sessions {store.index_values('session')})."
+    )
+    if len(current):
+        logger.info(
+            f"Current: min={np.min(current):.1f} mA, mean={np.mean(current):.1f} mA, "
+            f"max={np.max(current):.1f} mA."
+        )
+
+
+if __name__ == "__main__":
+    main()
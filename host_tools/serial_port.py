@@ -0,0 +1,67 @@
+"""Minimal serial port access for the board's USB serial REPL (POSIX, stdlib only).
+
+Uses `termios` directly, so that no serial library is needed. The RP2040's USB CDC
+serial port ignores the baud rate, but it's set anyway for real UARTs.
+"""
+
+import os
+import select
+import termios
+import tty
+from types import TracebackType
+from typing import Self
+
+
+class SerialPort:
+    """A raw (no echo, no line editing) serial port."""
+
+    def __init__(self, path: str, baud: int = 115_200) -> None:
+        """Open and configure the serial port at `path` (e.g., `/dev/ttyACM0`)."""
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+        try:
+            tty.setraw(self.fd)
+            attrs = termios.tcgetattr(self.fd)
+            speed = getattr(termios, f"B{baud}")
+            attrs[2] |= termios.CLOCAL | termios.CREAD  # cflag
+            attrs[4] = speed  # ispeed
+            attrs[5] = speed  # ospeed
+            termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def read(self, timeout_s: float | None = None, max_bytes: int = 65_536) -> bytes:
+        """Read what's available, waiting up to `timeout_s`. b"" on timeout."""
+        ready, _, _ = select.select([self.fd], [], [], timeout_s)
+        if not ready:
+            return b""
+        data = os.read(self.fd, max_bytes)
+        if not data:
+            msg = f"Serial port {self.path} closed."
+            raise EOFError(msg)
+        return data
+
+    def write(self, data: bytes) -> None:
+        """Write all of `data`."""
+        view = memoryview(data)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+
+    def close(self) -> None:
+        """Close the port."""
+        os.close(self.fd)
+
+    def __enter__(self) -> Self:
+        """Use as a context manager, to close the port at the end."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the port."""
+        self.close()
@@ -0,0 +1,483 @@
+"""Production test station: test many boards at once, one per serial port.
+
+Each board is driven through its REPL prompt (`prompt_and_execute()` in the firmware),
+concurrently with asyncio. Per board:
+1. Read its unique ID.
+2. `self_test_each_dot()`: the firmware's current-signature self-test of every dot.
+3. `self_test_lights_and_buttons()` (optional): the operator presses SW1, SW2, then
+   both. Runs on all boards at once, so the operator can go down the line.
+4. Apply the pass/fail rules (`PassCriteria`) and write a JSON report and the raw
+   console log per board (and optionally add the results to `results_db.py`).
+
+`SimulatedBoard` emulates the firmware's console (including failing dots), for
+testing the station without hardware.
+
+Usage:
+    python -m host_tools.test_station --port /dev/ttyACM0 --port /dev/ttyACM1
+    python -m host_tools.test_station --simulate 8 --sim-failing-dots 3,17
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Protocol
+
+from loguru import logger
+
+from host_tools import results_db
+from host_tools.firmware import dot_map
+from host_tools.serial_port import SerialPort
+
+PROMPT = ">> "
+SELF_TEST_DIRECTIONS = ("down", "up")  # In the order the self-test drives them.
+SETTLE_S = 0.5  # Quiet time after which the console is considered idle.
+
+DOT_HEADER_RE = re.compile(r"^Dot (\d+) - (up|down)$")
+SIGNATURE_RE = re.compile(r"^\s*Signature: (\{.*\})$")
+STATS_RE = re.compile(r"^\s*Stats \(mA\): (\{.*\})$")
+DOT_LIST_RE = re.compile(r"^(Passing|Failing) dots \(\d+\): \[(.*)\]$")
+UNIQUE_ID_RE = re.compile(r"^UID:([0-9a-f]+)$")
+
+# Labels that fail a dot (the firmware's `FAULT_LABELS`).
+FAULT_LABEL_NAMES = ("open", "short", "stuck")
+
+
+class Backend(Protocol):
+    """A connection to one board's console."""
+
+    name: str
+
+    async def read(self) -> bytes:
+        """Wait for, and return, the next bytes from the board."""
+        ...
+
+    async def write(self, data: bytes) -> None:
+        """Send bytes to the board."""
+        ...
+
+    async def close(self) -> None:
+        """Close the connection."""
+        ...
+
+
+class SerialBackend:
+    """A board on a serial port, read without blocking the event loop."""
+
+    def __init__(self, port: str) -> None:
+        """Open `port`. Call from within the event loop."""
+        self.name = Path(port).name
+        self.serial = SerialPort(port)
+        self._reader = asyncio.StreamReader()
+        asyncio.get_running_loop().add_reader(self.serial.fd, self._on_readable)
+
+    def _on_readable(self) -> None:
+        try:
+            self._reader.feed_data(self.serial.read(timeout_s=0))
+        except EOFError:
+            self._reader.feed_eof()
+
+    async def read(self) -> bytes:
+        """Wait for, and return, the next bytes from the board."""
+        data = await self._reader.read(65_536)
+        if not data:
+            msg = f"{self.name}: disconnected."
+            raise EOFError(msg)
+        return data
+
+    async def write(self, data: bytes) -> None:
+        """Send bytes to the board."""
+        self.serial.write(data)
+
+    async def close(self) -> None:
+        """Close the port."""
+        asyncio.get_running_loop().remove_reader(self.serial.fd)
+        self.serial.close()
+
+
+class SimulatedBoard:
+    """Emulates the firmware's console for the commands the station uses."""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failing_dots: frozenset[int] = frozenset(),
+        seed: int = 0,
+        time_scale: float = 0.01,
+    ) -> None:
+        """Simulate a board whose `failing_dots` are open circuit.
+
+        `time_scale` scales the real duration of each command (1 = real time).
+        """
+        self.name = name
+        self.failing_dots = failing_dots
+        self.time_scale = time_scale
+        self._random = random.Random(seed)
+        self._unique_id = f"{self._random.getrandbits(64):016x}"
+        self._output: asyncio.Queue[bytes] = asyncio.Queue()
+        self._input = b""
+        self._busy: asyncio.Task | None = None
+        self._print("MicroPython v1.24.0 on 2024-10-25; Raspberry Pi Pico with RP2040")
+        self._prompt()
+
+    def _print(self, text: str = "") -> None:
+        self._output.put_nowait(f"{text}\r\n".encode())
+
+    def _prompt(self) -> None:
+        self._print("Enter a command, or use 'help':")
+        self._output.put_nowait(PROMPT.encode())
+
+    async def read(self) -> bytes:
+        """Wait for, and return, the next console output."""
+        return await self._output.get()
+
+    async def write(self, data: bytes) -> None:
+        """Type into the console. A CR/LF runs the command."""
+        self._input += data
+        while b"\r" in self._input or b"\n" in self._input:
+            line, _, self._input = self._input.replace(b"\n", b"\r").partition(b"\r")
+            command = line.decode().strip()
+            self._print(command)  # Echo.
+            if command:
+                self._busy = asyncio.create_task(self._execute(command))
+
+    async def close(self) -> None:
+        """Stop the simulation."""
+        if self._busy:
+            self._busy.cancel()
+
+    async def _execute(self, command: str) -> None:
+        if "(" not in command and ")" not in command:
+            command += "()"
+        self._print(f"Executing command: {command}\n")
+        if command.startswith("self_test_each_dot"):
+            await self._self_test_each_dot()
+        elif command.startswith("self_test_lights_and_buttons"):
+            await self._self_test_lights_and_buttons()
+        elif "unique_id" in command:
+            self._print(f"UID:{self._unique_id}")
+        else:
+            self._print(f"Error: name '{command.split('(')[0]}' isn't defined")
+        self._print()
+        self._prompt()
+
+    async def _self_test_each_dot(self, duration_per_dot_ms: int = 10) -> None:
+        passing: list[int] = []
+        failing: list[int] = []
+        for dot_num in range(dot_map.DOT_COUNT):
+            for direction in SELF_TEST_DIRECTIONS:
+                await asyncio.sleep(duration_per_dot_ms / 1000 * self.time_scale)
+                self._print(f"Dot {dot_num} - {direction}")
+                if dot_num in self.failing_dots:
+                    label, peak = "open", 0.3
+                else:
+                    label, peak = "ok", self._random.gauss(150, 8)
+                stats = {"min": 0.0, "max": round(peak, 1), "avg": round(peak / 2, 1)}
+                signature = {
+                    "label": label,
+                    "peak_mA": round(peak, 1),
+                    "plateau_mA": round(peak / 2.5, 1),
+                    "rise_us": 450,
+                    "knee_us": -1,
+                    "samples": 20,
+                }
+                self._print(f"    Stats (mA): {json.dumps(stats)}")
+                self._print(f"    Signature: {json.dumps(signature)}")
+                if label in FAULT_LABEL_NAMES:
+                    self._print(f"WARNING: Dot #{dot_num} '{direction}': {label}.")
+                    self._print(
+                        f"WARNING: Dot #{dot_num} '{direction}' failed self-test."
+                    )
+            (failing if dot_num in self.failing_dots else passing).append(dot_num)
+        self._print("Self-test complete.")
+        self._print(f"Passing dots ({len(passing)}): {passing}")
+        self._print(f"Failing dots ({len(failing)}): {failing}")
+
+    async def _self_test_lights_and_buttons(self) -> None:
+        self._print("Testing lights and buttons.")
+        for line in ("SW1: 0", "SW1: 1", "SW2: 0", "SW2: 1", "SW1: 0", "SW2: 0"):
+            await asyncio.sleep(0.5 * self.time_scale)
+            self._print(line)
+        self._print("Both buttons pressed. Exiting.")
+
+
+class ReplSession:
+    """Runs commands at the firmware's prompt, and collects their output."""
+
+    def __init__(self, backend: Backend) -> None:
+        """Talk to the board on `backend`."""
+        self.backend = backend
+        self.log: list[str] = []  # Everything received, for the report.
+        self._buffer = ""
+
+    async def wait_for_prompt(self, timeout_s: float) -> str:
+        """Return all output up to the next prompt."""
+        async with asyncio.timeout(timeout_s):
+            while PROMPT not in self._buffer:
+                text = (await self.backend.read()).decode(errors="replace")
+                self.log.append(text)
+                self._buffer += text
+        output, _, self._buffer = self._buffer.partition(PROMPT)
+        return output.replace("\r\n", "\n")
+
+    async def sync(self, timeout_s: float) -> None:
+        """Get to a fresh prompt, discarding anything printed before."""
+        await self.backend.write(b"\r")
+        await self.wait_for_prompt(timeout_s)
+        # Drain any other prompts (e.g., one already printed before the CR).
+        while True:
+            try:
+                await self.wait_for_prompt(SETTLE_S)
+            except TimeoutError:
+                break
+        self._buffer = ""
+
+    async def run(self, command: str, timeout_s: float) -> list[str]:
+        """Run `command`, and return its output lines (without the echo)."""
+        await self.backend.write(f"{command}\r".encode())
+        output = await self.wait_for_prompt(timeout_s)
+        lines = output.split("\n")
+        if lines and lines[0].strip() == command:
+            lines = lines[1:]
+        return [line.rstrip() for line in lines]
+
+
+@dataclass(kw_only=True)
+class PassCriteria:
+    """Pass/fail rules for one board."""
+
+    max_failing_dots: int = 0
+    min_peak_ma: float = 40  # Per dot and direction, from its signature.
+    max_peak_ma: float = 400
+    require_buttons: bool = True
+
+
+@dataclass(kw_only=True)
+class DotResult:
+    """Self-test result of one dot in one direction."""
+
+    dot: int
+    direction: str
+    label: str
+    peak_ma: float
+    stats_ma: dict
+
+
+@dataclass(kw_only=True)
+class BoardReport:
+    """Test results of one board."""
+
+    name: str
+    unique_id: str = ""
+    timestamp_ms: int = 0  # Start of the test, ms since the Unix epoch.
+    passed: bool = False
+    failures: list[str] = field(default_factory=list)
+    dots: list[DotResult] = field(default_factory=list)
+    firmware_failing_dots: list[int] = field(default_factory=list)
+    buttons_passed: bool | None = None  # None if not tested.
+    duration_s: float = 0
+
+
+def parse_self_test(lines: list[str]) -> tuple[list[DotResult], list[int] | None]:
+    """Parse `self_test_each_dot()` output into dot results, and its failing list."""
+    dots: list[DotResult] = []
+    current: tuple[int, str] | None = None
+    stats: dict = {}
+    failing: list[int] | None = None
+    for line in lines:
+        if match := DOT_HEADER_RE.match(line):
+            current = (int(match[1]), match[2])
+            stats = {}
+        elif (match := STATS_RE.match(line)) and current:
+            stats = json.loads(match[1])
+        elif (match := SIGNATURE_RE.match(line)) and current:
+            signature = json.loads(match[1])
+            dots.append(
+                DotResult(
+                    dot=current[0],
+                    direction=current[1],
+                    label=signature["label"],
+                    peak_ma=signature["peak_mA"],
+                    stats_ma=stats,
+                )
+            )
+        elif (match := DOT_LIST_RE.match(line)) and match[1] == "Failing":
+            failing = [int(n) for n in match[2].split(",") if n.strip()]
+    return dots, failing
+
+
+def apply_criteria(report: BoardReport, criteria: PassCriteria) -> None:
+    """Fill in `report.failures` and `report.passed`."""
+    failing_dots: set[int] = set(report.firmware_failing_dots)
+    for result in report.dots:
+        if result.label in FAULT_LABEL_NAMES:
+            failing_dots.add(result.dot)
+        elif not criteria.min_peak_ma <= result.peak_ma <= criteria.max_peak_ma:
+            failing_dots.add(result.dot)
+            report.failures.append(
+                f"Dot {result.dot} {result.direction}: peak {result.peak_ma} mA "
+                f"outside {criteria.min_peak_ma}-{criteria.max_peak_ma} mA."
+            )
+
+    tested = {result.dot for result in report.dots}
+    if len(tested) != dot_map.DOT_COUNT:
+        report.failures.append(
+            f"Only {len(tested)} of {dot_map.DOT_COUNT} dots were tested."
+        )
+    if len(failing_dots) > criteria.max_failing_dots:
+        report.failures.append(
+            f"{len(failing_dots)} failing dots (max {criteria.max_failing_dots}): "
+            f"{sorted(failing_dots)}."
+        )
+    if criteria.require_buttons and not report.buttons_passed:
+        report.failures.append("Lights and buttons test did not pass.")
+    report.passed = not report.failures
+
+
+@dataclass(kw_only=True)
+class StationConfig:
+    """Test sequence settings, shared by all boards."""
+
+    criteria: PassCriteria = field(default_factory=PassCriteria)
+    report_dir: Path = Path("test_reports")
+    duration_per_dot_ms: int = 10
+    timeout_s: float = 120
+    button_timeout_s: float = 300  # Waits for the operator.
+
+
+def report_stem(report: BoardReport) -> str:
+    """File name (without extension) of a report: board, then test start time."""
+    return f"{report.unique_id or report.name}_{report.timestamp_ms}"
+
+
+def write_report(report: BoardReport, log: list[str], report_dir: Path) -> None:
+    """Write the JSON report and the raw console log of one board test run."""
+    report_dir.mkdir(parents=True, exist_ok=True)
+    stem = report_stem(report)
+    (report_dir / f"{stem}.json").write_text(json.dumps(asdict(report), indent=2))
+    (report_dir / f"{stem}.log").write_text("".join(log))
+
+
+async def check_board(backend: Backend, config: StationConfig) -> BoardReport:
+    """Run the test sequence on one board, and write its report."""
+    report = BoardReport(name=backend.name, timestamp_ms=time.time_ns() // 1_000_000)
+    session = ReplSession(backend)
+    start_s = time.monotonic()
+    try:
+        await session.sync(config.timeout_s)
+
+        for line in await session.run(
+            "import machine; print('UID:' + machine.unique_id().hex())",
+            config.timeout_s,
+        ):
+            if match := UNIQUE_ID_RE.match(line):
+                report.unique_id = match[1]
+
+        lines = await session.run(
+            f"self_test_each_dot({config.duration_per_dot_ms})", config.timeout_s
+        )
+        report.dots, failing = parse_self_test(lines)
+        report.firmware_failing_dots = failing or []
+        if failing is None:
+            report.failures.append("Self-test did not complete.")
+
+        if config.criteria.require_buttons:
+            logger.info(f"{backend.name}: press SW1, SW2, then both buttons.")
+            lines = await session.run(
+                "self_test_lights_and_buttons()", config.button_timeout_s
+            )
+            report.buttons_passed = (
+                "SW1: 0" in lines
+                and "SW2: 0" in lines
+                and "Both buttons pressed. Exiting." in lines
+            )
+    except (TimeoutError, EOFError) as e:
+        report.failures.append(f"Board stopped responding: {e!r}.")
+    finally:
+        await backend.close()
+
+    apply_criteria(report, config.criteria)
+    report.duration_s = round(time.monotonic() - start_s, 2)
+    await asyncio.to_thread(write_report, report, session.log, config.report_dir)
+
+    if report.passed:
+        logger.success(f"{backend.name} ({report.unique_id}): PASS")
+    else:
+        logger.error(f"{backend.name} ({report.unique_id}): FAIL: {report.failures}")
+    return report
+
+
+async def run_station(
+    backends: list[Backend], config: StationConfig
+) -> list[BoardReport]:
+    """Test all boards concurrently."""
+    return await asyncio.gather(*(check_board(backend, config) for backend in backends))
+
+
+async def _main(args: argparse.Namespace) -> list[BoardReport]:
+    backends: list[Backend] = [SerialBackend(port) for port in args.port or []]
+    failing_dots = frozenset(
+        int(n) for n in args.sim_failing_dots.split(",") if n.strip()
+    )
+    backends += [
+        SimulatedBoard(
+            f"sim{i}", failing_dots=failing_dots if i % 2 else frozenset(), seed=i
+        )
+        for i in range(args.simulate)
+    ]
+    config = StationConfig(
+        criteria=PassCriteria(
+            max_failing_dots=args.max_failing_dots,
+            require_buttons=not args.skip_buttons,
+        ),
+        report_dir=args.reports,
+        duration_per_dot_ms=args.duration_per_dot_ms,
+    )
+    return await run_station(backends, config)
+
+
+def main() -> None:
+    """Test the boards on the given ports (and/or simulated boards)."""
+    parser = argparse.ArgumentParser(description="Test many boards at once.")
+    parser.add_argument("--port", action="append", help="Serial port. Repeatable.")
+    parser.add_argument("--simulate", type=int, default=0, help="Simulated boards.")
+    parser.add_argument(
+        "--sim-failing-dots",
+        default="",
+        help="Comma-separated dots that fail on every other simulated board.",
+    )
+    parser.add_argument("--reports", type=Path, default=Path("test_reports"))
+    parser.add_argument("--duration-per-dot-ms", type=int, default=10)
+    parser.add_argument("--max-failing-dots", type=int, default=0)
+    parser.add_argument("--skip-buttons", action="store_true")
+    parser.add_argument(
+        "--db", type=Path, help="Also add the results to this results database."
+    )
+    args = parser.parse_args()
+
+    if not args.port and not args.simulate:
+        parser.error("Give at least one --port, or --simulate.")
+
+    reports = asyncio.run(_main(args))
+    passed = sum(report.passed for report in reports)
+    logger.info(f"{passed}/{len(reports)} boards passed. Reports in {args.reports}.")
+
+    if args.db:
+        connection = results_db.connect(args.db)
+        added = 0
+        for report in reports:
+            path = args.reports / f"{report_stem(report)}.json"
+            source = str(path.resolve())
+            added += (
+                results_db.add_self_test(connection, asdict(report), source) is not None
+            )
+        logger.info(f"Added the results of {added} boards to {args.db}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""Vectorized analysis of recorded actuation traces, per dot and across cycles.
+
+Converts the trace files recorded on the board (see `trace_replay.py`) into a columnar
+dataset on disk: one row per sample, and one row per drive. The dataset is memory-
+mapped, and per-drive features are computed in chunks of whole drives, so datasets
+larger than RAM (e.g., long `cycle_dot()` endurance runs) work.
+
+Per-drive features:
+* Peak current.
+* Charge: integral of the current over the drive.
+* Plateau: lower quartile of the current (the running current, for healthy drives).
+* Stall time: start of the final run of samples above the knee threshold (the
+  firmware classifier's knee ratio times the plateau). NaN if it never stalled.
+
+Per dot and direction: mean and standard deviation of each feature across cycles,
+and drives whose features are outliers (modified z-score on median/MAD).
+
+Usage:
+    python -m host_tools.trace_analysis build traces/ dataset/
+    python -m host_tools.trace_analysis stats dataset/ --json stats.json
+"""
+
+import argparse
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from host_tools.column_store import ColumnTable
+from host_tools.firmware import actuation_classifier, trace_log
+from host_tools.trace_replay import DIRECTIONS, trace_files
+
+TRACE_RECORD_DTYPE = np.dtype(
+    [("kind", "u1"), ("arg", "u1"), ("value", "<i2"), ("time", "<i4")]
+)
+TRACE_HEADER_BYTES = 8
+
+SAMPLE_SCHEMA = {"drive": "<i4", "elapsed_us": "<i4", "raw": "<i2"}
+DRIVE_SCHEMA = {
+    "session": "<i4",
+    "start_ms": "<i4",
+    "board": "<i2",
+    "drive_ms": "<i4",
+    "drive_us": "<i4",  # -1 if the log ended mid-drive.
+    "dot": "<i2",  # -1 if not a single-dot drive.
+    "direction": "<i1",  # Index into `DIRECTIONS`. -1 if not a single-dot drive.
+    "label": "<i1",  # Board classifier label. -1 if none.
+    "knee_us": "<i4",  # Board classifier knee. -1 if none.
+    "sample_start": "<i8",
+    "sample_count": "<i4",
+    "dropped_samples": "<i4",
+}
+
+DEFAULT_CHUNK_SAMPLES = 4_000_000
+OUTLIER_Z = 3.5
+FEATURES = ("peak_ma", "charge_uc", "plateau_ma", "stall_ms")
+
+
+@dataclass(kw_only=True)
+class TraceDataset:
+    """A memory-mapped trace dataset."""
+
+    drives: dict[str, np.ndarray]
+    samples: dict[str, np.ndarray]
+
+    @property
+    def drive_count(self) -> int:
+        """Number of drives."""
+        return len(self.drives["session"])
+
+
+def _read_trace_records(path: Path) -> np.ndarray:
+    data = path.read_bytes()
+    if data[:4] != trace_log.TRACE_MAGIC:
+        msg = f"{path} is not a trace file."
+        raise ValueError(msg)
+    body = np.frombuffer(data, dtype=np.uint8, offset=TRACE_HEADER_BYTES)
+    complete = len(body) - len(body) % TRACE_RECORD_DTYPE.itemsize
+    return body[:complete].view(TRACE_RECORD_DTYPE)
+
+
+def build_dataset(paths: list[Path], directory: Path) -> TraceDataset:
+    """Convert trace files (oldest first) into a dataset in `directory`.
+
+    Samples are streamed to disk one file at a time. Drive rows are kept in memory
+    until the end, as their END/LABEL records can be in the next file.
+    """
+    samples = ColumnTable.create(directory / "samples", SAMPLE_SCHEMA)
+    drive_parts: list[dict[str, np.ndarray]] = []
+    drive_count = 0
+    session_count = 0
+    # Per-drive updates from END/LABEL/DROPPED records: (drive ids, values).
+    updates: dict[str, list[tuple[np.ndarray, np.ndarray]]] = {
+        name: [] for name in ("drive_us", "dot", "direction", "label", "knee_us")
+    }
+    updates["dropped_samples"] = []
+    sample_counts = np.zeros(0, dtype=np.int64)
+
+    for path in paths:
+        records = _read_trace_records(path)
+        kind = records["kind"]
+        value = records["value"]
+        time = records["time"]
+
+        # Records belong to the last DRIVE/SESSION at or before them, which may be in
+        # a previous file. -1 = before the first one.
+        drive_ids = drive_count - 1 + np.cumsum(kind == trace_log.KIND_DRIVE)
+        session_ids = session_count - 1 + np.cumsum(kind == trace_log.KIND_SESSION)
+        # A new session ends the previous drive.
+        last_session_record = np.maximum.accumulate(
+            np.where(kind == trace_log.KIND_SESSION, np.arange(len(kind)), -1)
+        )
+        last_drive_record = np.maximum.accumulate(
+            np.where(kind == trace_log.KIND_DRIVE, np.arange(len(kind)), -1)
+        )
+        in_drive = (drive_ids >= 0) & ~(last_session_record > last_drive_record)
+
+        is_drive = kind == trace_log.KIND_DRIVE
+        arg = records["arg"][is_drive].astype(np.int16)
+        drive_parts.append(
+            {
+                "session": session_ids[is_drive],
+                "start_ms": time[is_drive],
+                "board": np.where(arg == trace_log.ARG_ALL_BOARDS, -1, arg),
+                "drive_ms": value[is_drive],
+            }
+        )
+
+        is_sample = (kind == trace_log.KIND_SAMPLE) & in_drive
+        sample_drive_ids = drive_ids[is_sample]
+        samples.append(
+            {
+                "drive": sample_drive_ids,
+                "elapsed_us": time[is_sample],
+                "raw": value[is_sample],
+            }
+        )
+
+        end = (kind == trace_log.KIND_END) & in_drive
+        updates["drive_us"].append((drive_ids[end], time[end]))
+        dropped = (kind == trace_log.KIND_DROPPED) & in_drive
+        updates["dropped_samples"].append((drive_ids[dropped], value[dropped]))
+        label = (kind == trace_log.KIND_LABEL) & in_drive
+        packed = value[label].astype(np.int32) & 0xFFFF
+        label_ids = drive_ids[label]
+        updates["dot"].append((label_ids, records["arg"][label]))
+        updates["direction"].append((label_ids, packed >> 8 & 0x3))
+        updates["label"].append((label_ids, packed & 0xFF))
+        updates["knee_us"].append((label_ids, time[label]))
+
+        drive_count += int(np.count_nonzero(is_drive))
+        session_count += int(np.count_nonzero(kind == trace_log.KIND_SESSION))
+        file_counts = np.bincount(sample_drive_ids, minlength=drive_count)
+        file_counts[: len(sample_counts)] += sample_counts
+        sample_counts = file_counts
+
+    drive_columns: dict[str, np.ndarray] = {
+        name: np.concatenate([part[name] for part in drive_parts])
+        if drive_parts
+        else np.empty(0)
+        for name in ("session", "start_ms", "board", "drive_ms")
+    }
+    for name, default in (
+        ("drive_us", -1),
+        ("dot", -1),
+        ("direction", -1),
+        ("label", -1),
+        ("knee_us", -1),
+        ("dropped_samples", 0),
+    ):
+        column = np.full(drive_count, default, dtype=DRIVE_SCHEMA[name])
+        for ids, values in updates[name]:
+            column[ids] = values
+        drive_columns[name] = column
+
+    drive_columns["sample_count"] = sample_counts
+    drive_columns["sample_start"] = np.cumsum(sample_counts) - sample_counts
+
+    drives = ColumnTable.create(directory / "drives", DRIVE_SCHEMA)
+    drives.append(drive_columns)
+    return load_dataset(directory)
+
+
+def load_dataset(directory: Path) -> TraceDataset:
+    """Memory-map a dataset made by `build_dataset()`."""
+    return TraceDataset(
+        drives=ColumnTable.open(directory / "drives").columns(),
+        samples=ColumnTable.open(directory / "samples").columns(),
+    )
+
+
+def _drive_chunks(
+    sample_start: np.ndarray, sample_count: np.ndarray, chunk_samples: int
+) -> list[tuple[int, int]]:
+    """Split the drives into ranges of whole drives of about `chunk_samples`."""
+    sample_end = sample_start + sample_count
+    chunks: list[tuple[int, int]] = []
+    first = 0
+    while first < len(sample_start):
+        limit = sample_start[first] + chunk_samples
+        last = int(np.searchsorted(sample_end, limit, side="right"))
+        last = max(last, first + 1)
+        chunks.append((first, last))
+        first = last
+    return chunks
+
+
+def drive_features(
+    dataset: TraceDataset,
+    classifier: actuation_classifier.ActuationClassifier | None = None,
+    *,
+    chunk_samples: int = DEFAULT_CHUNK_SAMPLES,
+) -> dict[str, np.ndarray]:
+    """Compute the features of every drive. NaN for drives without samples."""
+    classifier = classifier or actuation_classifier.ActuationClassifier()
+    raw_to_ma = classifier.shunt_lsb_uv / classifier.shunt_milliohms
+    knee_ratio = classifier.knee_ratio_x16 / 16
+
+    sample_start = np.asarray(dataset.drives["sample_start"], dtype=np.int64)
+    sample_count = np.asarray(dataset.drives["sample_count"], dtype=np.int64)
+    features = {name: np.full(dataset.drive_count, np.nan) for name in FEATURES}
+
+    for first, last in _drive_chunks(sample_start, sample_count, chunk_samples):
+        counts = sample_count[first:last]
+        nonempty = np.flatnonzero(counts > 0)
+        if len(nonempty) == 0:
+            continue
+        s0 = int(sample_start[first])
+        s1 = int(sample_start[last - 1] + counts[-1])
+        raw = np.asarray(dataset.samples["raw"][s0:s1], dtype=np.int64)
+        elapsed_us = np.asarray(dataset.samples["elapsed_us"][s0:s1], dtype=np.int64)
+        local_drive = np.asarray(dataset.samples["drive"][s0:s1]) - first
+        starts = (sample_start[first:last] - s0)[nonempty]
+        ends = starts + counts[nonempty]
+        out = first + nonempty
+
+        features["peak_ma"][out] = np.maximum.reduceat(raw, starts) * raw_to_ma
+
+        # Each sample stands for the time since the previous one (or the drive start).
+        dt_us = np.empty_like(elapsed_us)
+        dt_us[1:] = np.diff(elapsed_us)
+        dt_us[starts] = elapsed_us[starts]
+        np.maximum(dt_us, 0, out=dt_us)
+        # mA * us / 1000 = uC.
+        charge = np.add.reduceat(raw * dt_us, starts)
+        features["charge_uc"][out] = charge * raw_to_ma / 1000
+
+        # Lower quartile, from the samples sorted by (drive, current).
+        sorted_raw = raw[np.lexsort((raw, local_drive))]
+        plateau_raw = sorted_raw[starts + counts[nonempty] // 4]
+        features["plateau_ma"][out] = plateau_raw * raw_to_ma
+
+        # Stall: the final run of samples above the knee threshold.
+        threshold = np.zeros(last - first)
+        threshold[nonempty] = np.maximum(plateau_raw * knee_ratio, classifier.open_raw)
+        below = raw < threshold[local_drive]
+        index = np.arange(len(raw))
+        last_below = np.maximum.reduceat(np.where(below, index, -1), starts)
+        stall_index = np.maximum(last_below + 1, starts)
+        stalled = stall_index < ends
+        stall_ms = np.full(len(nonempty), np.nan)
+        stall_ms[stalled] = elapsed_us[stall_index[stalled]] / 1000
+        features["stall_ms"][out] = stall_ms
+
+    return features
+
+
+def group_median(
+    values: np.ndarray, groups: np.ndarray, group_count: int
+) -> np.ndarray:
+    """Median of `values` per group (NaN values ignored, NaN for empty groups)."""
+    valid = ~np.isnan(values)
+    values = values[valid]
+    groups = groups[valid]
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(group_count, np.nan)
+    has = counts > 0
+    lower = sorted_values[starts[has] + (counts[has] - 1) // 2]
+    upper = sorted_values[starts[has] + counts[has] // 2]
+    medians[has] = (lower + upper) / 2
+    return medians
+
+
+def outlier_scores(
+    values: np.ndarray, groups: np.ndarray, group_count: int
+) -> np.ndarray:
+    """Compute the modified z-score of each value within its group.
+
+    Uses the median absolute deviation (MAD), or the mean absolute deviation where
+    the MAD is 0 (e.g., a clipped peak current). 0 where both are 0.
+    """
+    median = group_median(values, groups, group_count)[groups]
+    deviation = np.abs(values - median)
+    mad = group_median(deviation, groups, group_count)[groups]
+    valid = ~np.isnan(deviation)
+    counts = np.bincount(groups[valid], minlength=group_count)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_ad = (
+            np.bincount(groups[valid], deviation[valid], minlength=group_count) / counts
+        )[groups]
+        scores = np.where(
+            mad > 0,
+            0.6745 * (values - median) / mad,
+            (values - median) / (1.253314 * mean_ad),
+        )
+    scores[~((mad > 0) | (mean_ad > 0))] = 0
+    return np.nan_to_num(scores)
+
+
+def dot_stats(
+    dataset: TraceDataset, features: dict[str, np.ndarray]
+) -> tuple[dict[str, dict], np.ndarray]:
+    """Per dot/direction stats across cycles, and the indices of outlier drives."""
+    dots = np.asarray(dataset.drives["dot"], dtype=np.int64)
+    single = np.flatnonzero(dots >= 0)
+    slots = dots[single] * 2 + np.asarray(dataset.drives["direction"])[single]
+    slot_count = int(slots.max()) + 1 if len(slots) else 0
+
+    stats: dict[str, dict] = {}
+    outlier = np.zeros(len(single), dtype=bool)
+    summaries: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+    for name in FEATURES:
+        values = features[name][single]
+        valid = ~np.isnan(values)
+        count = np.bincount(slots[valid], minlength=slot_count)
+        total = np.bincount(slots[valid], values[valid], minlength=slot_count)
+        total_sq = np.bincount(slots[valid], values[valid] ** 2, minlength=slot_count)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = total / count
+            var = (total_sq - count * mean**2) / (count - 1)
+        summaries[name] = (count, mean, np.sqrt(np.maximum(var, 0)))
+        outlier |= np.abs(outlier_scores(values, slots, slot_count)) > OUTLIER_Z
+
+    drive_counts = np.bincount(slots, minlength=slot_count)
+    outlier_counts = np.bincount(slots[outlier], minlength=slot_count)
+    for slot in np.flatnonzero(drive_counts):
+        entry: dict = {
+            "drives": int(drive_counts[slot]),
+            "outliers": int(outlier_counts[slot]),
+        }
+        for name, (count, mean, std) in summaries.items():
+            entry[name] = {
+                "n": int(count[slot]),
+                "mean": round(float(mean[slot]), 3) if count[slot] else None,
+                "std": round(float(std[slot]), 3) if count[slot] > 1 else None,
+            }
+        stats[f"{slot // 2}_{DIRECTIONS[slot % 2]}"] = entry
+    return stats, single[outlier]
+
+
+def main() -> None:
+    """Build a dataset from trace files, or print per-dot stats of a dataset."""
+    parser = argparse.ArgumentParser(description="Analyze recorded traces.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build a dataset from traces.")
+    build_parser.add_argument("traces", type=Path, help="Downloaded traces directory.")
+    build_parser.add_argument("dataset", type=Path, help="Output dataset directory.")
+
+    stats_parser = subparsers.add_parser("stats", help="Per-dot stats of a dataset.")
+    stats_parser.add_argument("dataset", type=Path, help="Dataset directory.")
+    stats_parser.add_argument("--json", type=Path, help="Write the stats here.")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        dataset = build_dataset(trace_files(args.traces), args.dataset)
+        logger.info(
+            f"Built {args.dataset}: {dataset.drive_count} drives, "
+            f"{len(dataset.samples['raw'])} samples."
+        )
+        return
+
+    dataset = load_dataset(args.dataset)
+    features = drive_features(dataset)
+    stats, outliers = dot_stats(dataset, features)
+    for slot_name, entry in stats.items():
+        means = ", ".join(
+            f"{name}={entry[name]['mean']}" for name in FEATURES if entry[name]["n"]
+        )
+        logger.info(
+            f"Dot {slot_name}: {entry['drives']} drives, "
+            f"{entry['outliers']} outliers, {means}"
+        )
+
+    if args.json:
+        sessions = dataset.drives["session"]
+        start_ms = dataset.drives["start_ms"]
+        result = {
+            "dots": stats,
+            "outlier_drives": [
+                {
+                    "drive": int(i),
+                    "session": int(sessions[i]),
+                    "start_ms": int(start_ms[i]),
+                    **{name: round(float(features[name][i]), 3) for name in FEATURES},
+                }
+                for i in outliers
+            ],
+        }
+        args.json.write_text(json.dumps(result, indent=2))
+        logger.info(f"Wrote stats to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
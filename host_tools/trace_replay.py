@@ -0,0 +1,318 @@
+"""Download actuation traces recorded on the board, and replay them on the host.
+
+The firmware records sessions with `trace_start()` (see `firmware_upy/src/trace_log.py`
+for the binary format) into rotating files under `traces/` on the board's flash.
+
+Replay runs every recorded single-dot drive back through the firmware's own
+`ActuationClassifier` and `DriveTuner`, sample by sample, at full fidelity. Labels
+that differ from the ones recorded on the board are reported, so that field failures
+and changes to the classifier can be checked offline, without the board.
+
+Usage:
+    python -m host_tools.trace_replay download --dest traces/
+    python -m host_tools.trace_replay replay traces/ --params classifier_params.json
+"""
+
+import argparse
+import json
+import shutil
+import struct
+import subprocess
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from loguru import logger
+
+from host_tools.firmware import actuation_classifier, dot_map, drive_tuning, trace_log
+
+RECORD = struct.Struct("<BBhi")
+HEADER = struct.Struct("<4sHH")
+
+DIRECTIONS = ("up", "down")  # Indexed like `DOT_ADDITION_CONSTANTS`.
+SLOT_COUNT = dot_map.DOT_COUNT * 2  # Dot and direction, like the firmware's tuner.
+
+
+@dataclass(kw_only=True)
+class TracedDrive:
+    """One drive, as recorded on the board."""
+
+    session: int  # Index of the session within the downloaded logs.
+    start_ms: int  # Board `ticks_ms()` at the start.
+    board: int  # Board whose current was sampled. -1 = all boards (total).
+    drive_ms: int
+    # (us since the start, outputs latched then), in order.
+    outputs: list[tuple[int, frozenset[int]]] = field(default_factory=list)
+    samples_us: list[int] = field(default_factory=list)
+    samples_raw: list[int] = field(default_factory=list)
+    drive_us: int | None = None  # None if the log ends mid-drive.
+    dropped_samples: int = 0
+
+    # Single-dot drives only.
+    dot_num: int | None = None
+    direction: str | None = None
+    expect_travel: int = actuation_classifier.TRAVEL_UNKNOWN
+    label: int | None = None
+    knee_us: int = -1
+
+
+@dataclass(kw_only=True)
+class ReplayResult:
+    """A single-dot drive, with the label recorded on the board and on replay."""
+
+    drive: TracedDrive
+    replayed_label: int
+    replayed_knee_us: int
+    replayed_plateau_seen: bool
+
+    @property
+    def matches(self) -> bool:
+        """Whether replay reproduced the board's classification."""
+        return self.replayed_label == self.drive.label
+
+
+def trace_files(directory: Path) -> list[Path]:
+    """List the trace files in `directory`, oldest first (rotated, then active)."""
+    rotated = sorted(
+        directory.glob("trace.*.bin"),
+        key=lambda path: int(path.name.split(".")[1]),
+        reverse=True,
+    )
+    return [*rotated, *directory.glob("trace.bin")]
+
+
+def read_records(path: Path) -> list[tuple[int, int, int, int]]:
+    """Read the (kind, arg, value, time) records of one trace file."""
+    data = path.read_bytes()
+    magic, version, record_bytes = HEADER.unpack_from(data)
+    if (
+        magic != trace_log.TRACE_MAGIC
+        or version != trace_log.TRACE_VERSION
+        or record_bytes != RECORD.size
+    ):
+        msg = f"{path} is not a version {trace_log.TRACE_VERSION} trace file."
+        raise ValueError(msg)
+
+    body = data[HEADER.size :]
+    complete = len(body) - len(body) % RECORD.size  # Drop a torn final record.
+    return list(RECORD.iter_unpack(body[:complete]))
+
+
+def _add_record(drive: TracedDrive, kind: int, arg: int, value: int, time: int) -> None:
+    """Add a record that belongs to `drive` (anything after its DRIVE record)."""
+    if kind == trace_log.KIND_OUTPUTS:
+        bits = value & 0xFFFF
+        outputs = frozenset(arg * 16 + n for n in range(16) if bits >> n & 1)
+        if drive.outputs and drive.outputs[-1][0] == time:
+            drive.outputs[-1] = (time, drive.outputs[-1][1] | outputs)
+        else:
+            drive.outputs.append((time, outputs))
+    elif kind == trace_log.KIND_SAMPLE:
+        drive.samples_us.append(time)
+        drive.samples_raw.append(value)
+    elif kind == trace_log.KIND_DROPPED:
+        drive.dropped_samples = value
+    elif kind == trace_log.KIND_END:
+        drive.drive_us = time
+    elif kind == trace_log.KIND_LABEL:
+        drive.dot_num = arg
+        drive.label = value & 0xFF
+        drive.direction = DIRECTIONS[value >> 8 & 0x3]
+        drive.expect_travel = (value >> 10 & 0x3) - 1
+        drive.knee_us = time
+    else:
+        logger.warning(f"Unknown record kind {kind}.")
+
+
+def parse_drives(paths: list[Path]) -> list[TracedDrive]:
+    """Group the records of consecutive trace files into drives."""
+    drives: list[TracedDrive] = []
+    session = -1
+    drive: TracedDrive | None = None
+    for path in paths:
+        for kind, arg, value, time in read_records(path):
+            if kind == trace_log.KIND_SESSION:
+                session += 1
+                drive = None
+            elif kind == trace_log.KIND_DRIVE:
+                drive = TracedDrive(
+                    session=session,
+                    start_ms=time,
+                    board=-1 if arg == trace_log.ARG_ALL_BOARDS else arg,
+                    drive_ms=value,
+                )
+                drives.append(drive)
+            elif drive is not None:  # Else, rotation removed the start of the drive.
+                _add_record(drive, kind, arg, value, time)
+    return drives
+
+
+def replay_drive(
+    drive: TracedDrive, classifier: actuation_classifier.ActuationClassifier
+) -> int:
+    """Run the recorded samples of `drive` through `classifier`. Returns the label."""
+    classifier.start(drive.expect_travel)
+    for elapsed_us, raw in zip(drive.samples_us, drive.samples_raw, strict=True):
+        classifier.add_sample(raw, elapsed_us)
+    drive_us = drive.drive_us
+    if drive_us is None:
+        drive_us = drive.samples_us[-1] if drive.samples_us else 0
+    return classifier.finish(drive_us)
+
+
+def update_drive_tuner(
+    tuner: drive_tuning.DriveTuner, result: ReplayResult, slot: int
+) -> None:
+    """Learn from a replayed drive, like `update_drive_tuning()` in the firmware."""
+    if result.replayed_label == actuation_classifier.LABEL_OK:
+        tuner.record_completion(slot, (result.replayed_knee_us + 999) // 1000)
+    elif (
+        result.replayed_label == actuation_classifier.LABEL_INCOMPLETE
+        and result.replayed_plateau_seen
+        and result.drive.drive_ms >= tuner.drive_ms(slot)
+    ):
+        tuner.record_incomplete(slot)
+
+
+def replay(
+    drives: list[TracedDrive],
+    classifier: actuation_classifier.ActuationClassifier | None = None,
+) -> tuple[list[ReplayResult], drive_tuning.DriveTuner]:
+    """Replay every labelled single-dot drive, in order.
+
+    Returns the results, and the drive tuner state learned from the replayed labels.
+    """
+    classifier = classifier or actuation_classifier.ActuationClassifier()
+    tuner = drive_tuning.DriveTuner(SLOT_COUNT)
+    results: list[ReplayResult] = []
+    for drive in drives:
+        if drive.dot_num is None or drive.direction is None:
+            continue
+        label = replay_drive(drive, classifier)
+        result = ReplayResult(
+            drive=drive,
+            replayed_label=label,
+            replayed_knee_us=classifier.knee_us,
+            replayed_plateau_seen=classifier.plateau_seen,
+        )
+        results.append(result)
+        slot = drive.dot_num * 2 + DIRECTIONS.index(drive.direction)
+        update_drive_tuner(tuner, result, slot)
+    return results, tuner
+
+
+def download(dest: Path, port: str | None) -> None:
+    """Copy the `traces/` directory from the board with `mpremote`."""
+    mpremote = shutil.which("mpremote")
+    if mpremote is None:
+        msg = "mpremote not found. Install it with `pip install mpremote`."
+        raise FileNotFoundError(msg)
+    dest.mkdir(parents=True, exist_ok=True)
+    command = [mpremote]
+    if port:
+        command += ["connect", port]
+    command += ["cp", "-r", ":traces/", f"{dest}/"]
+    logger.info(f"Running: {' '.join(command)}")
+    subprocess.run(command, check=True)  # noqa: S603
+
+
+def summarize(
+    drives: list[TracedDrive],
+    results: list[ReplayResult],
+    tuner: drive_tuning.DriveTuner,
+) -> dict:
+    """Summary of a replay, as JSON-serializable data."""
+    label_names = actuation_classifier.LABEL_NAMES
+    recorded = Counter(
+        label_names[r.drive.label] for r in results if r.drive.label is not None
+    )
+    replayed = Counter(label_names[r.replayed_label] for r in results)
+    mismatches = [
+        {
+            "session": r.drive.session,
+            "start_ms": r.drive.start_ms,
+            "dot": r.drive.dot_num,
+            "direction": r.drive.direction,
+            "recorded": label_names[r.drive.label or 0],
+            "replayed": label_names[r.replayed_label],
+            "samples": len(r.drive.samples_raw),
+            "dropped_samples": r.drive.dropped_samples,
+        }
+        for r in results
+        if not r.matches
+    ]
+    learned = {
+        f"{slot // 2}_{DIRECTIONS[slot % 2]}": tuner.drive_ms(slot)
+        for slot in range(SLOT_COUNT)
+        if tuner.drive_ms(slot) != drive_tuning.DEFAULT_DRIVE_MS
+    }
+    return {
+        "sessions": len({drive.session for drive in drives}),
+        "drives": len(drives),
+        "labelled_drives": len(results),
+        "samples": sum(len(drive.samples_raw) for drive in drives),
+        "dropped_samples": sum(drive.dropped_samples for drive in drives),
+        "recorded_labels": dict(recorded),
+        "replayed_labels": dict(replayed),
+        "mismatches": mismatches,
+        "learned_drive_ms": learned,
+    }
+
+
+def main() -> None:
+    """Download traces from the board, or replay downloaded traces."""
+    parser = argparse.ArgumentParser(description="Download and replay board traces.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    download_parser = subparsers.add_parser("download", help="Copy traces from board.")
+    download_parser.add_argument(
+        "--dest", type=Path, default=Path("traces"), help="Local directory."
+    )
+    download_parser.add_argument("--port", help="Serial port (default: auto).")
+
+    replay_parser = subparsers.add_parser("replay", help="Replay downloaded traces.")
+    replay_parser.add_argument("directory", type=Path, help="Downloaded traces.")
+    replay_parser.add_argument("--json", type=Path, help="Write the summary here.")
+    replay_parser.add_argument(
+        "--params",
+        type=Path,
+        help="Classifier thresholds the board uses (`classifier_params.json`). "
+        "Default: the built-in ones.",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "download":
+        download(args.dest, args.port)
+        return
+
+    paths = trace_files(args.directory)
+    if not paths:
+        logger.error(f"No trace files in {args.directory}.")
+        return
+    classifier = actuation_classifier.ActuationClassifier()
+    if args.params and not classifier.load(str(args.params)):
+        logger.error(f"Invalid or missing classifier thresholds: {args.params}.")
+        raise SystemExit(1)
+    drives = parse_drives(paths)
+    results, tuner = replay(drives, classifier)
+    summary = summarize(drives, results, tuner)
+
+    logger.info(
+        f"{summary['drives']} drives ({summary['labelled_drives']} single-dot) in "
+        f"{summary['sessions']} sessions, {summary['samples']} samples "
+        f"({summary['dropped_samples']} dropped on the board)."
+    )
+    logger.info(f"Recorded labels: {summary['recorded_labels']}")
+    logger.info(f"Replayed labels: {summary['replayed_labels']}")
+    for mismatch in summary["mismatches"]:
+        logger.warning(f"Label mismatch: {mismatch}")
+    logger.info(f"Learned drive times (ms, non-default): {summary['learned_drive_ms']}")
+
+    if args.json:
+        args.json.write_text(json.dumps(summary, indent=2))
+        logger.info(f"Wrote summary to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,520 @@
+"""Zoomable viewer for long current traces: min/max pyramid, LTTB, and a local web UI.
+
+A pyramid is built once per trace, on disk:
+* Level 0: every sample (time in us, current in mA).
+* Level k: buckets of `FACTOR` level k-1 entries: first/last time, min and max (with
+  the times they occurred at), sum, and sample count.
+
+A view (time range, width in pixels) reads only the coarsest level with at least
+`MIN_BUCKETS_PER_PIXEL` buckets per pixel in the range (so fewer than `FACTOR` times
+that). So serving any zoom level takes the same time, whether the trace is a second
+or 6 hours long. Each view has:
+* The envelope: min/max current per pixel. Spikes are never lost.
+* A line: the lowest and highest points of each pixel, reduced to one point per
+  pixel with Largest-Triangle-Three-Buckets (LTTB), which keeps the trace's shape.
+
+Sources: trace datasets (`trace_analysis.py build`, samples during drives only) and
+serial ingest stores (`serial_ingest.py`, one session).
+
+Usage:
+    python -m host_tools.trace_viewer build pyramid/ --dataset dataset/ --session 0
+    python -m host_tools.trace_viewer build pyramid/ --store runs/ --session 2
+    python -m host_tools.trace_viewer serve pyramid/ --port 8765
+"""
+
+import argparse
+import json
+import math
+from collections.abc import Iterator
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from loguru import logger
+
+from host_tools.column_store import ChunkedTable, ColumnTable
+from host_tools.firmware import actuation_classifier
+from host_tools.serial_ingest import READING_SCHEMA
+from host_tools.trace_analysis import load_dataset
+
+FACTOR = 16
+MIN_BUCKETS_PER_PIXEL = 2
+TOP_LEVEL_MAX_ROWS = 1_024
+BUILD_CHUNK_ROWS = FACTOR * 65_536
+META_FILE_NAME = "pyramid.json"
+TICKS_PERIOD_MS = 1 << 30  # MicroPython `ticks_ms()` wraps around at this.
+LTTB_MIN_POINTS = 3  # The first, the last, and at least one picked.
+
+SAMPLE_SCHEMA = {"t_us": "<i8", "ma": "<f4"}
+BUCKET_SCHEMA = {
+    "t_first": "<i8",
+    "t_last": "<i8",
+    "t_min": "<i8",
+    "t_max": "<i8",
+    "min_ma": "<f4",
+    "max_ma": "<f4",
+    "sum_ma": "<f8",
+    "count": "<i8",
+}
+
+
+@dataclass(kw_only=True)
+class View:
+    """One rendered range of a trace. Times in us."""
+
+    t0: int
+    t1: int
+    level: int
+    envelope_t: np.ndarray  # Pixel start times.
+    envelope_min: np.ndarray  # NaN where there are no samples.
+    envelope_max: np.ndarray
+    line_t: np.ndarray
+    line_ma: np.ndarray
+
+
+def _level_name(level: int) -> str:
+    return f"level_{level:02d}"
+
+
+def _as_buckets(samples: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """View level 0 samples as buckets of one sample each."""
+    t = np.asarray(samples["t_us"], dtype=np.int64)
+    ma = np.asarray(samples["ma"], dtype=np.float32)
+    return {
+        "t_first": t,
+        "t_last": t,
+        "t_min": t,
+        "t_max": t,
+        "min_ma": ma,
+        "max_ma": ma,
+        "sum_ma": ma.astype(np.float64),
+        "count": np.ones(len(t), dtype=np.int64),
+    }
+
+
+def reduce_buckets(children: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """Merge every `FACTOR` consecutive buckets (the last group may be partial)."""
+    count = len(children["t_first"])
+    groups = -(-count // FACTOR)
+    starts = np.arange(0, count, FACTOR)
+    last = np.minimum(starts + FACTOR, count) - 1
+
+    # Pad to whole groups, with values that never win a min/max.
+    padding = groups * FACTOR - count
+    min_ma = np.pad(children["min_ma"], (0, padding), constant_values=np.inf)
+    max_ma = np.pad(children["max_ma"], (0, padding), constant_values=-np.inf)
+    min_index = np.argmin(min_ma.reshape(groups, FACTOR), axis=1) + starts
+    max_index = np.argmax(max_ma.reshape(groups, FACTOR), axis=1) + starts
+    return {
+        "t_first": children["t_first"][starts],
+        "t_last": children["t_last"][last],
+        "t_min": children["t_min"][min_index],
+        "t_max": children["t_max"][max_index],
+        "min_ma": children["min_ma"][min_index],
+        "max_ma": children["max_ma"][max_index],
+        "sum_ma": np.add.reduceat(children["sum_ma"], starts),
+        "count": np.add.reduceat(children["count"], starts),
+    }
+
+
+def lttb(t: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Pick the indices of `points` points that keep the shape of (t, y) (LTTB).
+
+    The first and last points are always kept. The others are picked one per bucket,
+    as the point forming the largest triangle with the previous pick and the mean of
+    the next bucket.
+    """
+    count = len(t)
+    if points >= count or points < LTTB_MIN_POINTS:
+        return np.arange(count)
+    # Buckets [edges[i], edges[i + 1]), between the first and last points.
+    edges = np.linspace(1, count - 1, points - 1).astype(np.int64)
+    x = t.astype(np.float64)
+    y = y.astype(np.float64)
+    sizes = np.diff(edges)
+    # The next bucket's mean, per bucket. The last bucket's next is the last point.
+    next_x = np.append(np.add.reduceat(x[1:-1], edges[:-1] - 1) / sizes, x[-1])[1:]
+    next_y = np.append(np.add.reduceat(y[1:-1], edges[:-1] - 1) / sizes, y[-1])[1:]
+
+    # Sequential (each pick depends on the previous one), so plain Python floats.
+    xs, ys = x.tolist(), y.tolist()
+    bounds = edges.tolist()
+    nxs, nys = next_x.tolist(), next_y.tolist()
+    picked = np.empty(points, dtype=np.int64)
+    picked[0] = prev = 0
+    picked[-1] = count - 1
+    for i in range(points - 2):
+        px, py, nx, ny = xs[prev], ys[prev], nxs[i], nys[i]
+        best_area = -1.0
+        for j in range(bounds[i], bounds[i + 1]):
+            area = abs((px - nx) * (ys[j] - py) - (px - xs[j]) * (ny - py))
+            if area > best_area:
+                best_area = area
+                prev = j
+        picked[i + 1] = prev
+    return picked
+
+
+class Pyramid:
+    """A min/max pyramid on disk, memory-mapped."""
+
+    def __init__(self, directory: Path) -> None:
+        """Open the pyramid in `directory`, made by `build_pyramid()`."""
+        self.directory = directory
+        self.meta = json.loads((directory / META_FILE_NAME).read_text())
+        self.samples = ColumnTable.open(directory / _level_name(0)).columns()
+        self.levels = [
+            ColumnTable.open(directory / _level_name(level)).columns()
+            for level in range(1, self.meta["levels"])
+        ]
+
+    @property
+    def t_range(self) -> tuple[int, int]:
+        """First and last sample times, in us."""
+        t = self.samples["t_us"]
+        return (int(t[0]), int(t[-1])) if len(t) else (0, 0)
+
+    def _extremes(
+        self, level: int, first: int, stop: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Time-sorted points: the samples, or the min and max points of buckets."""
+        if level == 0:
+            return (
+                np.asarray(self.samples["t_us"][first:stop]),
+                np.asarray(self.samples["ma"][first:stop]),
+            )
+        buckets = self.levels[level - 1]
+        times = np.concatenate(
+            (buckets["t_min"][first:stop], buckets["t_max"][first:stop])
+        )
+        values = np.concatenate(
+            (buckets["min_ma"][first:stop], buckets["max_ma"][first:stop])
+        )
+        order = np.argsort(times, kind="stable")
+        return times[order], values[order]
+
+    def view(self, t0: int, t1: int, width: int) -> View:
+        """Render [t0, t1) at `width` pixels, from the coarsest sufficient level."""
+        width = max(1, width)
+        t1 = max(t1, t0 + 1)
+        t = self.samples["t_us"]
+        first = int(np.searchsorted(t, t0, side="left"))
+        stop = int(np.searchsorted(t, t1, side="left"))
+        level = 0
+        while (
+            level < len(self.levels)
+            and (stop - first) / FACTOR ** (level + 1) >= MIN_BUCKETS_PER_PIXEL * width
+        ):
+            level += 1
+        scale = FACTOR**level
+        # Buckets partly outside the range are kept: their extremes may be inside.
+        times, values = self._extremes(level, first // scale, -(-stop // scale))
+        inside = (times >= t0) & (times < t1)
+        times, values = times[inside], values[inside]
+
+        envelope_min = np.full(width, np.nan)
+        envelope_max = np.full(width, np.nan)
+        envelope_t = t0 + np.arange(width) * (t1 - t0) // width
+        if len(times) == 0:
+            return View(
+                t0=t0,
+                t1=t1,
+                level=level,
+                envelope_t=envelope_t,
+                envelope_min=envelope_min,
+                envelope_max=envelope_max,
+                line_t=times,
+                line_ma=values,
+            )
+
+        # Per pixel, the lowest and the highest point.
+        pixels = (times - t0) * width // (t1 - t0)
+        order = np.lexsort((values, pixels))
+        sorted_pixels = pixels[order]
+        firsts = np.flatnonzero(np.diff(sorted_pixels, prepend=-1))
+        lasts = np.append(firsts[1:] - 1, len(order) - 1)
+        envelope_min[sorted_pixels[firsts]] = values[order[firsts]]
+        envelope_max[sorted_pixels[lasts]] = values[order[lasts]]
+
+        # Line: LTTB over those points (at most two per pixel), one per pixel.
+        extremes = np.unique(np.concatenate((order[firsts], order[lasts])))
+        picked = extremes[lttb(times[extremes], values[extremes], width)]
+
+        return View(
+            t0=t0,
+            t1=t1,
+            level=level,
+            envelope_t=envelope_t,
+            envelope_min=envelope_min,
+            envelope_max=envelope_max,
+            line_t=times[picked],
+            line_ma=values[picked],
+        )
+
+
+def build_pyramid(chunks: Iterator[dict[str, np.ndarray]], directory: Path) -> Pyramid:
+    """Build a pyramid in `directory` from chunks of samples (`t_us`, `ma`).
+
+    Sample times must not decrease. Everything is streamed, one chunk at a time.
+    """
+    level_0 = ColumnTable.create(directory / _level_name(0), SAMPLE_SCHEMA)
+    last_t = -math.inf
+    for chunk in chunks:
+        t = np.asarray(chunk["t_us"], dtype=np.int64)
+        if len(t) == 0:
+            continue
+        if t[0] < last_t or np.any(np.diff(t) < 0):
+            msg = "Sample times must not decrease (use one session per pyramid)."
+            raise ValueError(msg)
+        last_t = t[-1]
+        level_0.append(chunk)
+
+    below = level_0
+    levels = 1
+    while below.rows > TOP_LEVEL_MAX_ROWS:
+        table = ColumnTable.create(directory / _level_name(levels), BUCKET_SCHEMA)
+        columns = below.columns()
+        for start in range(0, below.rows, BUILD_CHUNK_ROWS):
+            part = {
+                name: np.asarray(column[start : start + BUILD_CHUNK_ROWS])
+                for name, column in columns.items()
+            }
+            table.append(reduce_buckets(_as_buckets(part) if levels == 1 else part))
+        below = table
+        levels += 1
+
+    (directory / META_FILE_NAME).write_text(
+        json.dumps({"levels": levels, "factor": FACTOR, "samples": level_0.rows})
+    )
+    return Pyramid(directory)
+
+
+def dataset_chunks(
+    dataset_dir: Path, session: int, chunk_drives: int = 10_000
+) -> Iterator[dict[str, np.ndarray]]:
+    """Yield the samples of one session of a trace dataset, in board time.
+
+    Drive starts are recorded in whole ms, so the first samples of a drive started
+    right after the previous one can come out before its last samples. Those are
+    clamped to the previous sample's time, so that times never decrease.
+    """
+    dataset = load_dataset(dataset_dir)
+    classifier = actuation_classifier.ActuationClassifier()
+    raw_to_ma = classifier.shunt_lsb_uv / classifier.shunt_milliohms
+    drives = np.flatnonzero(np.asarray(dataset.drives["session"]) == session)
+    start_ms = np.asarray(dataset.drives["start_ms"], dtype=np.int64)
+    # Unwrap `ticks_ms()` within the session.
+    wrapped = np.diff(start_ms[drives]) < -TICKS_PERIOD_MS // 2
+    start_ms[drives[1:]] += np.cumsum(wrapped) * TICKS_PERIOD_MS
+    start_us = start_ms * 1000
+    sample_start = np.asarray(dataset.drives["sample_start"])
+    sample_count = np.asarray(dataset.drives["sample_count"])
+    last_t_us = np.iinfo(np.int64).min
+    for first in range(0, len(drives), chunk_drives):
+        part = drives[first : first + chunk_drives]
+        s0 = int(sample_start[part[0]])
+        s1 = int(sample_start[part[-1]] + sample_count[part[-1]])
+        drive = np.asarray(dataset.samples["drive"][s0:s1])
+        elapsed_us = np.asarray(dataset.samples["elapsed_us"][s0:s1], dtype=np.int64)
+        raw = np.asarray(dataset.samples["raw"][s0:s1])
+        t_us = np.maximum.accumulate(
+            np.maximum(start_us[drive] + elapsed_us, last_t_us)
+        )
+        if len(t_us):
+            last_t_us = t_us[-1]
+        yield {"t_us": t_us, "ma": raw * raw_to_ma}
+
+
+def store_chunks(store_dir: Path, session: int) -> Iterator[dict[str, np.ndarray]]:
+    """Yield the readings of one session of a serial ingest store, in host time."""
+    store = ChunkedTable.open(store_dir)
+    if tuple(store.schema) != tuple(READING_SCHEMA):
+        msg = f"{store_dir} is not a serial ingest store."
+        raise ValueError(msg)
+    rows = store.query(session=session)
+    yield {"t_us": rows["timestamp_ms"] * 1000, "ma": rows["current_ma"]}
+
+
+def _json_values(values: np.ndarray) -> list[float | None]:
+    return [None if math.isnan(v) else round(v, 2) for v in values.tolist()]
+
+
+def view_json(pyramid: Pyramid, t0: int, t1: int, width: int) -> dict:
+    """Render a view as JSON-compatible data, in ms from the start of the trace."""
+    origin = pyramid.t_range[0]
+    view = pyramid.view(t0, t1, width)
+    return {
+        "t0_ms": (view.t0 - origin) / 1000,
+        "t1_ms": (view.t1 - origin) / 1000,
+        "level": view.level,
+        "envelope": {
+            "t_ms": ((view.envelope_t - origin) / 1000).tolist(),
+            "min": _json_values(view.envelope_min),
+            "max": _json_values(view.envelope_max),
+        },
+        "line": {
+            "t_ms": ((view.line_t - origin) / 1000).tolist(),
+            "ma": _json_values(view.line_ma),
+        },
+    }
+
+
+VIEWER_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Trace viewer</title>
+<style>
+body { font-family: sans-serif; margin: 8px; }
+canvas { width: 100%; height: 80vh; border: 1px solid #ccc; cursor: grab; }
+</style></head>
+<body>
+<div id="status">Loading...</div>
+<canvas id="plot"></canvas>
+<div>Wheel: zoom. Drag: pan. Double-click: reset.</div>
+<script>
+const canvas = document.getElementById("plot");
+const status = document.getElementById("status");
+const ctx = canvas.getContext("2d");
+let full = null, range = null, data = null, pending = null, drag = null;
+
+async function load() {
+  const width = canvas.clientWidth;
+  const url = range ? `/view?t0_ms=${range[0]}&t1_ms=${range[1]}&width=${width}`
+                    : `/view?width=${width}`;
+  data = await (await fetch(url)).json();
+  if (!full) full = [data.t0_ms, data.t1_ms];
+  range = [data.t0_ms, data.t1_ms];
+  draw();
+}
+
+function schedule() { clearTimeout(pending); pending = setTimeout(load, 50); }
+
+function draw() {
+  canvas.width = canvas.clientWidth;
+  canvas.height = canvas.clientHeight;
+  const w = canvas.width, h = canvas.height;
+  const values = data.envelope.max.concat(data.envelope.min)
+    .filter(v => v !== null);
+  const top = values.length ? Math.max(...values) * 1.05 : 1;
+  const bottom = values.length ? Math.min(0, Math.min(...values)) : 0;
+  const x = t => (t - range[0]) / (range[1] - range[0]) * w;
+  const y = v => h - (v - bottom) / (top - bottom) * h;
+  ctx.clearRect(0, 0, w, h);
+  ctx.fillStyle = "#9cf";
+  data.envelope.t_ms.forEach((t, i) => {
+    const lo = data.envelope.min[i], hi = data.envelope.max[i];
+    if (lo === null) return;
+    const pixel = Math.max(1, w / data.envelope.t_ms.length);
+    ctx.fillRect(x(t), y(hi), pixel, y(lo) - y(hi) + 1);
+  });
+  ctx.strokeStyle = "#036";
+  ctx.beginPath();
+  data.line.t_ms.forEach((t, i) => {
+    if (i === 0) ctx.moveTo(x(t), y(data.line.ma[i]));
+    else ctx.lineTo(x(t), y(data.line.ma[i]));
+  });
+  ctx.stroke();
+  status.textContent = `${range[0].toFixed(3)} - ${range[1].toFixed(3)} ms, ` +
+    `level ${data.level}, ${bottom.toFixed(0)} - ${top.toFixed(0)} mA`;
+}
+
+canvas.addEventListener("wheel", e => {
+  e.preventDefault();
+  const at = range[0] + e.offsetX / canvas.clientWidth * (range[1] - range[0]);
+  const zoom = e.deltaY > 0 ? 1.25 : 0.8;
+  range = [at - (at - range[0]) * zoom, at + (range[1] - at) * zoom];
+  draw();
+  schedule();
+});
+canvas.addEventListener("mousedown", e => { drag = [e.offsetX, range]; });
+window.addEventListener("mouseup", () => { drag = null; });
+canvas.addEventListener("mousemove", e => {
+  if (!drag) return;
+  const shift = (drag[0] - e.offsetX) / canvas.clientWidth * (drag[1][1] - drag[1][0]);
+  range = [drag[1][0] + shift, drag[1][1] + shift];
+  draw();
+  schedule();
+});
+canvas.addEventListener("dblclick", () => { range = full; schedule(); });
+window.addEventListener("resize", schedule);
+load();
+</script></body></html>
+"""
+
+
+def serve(pyramid: Pyramid, port: int) -> None:
+    """Serve the viewer at http://127.0.0.1:`port`/ until interrupted."""
+    origin, end = pyramid.t_range
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            if url.path == "/":
+                self._send("text/html", VIEWER_HTML.encode())
+            elif url.path == "/view":
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                t0 = origin + int(float(query.get("t0_ms", 0)) * 1000)
+                t1 = origin + int(
+                    float(query.get("t1_ms", (end + 1 - origin) / 1000)) * 1000
+                )
+                width = min(int(query.get("width", 1000)), 10_000)
+                data = view_json(pyramid, t0, max(t1, t0 + 1), width)
+                self._send("application/json", json.dumps(data).encode())
+            else:
+                self.send_error(404)
+
+        def _send(self, content_type: str, body: bytes) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    logger.info(f"Serving {pyramid.directory} at http://127.0.0.1:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopped.")
+    finally:
+        server.server_close()
+
+
+def main() -> None:
+    """Build a pyramid from a trace dataset or ingest store, or serve the viewer."""
+    parser = argparse.ArgumentParser(description="View long current traces.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build a pyramid.")
+    build_parser.add_argument("pyramid", type=Path, help="Output directory.")
+    source = build_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dataset", type=Path, help="trace_analysis.py dataset.")
+    source.add_argument("--store", type=Path, help="serial_ingest.py store.")
+    build_parser.add_argument("--session", type=int, default=0)
+
+    serve_parser = subparsers.add_parser("serve", help="Serve the web viewer.")
+    serve_parser.add_argument("pyramid", type=Path)
+    serve_parser.add_argument("--port", type=int, default=8765)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.dataset:
+            chunks = dataset_chunks(args.dataset, args.session)
+        else:
+            chunks = store_chunks(args.store, args.session)
+        pyramid = build_pyramid(chunks, args.pyramid)
+        logger.info(
+            f"Built {args.pyramid}: {pyramid.meta['samples']} samples, "
+            f"{pyramid.meta['levels']} levels."
+        )
+        return
+
+    serve(Pyramid(args.pyramid), args.port)
+
+
+if __name__ == "__main__":
+    main()